@@ -0,0 +1,210 @@
+# coding=utf-8
+# Qwen3-TTS Audio Artifact Store
+#
+# Opt-in (TTS_ARTIFACTS=true): generated WAVs are also written to a
+# content-addressed file store and responses carry a short audio_url
+# (/audio/<id>.wav). The id is a SHA-256 prefix of the file, so identical
+# audio is stored once and a URL never changes meaning: it is served with a
+# strong ETag, Range requests and long-lived cache headers, and consumers
+# (NewAvata, the web UI download button, recording pipelines) can fetch by
+# reference, resume partial downloads and use browser/CDN caches.
+#
+# The store is capped by total size (least recently used files go first) and
+# files not accessed for ARTIFACT_TTL seconds expire. The index is rebuilt
+# from the directory on startup, using file mtimes as access times.
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+import anyio
+
+import config
+
+ARTIFACT_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    """The Range header does not overlap the file (416)."""
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Single byte range of a Range header as (start, end) inclusive, or None to
+    send the whole file (no header, multiple ranges or a malformed or invalid
+    value); raises RangeNotSatisfiable only when the range starts past the end.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_s, _, end_s = header[6:].strip().partition("-")
+    try:
+        if not start_s:
+            # Suffix range: the last N bytes
+            length = int(end_s)
+            if length <= 0:
+                raise RangeNotSatisfiable()
+            return max(0, size - length), size - 1
+        start = int(start_s)
+        end = int(end_s) if end_s else None
+    except ValueError:
+        return None
+    if start < 0 or (end is not None and end < start):
+        # Invalid range-spec: ignored, the whole file is sent (RFC 9110 14.2)
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, size - 1 if end is None else min(end, size - 1)
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """If-None-Match against our (strong) ETag; weak comparison as RFC 9110 requires."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def iter_file(path: Path, start: int, length: int) -> Iterator[bytes]:
+    """Read length bytes from start in chunks (sync; StreamingResponse runs it in a thread)."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(READ_CHUNK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+class ArtifactStore:
+    """Content-addressed WAV files with a size cap (LRU) and access TTL."""
+
+    def __init__(self, root: str = None, max_bytes: int = None, ttl: float = None):
+        self.root = Path(root or config.ARTIFACT_DIR)
+        self.max_bytes = config.ARTIFACT_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self.ttl = config.ARTIFACT_TTL if ttl is None else ttl
+        # artifact id -> (size, last access), least recently used first
+        self._index: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.stored = 0
+        self.deduplicated = 0
+        self.evicted = 0
+        self.expired = 0
+        self.hits = 0
+        self._load()
+
+    def _path(self, artifact_id: str) -> Path:
+        return self.root / artifact_id[:2] / f"{artifact_id}.wav"
+
+    def _load(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for path in self.root.glob("??/*.wav"):
+            if ARTIFACT_ID_RE.match(path.stem):
+                stat = path.stat()
+                entries.append((stat.st_mtime, path.stem, stat.st_size))
+        for mtime, artifact_id, size in sorted(entries):
+            self._index[artifact_id] = (size, mtime)
+            self.total_bytes += size
+        self._evict()
+        print(f"[Artifacts] {len(self._index)} file(s), {self.total_bytes / 1e6:.1f} MB in {self.root}")
+
+    def _remove(self, artifact_id: str):
+        size, _ = self._index.pop(artifact_id)
+        self.total_bytes -= size
+        try:
+            self._path(artifact_id).unlink()
+        except OSError:
+            pass
+
+    def _evict(self):
+        """Drop expired files, then least recently used ones until under the size cap (lock held)."""
+        cutoff = time.time() - self.ttl
+        while self._index:
+            artifact_id, (_, accessed) = next(iter(self._index.items()))
+            if accessed < cutoff:
+                self.expired += 1
+            elif self.total_bytes > self.max_bytes and len(self._index) > 1:
+                self.evicted += 1
+            else:
+                break
+            self._remove(artifact_id)
+
+    def put_sync(self, data) -> str:
+        """Store bytes (or a memoryview) and return the artifact id; identical content is stored once."""
+        artifact_id = hashlib.sha256(data).hexdigest()[:32]
+        path = self._path(artifact_id)
+        with self._lock:
+            entry = self._index.get(artifact_id)
+            if entry is not None:
+                self._index[artifact_id] = (entry[0], time.time())
+                self._index.move_to_end(artifact_id)
+                self.deduplicated += 1
+                return artifact_id
+
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)  # Readers never see a partial file
+
+        with self._lock:
+            if artifact_id not in self._index:
+                self._index[artifact_id] = (len(data), time.time())
+                self.total_bytes += len(data)
+                self.stored += 1
+            self._evict()
+        return artifact_id
+
+    async def put(self, data) -> str:
+        """put_sync in a worker thread (hashing and the file write stay off the event loop)."""
+        return await anyio.to_thread.run_sync(self.put_sync, data)
+
+    def get(self, artifact_id: str) -> Optional[Tuple[Path, int]]:
+        """(path, size) of a stored artifact, or None if unknown or expired; counts as an access."""
+        if not ARTIFACT_ID_RE.match(artifact_id):
+            return None
+        with self._lock:
+            entry = self._index.get(artifact_id)
+            if entry is None:
+                return None
+            size, accessed = entry
+            if accessed < time.time() - self.ttl:
+                self.expired += 1
+                self._remove(artifact_id)
+                return None
+            self._index[artifact_id] = (size, time.time())
+            self._index.move_to_end(artifact_id)
+            self.hits += 1
+        return self._path(artifact_id), size
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "dir": str(self.root),
+                "files": len(self._index),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "stored": self.stored,
+                "deduplicated": self.deduplicated,
+                "hits": self.hits,
+                "evicted": self.evicted,
+                "expired": self.expired,
+            }
+
+
+def artifact_url(artifact_id: str) -> str:
+    return f"{config.ARTIFACT_BASE_URL}/audio/{artifact_id}.wav"
+
+
+# Global store (None unless TTS_ARTIFACTS=true)
+artifact_store = ArtifactStore() if config.ARTIFACTS_ENABLED else None
@@ -0,0 +1,189 @@
+# coding=utf-8
+# Qwen3-TTS Audio Response Writer
+#
+# Builds 16-bit PCM WAV payloads without intermediate copies:
+# the output buffer is preallocated from the known chunk lengths, float32
+# samples are converted to int16 directly into it, the WAV header is packed
+# once, and the result is served as memoryview slices.
+
+import base64
+import json
+import struct
+import tarfile
+import time
+from typing import Callable, Iterator, Optional, Sequence, Union
+
+import numpy as np
+
+WAV_HEADER_SIZE = 44
+PCM_SAMPLE_WIDTH = 2  # int16
+
+# Samples converted per step (bounds the float32 scratch buffer to 256 KiB)
+_CONVERT_BLOCK = 1 << 16
+
+# Size of memoryview slices handed to StreamingResponse
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def wav_header(num_samples: int, sample_rate: int, channels: int = 1) -> bytes:
+    """Pack a 44-byte RIFF/WAVE header for 16-bit PCM data."""
+    data_size = num_samples * channels * PCM_SAMPLE_WIDTH
+    block_align = channels * PCM_SAMPLE_WIDTH
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, 16,
+        b"data", data_size,
+    )
+
+
+def float_to_int16(src: np.ndarray, dst: np.ndarray) -> None:
+    """Convert float samples in [-1, 1] to int16, writing into dst (same length)."""
+    n = len(src)
+    scratch = np.empty(min(n, _CONVERT_BLOCK), dtype=np.float32)
+    for start in range(0, n, _CONVERT_BLOCK):
+        block = src[start:start + _CONVERT_BLOCK]
+        tmp = scratch[:len(block)]
+        # Same scaling as soundfile's float -> PCM_16 path (output is byte-identical)
+        np.multiply(block, 32768.0, out=tmp)
+        np.floor(tmp, out=tmp)
+        np.clip(tmp, -32768.0, 32767.0, out=tmp)
+        dst[start:start + len(block)] = tmp
+
+
+class WavWriter:
+    """
+    Preallocated mono 16-bit WAV buffer filled chunk by chunk.
+
+    The total length must be known up front (e.g. the lengths of all generated
+    sentence arrays), so concatenation happens by writing each chunk at its
+    offset instead of np.concatenate + re-encode.
+    """
+
+    def __init__(self, num_samples: int, sample_rate: int):
+        self.num_samples = num_samples
+        self.sample_rate = sample_rate
+        self._buffer = bytearray(WAV_HEADER_SIZE + num_samples * PCM_SAMPLE_WIDTH)
+        self._buffer[:WAV_HEADER_SIZE] = wav_header(num_samples, sample_rate)
+        self._pcm = np.frombuffer(self._buffer, dtype="<i2", offset=WAV_HEADER_SIZE)
+        self._offset = 0
+
+    def write(self, wav: np.ndarray) -> None:
+        """Append a float audio chunk."""
+        wav = np.asarray(wav).reshape(-1)
+        end = self._offset + len(wav)
+        if end > self.num_samples:
+            raise ValueError(f"WavWriter overflow: {end} > {self.num_samples} samples")
+        float_to_int16(wav, self._pcm[self._offset:end])
+        self._offset = end
+
+    @property
+    def view(self) -> memoryview:
+        """The complete WAV file (header + PCM) as a zero-copy view."""
+        if self._offset != self.num_samples:
+            raise ValueError(f"WavWriter incomplete: {self._offset}/{self.num_samples} samples written")
+        return memoryview(self._buffer)
+
+    @property
+    def pcm_view(self) -> memoryview:
+        """Raw little-endian int16 PCM written so far (no header)."""
+        return memoryview(self._buffer)[WAV_HEADER_SIZE:WAV_HEADER_SIZE + self._offset * PCM_SAMPLE_WIDTH]
+
+
+def encode_wav(wavs: Sequence[np.ndarray], sample_rate: int) -> memoryview:
+    """Encode one or more float chunks as a single (concatenated) WAV file."""
+    writer = WavWriter(sum(len(np.asarray(w).reshape(-1)) for w in wavs), sample_rate)
+    for wav in wavs:
+        writer.write(wav)
+    return writer.view
+
+
+def wav_to_base64(wav: np.ndarray, sample_rate: int) -> str:
+    """Encode a float chunk as base64 WAV (single base64 pass over the WAV buffer)."""
+    return base64.b64encode(encode_wav([wav], sample_rate)).decode("ascii")
+
+
+def iter_memoryview(view: memoryview, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[memoryview]:
+    """Yield zero-copy slices of a buffer for StreamingResponse."""
+    for start in range(0, len(view), chunk_size):
+        yield view[start:start + chunk_size]
+
+
+# ============== Batch (list-input) containers ==============
+
+MULTIPART_BOUNDARY = "qwen3tts-audio-boundary"
+_TAR_BLOCK = 512
+
+
+def build_manifest(wavs: Sequence[np.ndarray], sample_rate: int, generation_time: float) -> dict:
+    """Manifest describing each item of a batch response (sent before the audio parts)."""
+    return {
+        "sample_rate": sample_rate,
+        "audio_count": len(wavs),
+        "generation_time": round(generation_time, 3),
+        "items": [
+            {
+                "index": i,
+                "filename": f"audio_{i}.wav",
+                "samples": len(wav),
+                "duration": round(len(wav) / sample_rate, 3),
+            }
+            for i, wav in enumerate(wavs)
+        ],
+    }
+
+
+def iter_multipart(wavs: Sequence[np.ndarray], sample_rate: int, manifest: dict,
+                   boundary: str = MULTIPART_BOUNDARY,
+                   encode: Optional[Callable] = None) -> Iterator[Union[bytes, memoryview]]:
+    """
+    Stream a multipart/mixed body: a JSON manifest part, then one audio/wav part per item.
+
+    Each item is encoded (with encode(wavs, sample_rate), default encode_wav) only
+    when its part is about to be sent.
+    """
+    encode = encode or encode_wav
+    delimiter = f"--{boundary}\r\n".encode()
+    manifest_bytes = json.dumps(manifest, ensure_ascii=False).encode("utf-8")
+    yield delimiter
+    yield (
+        "Content-Type: application/json\r\n"
+        'Content-Disposition: attachment; name="manifest"; filename="manifest.json"\r\n'
+        f"Content-Length: {len(manifest_bytes)}\r\n\r\n"
+    ).encode()
+    yield manifest_bytes + b"\r\n"
+
+    for i, wav in enumerate(wavs):
+        wav_view = memoryview(encode([wav], sample_rate))
+        yield delimiter
+        yield (
+            "Content-Type: audio/wav\r\n"
+            f'Content-Disposition: attachment; name="audio_{i}"; filename="audio_{i}.wav"\r\n'
+            f"Content-Length: {len(wav_view)}\r\n"
+            f"X-Audio-Index: {i}\r\n\r\n"
+        ).encode()
+        yield from iter_memoryview(wav_view)
+        yield b"\r\n"
+
+    yield f"--{boundary}--\r\n".encode()
+
+
+def _tar_entry(name: str, data: Union[bytes, memoryview]) -> Iterator[Union[bytes, memoryview]]:
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    yield info.tobuf(format=tarfile.USTAR_FORMAT)
+    yield from iter_memoryview(memoryview(data))
+    padding = -len(data) % _TAR_BLOCK
+    if padding:
+        yield bytes(padding)
+
+
+def iter_tar(wavs: Sequence[np.ndarray], sample_rate: int, manifest: dict,
+             encode: Optional[Callable] = None) -> Iterator[Union[bytes, memoryview]]:
+    """Stream an uncompressed tar archive: manifest.json followed by audio_<i>.wav entries."""
+    encode = encode or encode_wav
+    yield from _tar_entry("manifest.json", json.dumps(manifest, ensure_ascii=False).encode("utf-8"))
+    for i, wav in enumerate(wavs):
+        yield from _tar_entry(f"audio_{i}.wav", encode([wav], sample_rate))
+    yield bytes(2 * _TAR_BLOCK)
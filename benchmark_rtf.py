@@ -0,0 +1,143 @@
+# coding=utf-8
+# Qwen3-TTS Real-time Factor Benchmark
+#
+# Measures generation speed of a base model on the configured device, e.g. to
+# size CPU overflow nodes for base_0.6b:
+#
+#   python benchmark_rtf.py --device cpu --quantize int8 --out cpu_int8.json
+#   python benchmark_rtf.py --device cpu --quantize none --out cpu_fp32.json
+#   python benchmark_rtf.py --device cuda:0 --out gpu.json
+#
+# RTF = generation time / audio duration (below 1.0 is faster than real time).
+# Every text is generated --runs times after --warmup untimed runs, with the
+# voice prompt computed once up front (as the server's prompt cache would).
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import time
+
+TEXTS = [
+    "안녕하세요.",
+    "오늘 면접에 참석해 주셔서 감사합니다.",
+    "지원하신 직무에 대해 조금 더 자세히 말씀해 주시겠어요? 이전 프로젝트에서 맡았던 역할도 함께 설명해 주세요.",
+    "좋습니다. 마지막으로 저희 회사에 지원하게 된 동기와 입사 후 이루고 싶은 목표를 말씀해 주세요. "
+    "준비가 되시면 천천히 시작하셔도 됩니다. 답변 시간은 충분히 드리겠습니다.",
+]
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    k = (len(values) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the real-time factor of voice-clone generation")
+    parser.add_argument("--device", default=None, help="Device for a single replica (default: TTS_DEVICE(S))")
+    parser.add_argument("--quantize", default=None, choices=["int8", "none"], help="CPU quantization (TTS_CPU_QUANTIZE)")
+    parser.add_argument("--threads", type=int, default=None, help="Intra-op threads for CPU (TTS_CPU_THREADS)")
+    parser.add_argument("--model-size", default="0.6b", choices=["0.6b", "1.7b"], help="Base model size")
+    parser.add_argument("--text", action="append", default=None, help="Text to synthesize (repeatable)")
+    parser.add_argument("--runs", type=int, default=3, help="Timed runs per text")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed runs before measuring")
+    parser.add_argument("--ref-audio", default="sample(1).mp3", help="Reference audio")
+    parser.add_argument("--ref-text", default="안녕하세요.", help="Transcript of the reference audio")
+    parser.add_argument("--language", default="Korean")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", "-o", default=None, help="Write results as JSON")
+    args = parser.parse_args()
+
+    # Settings are read when config is imported
+    if args.device:
+        os.environ["TTS_DEVICES"] = args.device
+    if args.quantize:
+        os.environ["TTS_CPU_QUANTIZE"] = args.quantize
+    if args.threads:
+        os.environ["TTS_CPU_THREADS"] = str(args.threads)
+
+    import torch
+
+    from models import model_manager
+    from schemas import GenerationParams
+
+    model_key = f"base_{args.model_size}"
+    replica = model_manager.replicas[0]
+    model_manager.load_model(model_key)
+    model = replica.models[model_key]
+    params = GenerationParams()
+    gen_kwargs = {
+        "max_new_tokens": params.max_new_tokens,
+        "temperature": params.temperature,
+        "top_k": params.top_k,
+        "top_p": params.top_p,
+        "repetition_penalty": params.repetition_penalty,
+        "do_sample": params.do_sample,
+    }
+    prompt = replica.call(replica.get_voice_clone_prompt, model_key, args.ref_audio, args.ref_text, True)
+
+    def generate(text: str, seed: int):
+        torch.manual_seed(seed)
+        t0 = time.perf_counter()
+        wavs, sr = model.generate_voice_clone(
+            text=text, language=args.language, voice_clone_prompt=prompt, non_streaming_mode=True, **gen_kwargs
+        )
+        replica.synchronize()
+        return time.perf_counter() - t0, len(wavs[0]) / sr
+
+    texts = args.text or TEXTS
+    print(f"[RTF] {model_key} on {replica.device} ({str(replica.dtype).replace('torch.', '')}, "
+          f"quantization={replica.quantization}, threads={replica.threads or '-'})")
+    for _ in range(args.warmup):
+        replica.call(generate, texts[0], args.seed)
+
+    results = []
+    for text in texts:
+        runs = [replica.call(generate, text, args.seed + i) for i in range(args.runs)]
+        rtfs = [elapsed / audio for elapsed, audio in runs if audio > 0]
+        result = {
+            "chars": len(text),
+            "audio_seconds": statistics.fmean(audio for _, audio in runs),
+            "generation_seconds": statistics.fmean(elapsed for elapsed, _ in runs),
+            "rtf_mean": statistics.fmean(rtfs) if rtfs else None,
+            "rtf_p50": percentile(rtfs, 0.5) if rtfs else None,
+            "rtf_max": max(rtfs) if rtfs else None,
+        }
+        results.append(result)
+        print(f"[RTF] {result['chars']:4d} chars: {result['audio_seconds']:6.2f}s audio in "
+              f"{result['generation_seconds']:6.2f}s, RTF {result['rtf_mean']:.3f} (max {result['rtf_max']:.3f})")
+
+    total_audio = sum(r["audio_seconds"] for r in results)
+    total_time = sum(r["generation_seconds"] for r in results)
+    overall = total_time / total_audio if total_audio else None
+    summary = {
+        "model": model_key,
+        "device": replica.device,
+        "dtype": str(replica.dtype).replace("torch.", ""),
+        "quantization": replica.quantization,
+        "threads": replica.threads,
+        "cpu": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "torch": torch.__version__,
+        "max_new_tokens": gen_kwargs["max_new_tokens"],
+        "runs": args.runs,
+        "rtf": overall,
+        "texts": results,
+    }
+    if overall:
+        # A replica generates one request at a time: 1 / RTF seconds of audio per second
+        print(f"[RTF] Overall RTF {overall:.3f} ({1 / overall:.2f} audio-seconds per second per replica)")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        print(f"[RTF] Results in {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+# coding=utf-8
+# Qwen3-TTS Offline Bulk Synthesis
+#
+# Pre-renders a JSONL manifest of prompts without going through HTTP:
+#
+#   python bulk_synthesize.py prompts.jsonl --output-dir bulk_output --model-size 0.6b
+#
+# Manifest lines: {"text": ..., "ref_audio": ... (or "voice"), "ref_text": ...,
+#                  "seed": 42, "name": "q0001", "language": "Korean"}
+# Only "text" and a voice are required; "name" defaults to the line number.
+#
+# Items are sorted by length and packed into batches of similar length (little
+# padding per batched generate_voice_clone call). Batches are built once from
+# the whole manifest, before skipping finished items, and each batch is seeded
+# from its members' seeds: a batch shares one sampling state, so seeded output
+# is only reproducible if resuming regenerates the same batches. Audio is
+# written to tar shards (shard_00000.tar, ...) and every finished shard is
+# appended to index.jsonl (name -> shard, byte offset, size, duration). Re-running the
+# same command skips everything already in the index, so an interrupted run
+# resumes where it stopped; a shard that was being written is discarded.
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import queue
+import sys
+import tarfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import torch
+
+import config
+from audio_io import encode_wav
+from models import model_manager
+from resample import resample
+from schemas import GenerationParams
+
+INDEX_NAME = "index.jsonl"
+CHECKPOINT_NAME = "checkpoint.json"
+
+
+def load_manifest(path: str, default_language: str) -> List[dict]:
+    items, names = [], set()
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            raw = json.loads(line)
+            ref_audio = raw.get("ref_audio", raw.get("voice"))
+            if not raw.get("text") or not ref_audio:
+                raise ValueError(f"{path}:{line_no}: 'text' and 'ref_audio' (or 'voice') are required")
+            name = str(raw.get("name") or f"{line_no:08d}")
+            if name in names:
+                raise ValueError(f"{path}:{line_no}: duplicate name '{name}'")
+            names.add(name)
+            items.append({
+                "name": name,
+                "text": raw["text"],
+                "ref_audio": ref_audio,
+                "ref_text": raw.get("ref_text", ""),
+                "language": raw.get("language", default_language),
+                "seed": raw.get("seed"),
+            })
+    return items
+
+
+def make_batches(items: List[dict], batch_size: int, max_batch_chars: int) -> List[List[dict]]:
+    """
+    Length-sorted batches: at most batch_size items and max_batch_chars padded characters each.
+
+    Ties are broken by name, so the same manifest always gives the same batches.
+    """
+    batches, batch = [], []
+    for item in sorted(items, key=lambda it: (len(it["text"]), it["name"])):
+        # Sorted ascending, so the padded size of the batch is (n + 1) * len(item)
+        if batch and (len(batch) >= batch_size or (len(batch) + 1) * len(item["text"]) > max_batch_chars):
+            batches.append(batch)
+            batch = []
+        batch.append(item)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def batch_seed(batch: List[dict]) -> Optional[int]:
+    """Seed of a batch derived from its members' seeds (None if no member has one)."""
+    seeds = [str(item["seed"]) for item in batch if item["seed"] is not None]
+    if not seeds:
+        return None
+    if len(batch) == 1:
+        return int(seeds[0])
+    digest = hashlib.sha256(",".join(seeds).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little") & (2 ** 63 - 1)
+
+
+class ShardWriter:
+    """Writes audio into tar shards and appends finished shards to the index."""
+
+    def __init__(self, output_dir: Path, shard_size: int, sample_rate: Optional[int], settings: dict):
+        self.output_dir = output_dir
+        self.shard_size = shard_size
+        self.sample_rate = sample_rate
+        self.settings = settings
+        self.index_path = output_dir / INDEX_NAME
+        self.checkpoint_path = output_dir / CHECKPOINT_NAME
+        self.done = set()
+        self.next_shard = 0
+        self._tar: Optional[tarfile.TarFile] = None
+        self._entries: List[dict] = []
+
+    def resume(self) -> None:
+        """Load progress from the index and drop shards that never made it into it."""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        if self.checkpoint_path.exists():
+            previous = json.loads(self.checkpoint_path.read_text(encoding="utf-8"))["settings"]
+            if previous != self.settings:
+                raise ValueError(
+                    f"Output directory was written with different settings: {previous} "
+                    f"(now {self.settings}); use a new --output-dir"
+                )
+
+        shards = set()
+        if self.index_path.exists():
+            with open(self.index_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.done.add(entry["name"])
+                        shards.add(entry["shard"])
+        for path in self.output_dir.glob("shard_*.tar*"):
+            if path.name not in shards:
+                print(f"[Bulk] Discarding incomplete shard {path.name}")
+                path.unlink()
+        self.next_shard = 1 + max((int(s[6:11]) for s in shards), default=-1)
+
+    def _shard_name(self) -> str:
+        return f"shard_{self.next_shard:05d}.tar"
+
+    def write(self, item: dict, wav, sr: int) -> None:
+        if self._tar is None:
+            self._tar = tarfile.open(self.output_dir / (self._shard_name() + ".partial"), "w",
+                                     format=tarfile.USTAR_FORMAT)
+        if self.sample_rate and self.sample_rate != sr:
+            wav = resample(wav, sr, self.sample_rate)
+            sr = self.sample_rate
+
+        data = encode_wav([wav], sr)
+        info = tarfile.TarInfo(f"{item['name']}.wav")
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self._tar.addfile(info, io.BytesIO(data))
+        # Data ends the archive so far, padded to whole 512-byte blocks
+        offset = self._tar.offset - -(-info.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        self._entries.append({
+            "name": item["name"],
+            "shard": self._shard_name(),
+            "member": info.name,
+            "offset": offset,
+            "size": info.size,
+            "sample_rate": sr,
+            "duration": round(len(wav) / sr, 3),
+            "text": item["text"],
+        })
+        if len(self._entries) >= self.shard_size:
+            self.close_shard()
+
+    def close_shard(self) -> None:
+        """Finish the open shard: rename it into place, then record it in the index and checkpoint."""
+        if self._tar is None:
+            return
+        self._tar.close()
+        self._tar = None
+        name = self._shard_name()
+        os.replace(self.output_dir / (name + ".partial"), self.output_dir / name)
+
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            for entry in self._entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(e["name"] for e in self._entries)
+        self._entries = []
+        self.next_shard += 1
+
+        tmp = self.checkpoint_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({
+            "settings": self.settings,
+            "completed_items": len(self.done),
+            "completed_shards": self.next_shard,
+            "updated_at": time.time(),
+        }, indent=2), encoding="utf-8")
+        os.replace(tmp, self.checkpoint_path)
+        print(f"[Bulk] Wrote {name} ({len(self.done)} items done)")
+
+
+def generate_batch(replica, model_key: str, batch: List[dict], gen_kwargs: dict):
+    """One batched generate_voice_clone call; voice prompts come from the replica's cache."""
+    model = replica.models[model_key]
+    prompts = [
+        replica.get_voice_clone_prompt(model_key, item["ref_audio"], item["ref_text"], True)[0]
+        for item in batch
+    ]
+    # Sampling state is shared by the whole batch, so the batch gets one seed from its members
+    seed = batch_seed(batch)
+    if seed is not None:
+        torch.manual_seed(seed)
+        if torch.cuda.is_available():
+            torch.cuda.manual_seed(seed)
+
+    wavs, sr = model.generate_voice_clone(
+        text=[item["text"] for item in batch],
+        language=[item["language"] for item in batch],
+        voice_clone_prompt=prompts,
+        non_streaming_mode=True,
+        **gen_kwargs,
+    )
+    replica.synchronize()
+    return wavs, sr
+
+
+def generate_with_fallback(replica, model_key: str, batch: List[dict], gen_kwargs: dict) -> Iterator[tuple]:
+    """Yield (item, wav, sr); a failed batch is split in half and retried (e.g. out of memory)."""
+    try:
+        wavs, sr = replica.call(generate_batch, replica, model_key, batch, gen_kwargs)
+    except Exception as e:
+        if len(batch) == 1:
+            print(f"[Bulk] Failed '{batch[0]['name']}': {e}")
+            return
+        print(f"[Bulk] Batch of {len(batch)} failed ({e}), retrying in halves")
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        half = len(batch) // 2
+        yield from generate_with_fallback(replica, model_key, batch[:half], gen_kwargs)
+        yield from generate_with_fallback(replica, model_key, batch[half:], gen_kwargs)
+        return
+    for item, wav in zip(batch, wavs):
+        yield item, wav, sr
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline bulk voice-clone synthesis from a JSONL manifest")
+    parser.add_argument("manifest", help="JSONL manifest (text, ref_audio/voice, ref_text, seed, name, language)")
+    parser.add_argument("--output-dir", "-o", default="bulk_output", help="Output directory (shards + index)")
+    parser.add_argument("--model-size", default="0.6b", choices=["0.6b", "1.7b"], help="Base model size")
+    parser.add_argument("--language", default="Auto", help="Default language for items without one")
+    parser.add_argument("--batch-size", type=int, default=16, help="Max items per generate call")
+    parser.add_argument("--max-batch-chars", type=int, default=2000,
+                        help="Max padded characters per generate call (long items get smaller batches)")
+    parser.add_argument("--shard-size", type=int, default=256, help="Items per output shard")
+    parser.add_argument("--sample-rate", type=int, default=None, help="Resample output (default: model rate)")
+    parser.add_argument("--max-new-tokens", type=int, default=config.DEFAULT_MAX_NEW_TOKENS)
+    args = parser.parse_args()
+
+    model_key = f"base_{args.model_size}"
+    items = load_manifest(args.manifest, args.language)
+
+    # Batch limits decide batch membership (and so seeded output); they must not change on resume
+    settings = {"model": model_key, "sample_rate": args.sample_rate, "max_new_tokens": args.max_new_tokens,
+                "batch_size": args.batch_size, "max_batch_chars": args.max_batch_chars}
+    writer = ShardWriter(Path(args.output_dir), args.shard_size, args.sample_rate, settings)
+    writer.resume()
+    pending = [item for item in items if item["name"] not in writer.done]
+    print(f"[Bulk] {len(items)} items in manifest, {len(items) - len(pending)} already done, {len(pending)} to go")
+    if not pending:
+        return
+
+    # Batch the whole manifest, then drop finished batches; a partly finished batch is
+    # regenerated whole (same members, same seed) and only its missing items are written
+    batches = [
+        batch for batch in make_batches(items, args.batch_size, args.max_batch_chars)
+        if any(item["name"] not in writer.done for item in batch)
+    ]
+    print(f"[Bulk] {len(batches)} batches on {len(model_manager.replicas)} replica(s): "
+          f"{', '.join(r.device for r in model_manager.replicas)}")
+
+    model_manager.load_model(model_key)
+    params = GenerationParams(max_new_tokens=args.max_new_tokens)
+    gen_kwargs = {
+        "max_new_tokens": params.max_new_tokens,
+        "temperature": params.temperature,
+        "top_k": params.top_k,
+        "top_p": params.top_p,
+        "repetition_penalty": params.repetition_penalty,
+        "do_sample": params.do_sample,
+    }
+
+    # One worker per replica; at most two batches in flight per replica so results stream to disk
+    free_replicas: "queue.Queue" = queue.Queue()
+    for replica in model_manager.replicas:
+        free_replicas.put(replica)
+
+    def run(batch):
+        replica = free_replicas.get()
+        try:
+            return list(generate_with_fallback(replica, model_key, batch, gen_kwargs))
+        finally:
+            free_replicas.put(replica)
+
+    t0 = time.time()
+    audio_seconds = 0.0
+    completed = 0
+    window = 2 * len(model_manager.replicas)
+    remaining = iter(batches)
+    in_flight = set()
+    try:
+        with ThreadPoolExecutor(max_workers=len(model_manager.replicas)) as executor:
+            while True:
+                while len(in_flight) < window:
+                    batch = next(remaining, None)
+                    if batch is None:
+                        break
+                    in_flight.add(executor.submit(run, batch))
+                if not in_flight:
+                    break
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    for item, wav, sr in future.result():
+                        if item["name"] in writer.done:
+                            continue
+                        writer.write(item, wav, sr)
+                        audio_seconds += len(wav) / sr
+                        completed += 1
+                elapsed = time.time() - t0
+                print(f"[Bulk] {completed}/{len(pending)} items, {audio_seconds:.0f}s audio in {elapsed:.0f}s "
+                      f"(RTF {elapsed / max(audio_seconds, 1e-6):.3f})")
+        writer.close_shard()
+    except KeyboardInterrupt:
+        # The open shard is not in the index yet; it is discarded and redone on resume
+        print("\n[Bulk] Interrupted; rerun the same command to resume")
+        sys.exit(130)
+
+    failed = len(pending) - completed
+    print(f"[Bulk] Done: {completed} items in {time.time() - t0:.1f}s"
+          + (f", {failed} failed (rerun to retry)" if failed else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# coding=utf-8
+# Qwen3-TTS Generation Cancellation
+#
+# A CancelToken carries a request's deadline (and can be cancelled
+# explicitly). It is bound to a ContextVar, which the worker-thread helpers copy
+# into the worker thread, and a forward pre-hook on the talker checks it
+# before every decode step - so a request that is past its deadline, or whose
+# client has disconnected, stops spending GPU time within one step instead of
+# finishing the generation.
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import config
+
+_current_token: "contextvars.ContextVar[Optional[CancelToken]]" = contextvars.ContextVar(
+    "qwen3tts_cancel_token", default=None
+)
+
+
+class GenerationCancelled(Exception):
+    """Generation was aborted before it finished."""
+
+
+class DeadlineExceeded(GenerationCancelled):
+    """The request cannot finish (or did not finish) before its deadline."""
+
+
+class CancelToken:
+    """Cancellation state of one request: an optional absolute deadline plus explicit cancel()."""
+
+    def __init__(self, deadline: Optional[float] = None):
+        self.deadline = deadline
+        self.reason: Optional[str] = None
+        self.steps = 0  # Decode steps run under this token
+
+    @property
+    def audio_seconds(self) -> float:
+        """Audio decoded so far (one codec token per step)."""
+        return self.steps / config.CODEC_FRAME_RATE
+
+    def cancel(self, reason: str = "cancelled"):
+        if self.reason is None:
+            self.reason = reason
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left until the deadline (None = no deadline)."""
+        return None if self.deadline is None else self.deadline - time.time()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None or (self.deadline is not None and time.time() >= self.deadline)
+
+    def check(self):
+        """Raise if the request was cancelled or is past its deadline."""
+        if self.reason is not None:
+            raise GenerationCancelled(self.reason)
+        if self.deadline is not None and time.time() >= self.deadline:
+            raise DeadlineExceeded("Deadline exceeded during generation")
+
+
+def deadline_from_ms(deadline_ms: Optional[int], start: float = None) -> Optional[float]:
+    """Absolute deadline for a relative budget in milliseconds (None = no deadline)."""
+    if deadline_ms is None:
+        return None
+    return (start or time.time()) + deadline_ms / 1000.0
+
+
+@contextmanager
+def cancel_scope(token: Optional[CancelToken]):
+    """Bind token to the current context (and worker threads started from it via anyio)."""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+def current_token() -> Optional[CancelToken]:
+    return _current_token.get()
+
+
+def _decode_step_hook(module, args):
+    token = _current_token.get()
+    if token is not None:
+        token.check()
+        token.steps += 1
+
+
+def install_decode_hook(model) -> None:
+    """Check the current CancelToken before every talker forward (one call per decode step)."""
+    talker = getattr(getattr(model, "model", None), "talker", None)
+    if talker is None:
+        print("[Cancellation] Model has no talker module; decode-step cancellation disabled")
+        return
+    talker.register_forward_pre_hook(_decode_step_hook)
+
+
+class CancellationStats:
+    """Counters for aborted generations and the audio they no longer had to produce."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.cancelled: Dict[str, int] = {}
+        self.audio_seconds_saved = 0.0
+
+    def record(self, reason: str, expected_audio: Optional[float], token: CancelToken):
+        """expected_audio: estimated length of the full output (None = unknown)."""
+        saved = max(0.0, expected_audio - token.audio_seconds) if expected_audio else 0.0
+        with self._lock:
+            self.cancelled[reason] = self.cancelled.get(reason, 0) + 1
+            self.audio_seconds_saved += saved
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "cancelled": dict(self.cancelled),
+                "audio_seconds_saved": round(self.audio_seconds_saved, 1),
+            }
+
+
+# Global cancellation counters
+cancel_stats = CancellationStats()
@@ -9,12 +9,22 @@ HOST = os.getenv("TTS_HOST", "0.0.0.0")
 PORT = int(os.getenv("TTS_PORT", "8000"))
 
 # Model settings
-DEVICE = os.getenv("TTS_DEVICE", "cuda:0")
+DEVICE = os.getenv("TTS_DEVICE", "cuda:0")  # cuda:N, cpu, or auto (cuda:0 if a GPU is visible, else cpu)
+# Devices that each host a full model replica, e.g. "cuda:0,cuda:1,cuda:2,cuda:3"
+# Requests are routed to the replica with the least outstanding work (default: DEVICE only)
+DEVICES = [d.strip() for d in os.getenv("TTS_DEVICES", DEVICE).split(",") if d.strip()]
 DTYPE = os.getenv("TTS_DTYPE", "bfloat16")  # bfloat16, float16, float32
 USE_FLASH_ATTENTION = os.getenv("TTS_USE_FLASH_ATTENTION", "false").lower() == "true"
 USE_TORCH_COMPILE = os.getenv("TTS_USE_TORCH_COMPILE", "false").lower() == "true"  # Disabled - causes CUDA errors
 USE_WARMUP = os.getenv("TTS_USE_WARMUP", "false").lower() == "true"  # Disabled by default due to torch.compile compatibility
 
+# CPU replicas (TTS_DEVICE=cpu, e.g. overflow nodes serving base_0.6b)
+# int8 dynamic quantization needs float32 weights; CPU_THREADS=0 splits the usable
+# cores (minus one for the event loop and audio post-processing) across CPU replicas
+CPU_DTYPE = os.getenv("TTS_CPU_DTYPE", "float32")
+CPU_QUANTIZE = os.getenv("TTS_CPU_QUANTIZE", "int8").lower()  # int8 (nn.Linear layers) or none
+CPU_THREADS = int(os.getenv("TTS_CPU_THREADS", "0"))  # Intra-op threads per CPU replica
+
 # Model paths - Auto-detect environment (Windows/Linux)
 # Set environment variables to override, or use Hugging Face auto-download
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -78,6 +88,70 @@ DEFAULT_TOP_K = 50
 DEFAULT_TOP_P = 1.0
 DEFAULT_REPETITION_PENALTY = 1.05
 
+# Voice clone prompts (speaker embedding / ref codes) cached per replica and voice
+VOICE_PROMPT_CACHE_SIZE = int(os.getenv("TTS_VOICE_PROMPT_CACHE_SIZE", "32"))
+
+# Inference scheduling (see scheduler.py)
+REPLICA_SLOTS = int(os.getenv("TTS_REPLICA_SLOTS", "1"))  # Concurrent generations per replica
+SCHEDULER_AGING = float(os.getenv("TTS_SCHEDULER_AGING", "10"))  # Seconds of waiting per class promotion
+SCHEDULER_LARGE_MODEL_COST = float(os.getenv("TTS_LARGE_MODEL_COST", "2.5"))  # 1.7B cost per char vs 0.6B
+SCHEDULER_EWMA_ALPHA = float(os.getenv("TTS_SCHEDULER_EWMA_ALPHA", "0.2"))  # Throughput estimate smoothing
+
+# Request deadlines (deadline_ms / X-Deadline-Ms)
+MODEL_SAMPLE_RATE = 24000  # Output rate of the 12Hz codec decoder
+CODEC_FRAME_RATE = 12.5  # Codec tokens per second of audio (24 kHz / 1920)
+DEADLINE_SAFETY = float(os.getenv("TTS_DEADLINE_SAFETY", "0.9"))  # Fraction of the remaining budget spent decoding
+DEADLINE_MIN_TOKENS = int(os.getenv("TTS_DEADLINE_MIN_TOKENS", "12"))  # Below this (~1s audio) the request is rejected
+
+# Edge-silence trimming and pause normalization of generated audio (see silence.py)
+# Per request: trim_silence / pause_ms; also applies to the local lip-sync pipeline
+TRIM_SILENCE = os.getenv("TTS_TRIM_SILENCE", "false").lower() == "true"
+TRIM_THRESHOLD_DB = float(os.getenv("TTS_TRIM_THRESHOLD_DB", "40"))  # Frames this far below the loudest one are silence
+TRIM_FRAME_MS = float(os.getenv("TTS_TRIM_FRAME_MS", "10"))
+TRIM_KEEP_MS = float(os.getenv("TTS_TRIM_KEEP_MS", "30"))  # Silence kept at each cut
+SENTENCE_PAUSE_MS = float(os.getenv("TTS_SENTENCE_PAUSE_MS", "200"))  # Pause inserted between trimmed chunks
+
+# Client disconnects abort generation (see cancellation.py)
+DISCONNECT_POLL_INTERVAL = float(os.getenv("TTS_DISCONNECT_POLL_INTERVAL", "0.5"))  # Seconds between checks (non-streaming)
+
+# Per-tenant quotas and fair sharing (see tenants.py)
+TENANT_HEADER = os.getenv("TTS_TENANT_HEADER", "X-API-Key")  # Header identifying the caller (values not in TTS_TENANTS are the default tenant)
+DEFAULT_TENANT = "default"  # Requests without a configured tenant header value
+TENANTS = os.getenv("TTS_TENANTS", "")  # "id=weight[:rate[:burst]],..." e.g. "frontend=4,batch=1:2:600"
+TENANT_RATE = float(os.getenv("TTS_TENANT_RATE", "0"))  # Audio-seconds refilled per second per tenant (0 = unlimited)
+TENANT_BURST = float(os.getenv("TTS_TENANT_BURST", "600"))  # Bucket capacity in audio-seconds
+TENANT_CHARS_PER_SECOND = float(os.getenv("TTS_TENANT_CHARS_PER_SECOND", "12"))  # Estimate before throughput is observed
+
+# Admin endpoints (/admin/*) are disabled unless a token is set; send it as X-Admin-Token
+ADMIN_TOKEN = os.getenv("TTS_ADMIN_TOKEN", "")
+
+# On-demand profiling (see profiling.py)
+PROFILE_DIR = os.getenv("TTS_PROFILE_DIR", os.path.join(BASE_DIR, "profiles"))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("TTS_PROFILE_SAMPLE_INTERVAL", "0.005"))  # Python stack sampling period
+PROFILE_MAX_SECONDS = float(os.getenv("TTS_PROFILE_MAX_SECONDS", "300"))  # Upper bound on a session's duration
+PROFILE_KEEP_SESSIONS = int(os.getenv("TTS_PROFILE_KEEP_SESSIONS", "10"))  # Sessions listed by GET /admin/profile
+
+# Traffic capture for replay_traffic.py (see traffic.py); empty path = off
+TRAFFIC_RECORD_PATH = os.getenv("TTS_TRAFFIC_RECORD", "")
+TRAFFIC_RECORD_TEXT = os.getenv("TTS_TRAFFIC_RECORD_TEXT", "false").lower() == "true"  # Default: shapes only
+
+# gRPC API next to the HTTP server (see grpc_server.py, tts.proto); pip install -r requirements-grpc.txt
+# Off by default: it listens on HOST without authentication, outside the HTTP middleware
+GRPC_ENABLED = os.getenv("TTS_GRPC", "false").lower() == "true"
+GRPC_PORT = int(os.getenv("TTS_GRPC_PORT", "50051"))
+GRPC_MAX_MESSAGE_BYTES = int(os.getenv("TTS_GRPC_MAX_MESSAGE_BYTES", str(16 * 1024 * 1024)))
+
+# Identical concurrent requests share one generation (see singleflight.py)
+DEDUPE_ENABLED = os.getenv("TTS_DEDUPE", "true").lower() == "true"
+
+# Text chunking for long-form synthesis (see text_chunker.py)
+# Budget unit: "chars" or "tokens" (estimated text tokens)
+CHUNK_BUDGET_UNIT = os.getenv("TTS_CHUNK_BUDGET_UNIT", "chars")
+CHUNK_TARGET_SIZE = int(os.getenv("TTS_CHUNK_TARGET_SIZE", "150"))
+CHUNK_MAX_SIZE = int(os.getenv("TTS_CHUNK_MAX_SIZE", "250"))
+CHUNK_MIN_SIZE = int(os.getenv("TTS_CHUNK_MIN_SIZE", "20"))
+CHUNK_FIRST_SIZE = int(os.getenv("TTS_CHUNK_FIRST_SIZE", "50"))  # Short first chunk -> faster first audio
+
 # Available speakers for CustomVoice model
 AVAILABLE_SPEAKERS = [
     "Vivian",      # Chinese female
@@ -91,6 +165,11 @@ AVAILABLE_SPEAKERS = [
     "Sohee",       # Korean female
 ]
 
+# Audio post-processing pool (WAV encoding, base64, ...) - see postprocess.py
+# "thread": thread pool, "process": process pool with shared-memory array handoff
+POSTPROCESS_MODE = os.getenv("TTS_POSTPROCESS_MODE", "thread")
+POSTPROCESS_WORKERS = int(os.getenv("TTS_POSTPROCESS_WORKERS", "2"))
+
 # Supported languages
 SUPPORTED_LANGUAGES = [
     "Auto",
@@ -106,14 +185,61 @@ SUPPORTED_LANGUAGES = [
     "Italian",
 ]
 
+# Content-addressed audio store (TTS_ARTIFACTS=true): responses carry audio_url (/audio/<id>.wav)
+# Capped by size (least recently used first); files not accessed for ARTIFACT_TTL seconds expire
+ARTIFACTS_ENABLED = os.getenv("TTS_ARTIFACTS", "false").lower() == "true"
+ARTIFACT_DIR = os.getenv("TTS_ARTIFACT_DIR", os.path.join(BASE_DIR, "artifacts"))
+ARTIFACT_MAX_MB = int(os.getenv("TTS_ARTIFACT_MAX_MB", "2048"))
+ARTIFACT_TTL = float(os.getenv("TTS_ARTIFACT_TTL", "86400"))
+ARTIFACT_BASE_URL = os.getenv("TTS_ARTIFACT_BASE_URL", "").rstrip("/")  # e.g. a CDN in front of /audio; default relative
+
 # Video generation settings (optional)
 ENABLE_VIDEO = os.getenv("ENABLE_VIDEO", "false").lower() == "true"
 VIDEO_AVATAR_DIR = os.getenv("VIDEO_AVATAR_DIR", os.path.join(BASE_DIR, "avatars"))
 VIDEO_OUTPUT_DIR = os.getenv("VIDEO_OUTPUT_DIR", os.path.join(BASE_DIR, "output"))
 NEWAVATA_PATH = os.getenv("NEWAVATA_PATH", os.path.join(BASE_DIR, "NewAvata"))
 
+# Local TTS -> lip-sync pipeline (/video/generate with tts_engine=local)
+# Default voice for video audio, and the sample rate sent to NewAvata
+VIDEO_REF_AUDIO = os.getenv("VIDEO_REF_AUDIO", os.path.join(BASE_DIR, "sample(1).mp3"))
+VIDEO_REF_TEXT = os.getenv("VIDEO_REF_TEXT", "")
+VIDEO_AUDIO_SAMPLE_RATE = int(os.getenv("VIDEO_AUDIO_SAMPLE_RATE", "16000"))
+
+# Segmented HLS output (playlist grows as lip-sync segments finish)
+VIDEO_HLS_DIR = os.getenv("VIDEO_HLS_DIR", os.path.join(VIDEO_OUTPUT_DIR, "hls"))
+VIDEO_HLS_TARGET_DURATION = int(os.getenv("VIDEO_HLS_TARGET_DURATION", "20"))  # Seconds; longer clips are split
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+FFPROBE_BINARY = os.getenv("FFPROBE_BINARY", "ffprobe")
+
+# Asynchronous video jobs (POST /video/jobs)
+VIDEO_JOB_MAX = int(os.getenv("VIDEO_JOB_MAX", "500"))  # Jobs kept in memory
+VIDEO_JOB_TTL = float(os.getenv("VIDEO_JOB_TTL", "3600"))  # Seconds a finished job stays queryable
+
 # NewAvata API settings (for external lip-sync service)
 # When USE_NEWAVATA_API=true, video_generator calls NewAvata's REST API
 # instead of running MuseTalk directly (recommended for A100 deployment)
 USE_NEWAVATA_API = os.getenv("USE_NEWAVATA_API", "false").lower() == "true"
 NEWAVATA_API_URL = os.getenv("NEWAVATA_API_URL", "http://localhost:8001")
+
+# NewAvata HTTP client (shared keep-alive connection pool)
+NEWAVATA_MAX_CONNECTIONS = int(os.getenv("NEWAVATA_MAX_CONNECTIONS", "16"))
+NEWAVATA_MAX_CONCURRENCY = int(os.getenv("NEWAVATA_MAX_CONCURRENCY", "4"))  # In-flight renders/downloads (metadata GETs are not counted)
+NEWAVATA_GET_RETRIES = int(os.getenv("NEWAVATA_GET_RETRIES", "3"))  # Retries for idempotent GETs
+NEWAVATA_RETRY_BACKOFF = float(os.getenv("NEWAVATA_RETRY_BACKOFF", "0.5"))  # Seconds, doubled per retry
+NEWAVATA_CONNECT_TIMEOUT = float(os.getenv("NEWAVATA_CONNECT_TIMEOUT", "5"))
+NEWAVATA_METADATA_TIMEOUT = float(os.getenv("NEWAVATA_METADATA_TIMEOUT", "10"))  # /api/avatars, /api/system_status, ...
+NEWAVATA_GENERATE_TIMEOUT = float(os.getenv("NEWAVATA_GENERATE_TIMEOUT", "30"))  # /api/generate (queue)
+NEWAVATA_RECORD_TIMEOUT = float(os.getenv("NEWAVATA_RECORD_TIMEOUT", "300"))  # /api/record (full render)
+
+# Same-host audio handoff: lip-sync audio goes through a /dev/shm ring and NewAvata
+# gets a PCM handle instead of base64 WAV (NewAvata must support audio_format=pcm_s16le
+# with audio_shm; only used when NEWAVATA_API_URL points at this host) - see shm_audio.py
+NEWAVATA_SHM_AUDIO = os.getenv("NEWAVATA_SHM_AUDIO", "false").lower() == "true"
+NEWAVATA_SHM_PATH = os.getenv("NEWAVATA_SHM_PATH", "")  # Default /dev/shm/qwen3tts-audio-<pid>
+NEWAVATA_SHM_SIZE_MB = int(os.getenv("NEWAVATA_SHM_SIZE_MB", "64"))
+
+# NewAvata metadata cache (refresh-ahead, stale-while-revalidate)
+NEWAVATA_CATALOG_TTL = float(os.getenv("NEWAVATA_CATALOG_TTL", "300"))  # /api/avatars, /api/tts_engines
+NEWAVATA_STATUS_TTL = float(os.getenv("NEWAVATA_STATUS_TTL", "5"))  # /api/system_status
+NEWAVATA_REFRESH_AHEAD = float(os.getenv("NEWAVATA_REFRESH_AHEAD", "0.8"))  # Refresh after this fraction of the TTL
+NEWAVATA_MAX_STALE = float(os.getenv("NEWAVATA_MAX_STALE", "3600"))  # Serve stale data at most this long past the TTL
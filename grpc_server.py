@@ -0,0 +1,155 @@
+# coding=utf-8
+# Qwen3-TTS gRPC Service
+#
+# Implements tts.proto on a grpc.aio server that runs in the FastAPI event
+# loop (started from the app's lifespan), so it shares the model manager,
+# scheduler, single-flight dedupe, voice prompt caches and tenant quotas with
+# the HTTP endpoints. Audio is sent as raw 16-bit PCM bytes per text chunk.
+#
+# The proto is loaded at runtime (grpc.protos_and_services, needs grpcio-tools);
+# without grpcio the server simply runs HTTP only.
+
+import sys
+import time
+from typing import Callable, Optional
+
+import grpc
+from pydantic import ValidationError
+
+import config
+from cancellation import DeadlineExceeded, GenerationCancelled, deadline_from_ms
+from models import model_manager
+from scheduler import estimate_cost
+from schemas import GenerationParams, VoiceCloneRequest
+from tenants import QuotaExceeded, estimate_audio_seconds, tenant_registry
+from text_chunker import chunk_text
+from traffic import traffic_recorder
+
+# protos_and_services resolves the file against sys.path
+if config.BASE_DIR not in sys.path:
+    sys.path.append(config.BASE_DIR)
+tts_pb2, tts_pb2_grpc = grpc.protos_and_services("tts.proto")
+
+GENERATION_FIELDS = ["max_new_tokens", "temperature", "top_k", "top_p", "repetition_penalty", "do_sample"]
+
+
+def to_voice_clone_request(message) -> VoiceCloneRequest:
+    """Validate a SynthesizeRequest with the HTTP schema (raises ValidationError)."""
+    params = message.generation_params
+    return VoiceCloneRequest(
+        text=message.text,
+        language=message.language or "Auto",
+        ref_audio=message.ref_audio,
+        ref_text=message.ref_text,
+        sample_rate=message.sample_rate or None,
+        priority=message.priority or "standard",
+        deadline_ms=message.deadline_ms or None,
+        trim_silence=message.trim_silence if message.HasField("trim_silence") else None,
+        pause_ms=message.pause_ms if message.HasField("pause_ms") else None,
+        seed=message.seed if message.HasField("seed") else None,
+        generation_params=GenerationParams(**{f: getattr(params, f) for f in GENERATION_FIELDS if params.HasField(f)}),
+    )
+
+
+class TTSServicer(tts_pb2_grpc.TTSServicer):
+    """
+    stream_chunks: the HTTP server's chunk pipeline (server.iter_pcm_chunks), yielding
+    (index, text, int16 PCM, seconds trimmed) with the next chunk generated while the current one is sent.
+    """
+
+    def __init__(self, stream_chunks: Callable):
+        self._stream_chunks = stream_chunks
+        self.requests = 0
+        self.streams = 0
+
+    async def Synthesize(self, request, context):
+        async for chunk in self._synthesize(request, context):
+            yield chunk
+
+    async def SynthesizeStream(self, request_iterator, context):
+        self.streams += 1
+        # Requests are handled in arrival order; a client can keep one stream open per dialogue
+        async for request in request_iterator:
+            async for chunk in self._synthesize(request, context):
+                yield chunk
+
+    async def _synthesize(self, message, context):
+        t0 = time.time()
+        self.requests += 1
+        try:
+            request = to_voice_clone_request(message)
+        except ValidationError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        chunks = chunk_text(request.text)
+        if not chunks:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, "text is empty")
+
+        model_size = message.model_size or "0.6b"
+        model_key = f"base_{model_size}" if model_size in ["0.6b", "1.7b"] else "base"
+        sample_rate = request.sample_rate or config.MODEL_SAMPLE_RATE
+        tenant = tenant_registry.identify(dict(context.invocation_metadata()))
+        traffic_recorder.record("grpc", request, model_size, tenant_registry.label(tenant))
+
+        # The tighter of deadline_ms and the gRPC deadline
+        budgets = [request.deadline_ms / 1000.0] if request.deadline_ms else []
+        if context.time_remaining() is not None:
+            budgets.append(context.time_remaining())
+        deadline = deadline_from_ms(int(min(budgets) * 1000), t0) if budgets else None
+
+        try:
+            model_manager.get_model(model_key)
+            cost = estimate_cost(request.text, model_key)
+            estimate = estimate_audio_seconds(request.text, model_manager.scheduler.estimate_audio(model_key, cost))
+            charge = tenant_registry.admit(tenant, estimate)
+        except QuotaExceeded as e:
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, str(e))
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+
+        try:
+            async for index, text, pcm, removed in self._stream_chunks(
+                chunks, model_key, request.language, request.ref_audio, request.ref_text,
+                request.generation_params.model_dump(), sample_rate, request.priority, tenant, deadline,
+                trim=config.TRIM_SILENCE if request.trim_silence is None else request.trim_silence,
+                pause_ms=request.pause_ms, charge=charge, seed=request.seed,
+            ):
+                yield tts_pb2.AudioChunk(
+                    request_id=message.request_id,
+                    chunk_index=index,
+                    pcm=pcm.tobytes(),
+                    sample_rate=sample_rate,
+                    text=text,
+                    audio_seconds=len(pcm) / sample_rate,
+                    elapsed=time.time() - t0,
+                    last=index == len(chunks) - 1,
+                    silence_removed=removed,
+                )
+        except DeadlineExceeded as e:
+            await context.abort(grpc.StatusCode.DEADLINE_EXCEEDED, str(e))
+        except GenerationCancelled as e:
+            await context.abort(grpc.StatusCode.CANCELLED, str(e))
+        finally:
+            tenant_registry.settle(charge)
+
+    def get_stats(self) -> dict:
+        return {"requests": self.requests, "streams": self.streams}
+
+
+async def start_grpc_server(stream_chunks: Callable, port: int = None) -> Optional[tuple]:
+    """Start the gRPC server in the running event loop; returns (server, servicer) or None if the port is unavailable."""
+    port = port or config.GRPC_PORT
+    server = grpc.aio.server(options=[
+        ("grpc.max_send_message_length", config.GRPC_MAX_MESSAGE_BYTES),
+        ("grpc.max_receive_message_length", config.GRPC_MAX_MESSAGE_BYTES),
+    ])
+    servicer = TTSServicer(stream_chunks)
+    tts_pb2_grpc.add_TTSServicer_to_server(servicer, server)
+    try:
+        if not server.add_insecure_port(f"{config.HOST}:{port}"):
+            raise RuntimeError("bind failed")
+    except RuntimeError as e:
+        print(f"[gRPC] Could not bind port {port}: {e}")
+        return None
+    await server.start()
+    print(f"[gRPC] Serving qwen3tts.TTS on {config.HOST}:{port}")
+    return server, servicer
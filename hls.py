@@ -0,0 +1,217 @@
+# coding=utf-8
+# Segmented HLS Output for Lip-sync Video
+#
+# Each per-sentence clip rendered by NewAvata is remuxed (no re-encode) into
+# an MPEG-TS segment and appended to an EVENT playlist as soon as it and all
+# earlier segments are ready, so playback can start after the first sentence
+# instead of after the full render. Clips are rendered independently, so
+# every clip after the first starts with a discontinuity.
+#
+# #EXT-X-TARGETDURATION is fixed (VIDEO_HLS_TARGET_DURATION) for the life of
+# the playlist, as the spec requires: a clip longer than that is split into
+# several segments, and #EXTINF is the probed duration of each segment file.
+# Stream directories are removed with their video job, and any left over
+# (direct /video/generate calls, restarts) after VIDEO_JOB_TTL.
+
+import asyncio
+import os
+import re
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import config
+
+PLAYLIST_NAME = "index.m3u8"
+# Stream IDs and file names accepted by the HTTP endpoint
+STREAM_ID_RE = re.compile(r"^[0-9a-f]{8,32}$")
+FILE_NAME_RE = re.compile(r"^(index\.m3u8|seg_\d{5}_\d{3}\.ts)$")
+
+MEDIA_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
+}
+
+
+def check_hls_support() -> bool:
+    """HLS output needs ffmpeg on PATH (or FFMPEG_BINARY)."""
+    return shutil.which(config.FFMPEG_BINARY) is not None
+
+
+def segment_name(index: int, part: int) -> str:
+    return f"seg_{index:05d}_{part:03d}.ts"
+
+
+def playlist_url(stream_id: str, base_url: str = "/video/hls") -> str:
+    return f"{base_url}/{stream_id}/{PLAYLIST_NAME}"
+
+
+def stream_file(stream_id: str, name: str) -> Optional[Path]:
+    """Resolve a playlist/segment file for serving, or None if the name is invalid or missing."""
+    if not STREAM_ID_RE.match(stream_id) or not FILE_NAME_RE.match(name):
+        return None
+    path = Path(config.VIDEO_HLS_DIR) / stream_id / name
+    return path if path.is_file() else None
+
+
+def remove_stream(stream_id: str) -> None:
+    """Delete a stream directory (its video job was evicted or expired)."""
+    if STREAM_ID_RE.match(stream_id):
+        shutil.rmtree(Path(config.VIDEO_HLS_DIR) / stream_id, ignore_errors=True)
+
+
+def sweep_streams(max_age: float = None) -> int:
+    """Delete stream directories not written for max_age seconds (default VIDEO_JOB_TTL); returns the count."""
+    max_age = config.VIDEO_JOB_TTL if max_age is None else max_age
+    root = Path(config.VIDEO_HLS_DIR)
+    if not root.is_dir():
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for path in root.iterdir():
+        # Every playlist update replaces a file in the directory, which bumps its mtime
+        if path.is_dir() and STREAM_ID_RE.match(path.name) and path.stat().st_mtime < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+async def _run(*args: str) -> bytes:
+    proc = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"{os.path.basename(args[0])} failed: {stderr.decode(errors='replace')[-500:]}")
+    return stdout
+
+
+async def split_to_ts(src: Path, pattern: Path, segment_time: int, reencode: bool = False) -> None:
+    """
+    MP4 -> MPEG-TS segments of about segment_time seconds (pattern: a %03d file name).
+
+    Without re-encoding, cuts can only land on the clip's keyframes; reencode=True
+    forces a keyframe every segment_time seconds so every cut is exact.
+    """
+    if reencode:
+        codec = [
+            "-c:v", "libx264", "-preset", "veryfast",
+            "-force_key_frames", f"expr:gte(t,n_forced*{segment_time})",
+            "-c:a", "aac",
+        ]
+    else:
+        codec = ["-c", "copy", "-bsf:v", "h264_mp4toannexb"]
+    await _run(
+        config.FFMPEG_BINARY, "-y", "-loglevel", "error",
+        "-i", str(src), *codec,
+        "-f", "segment", "-segment_time", str(segment_time), "-segment_format", "mpegts",
+        str(pattern),
+    )
+
+
+async def probe_duration(path: Path) -> float:
+    out = await _run(
+        config.FFPROBE_BINARY, "-v", "error",
+        "-show_entries", "format=duration", "-of", "csv=p=0", str(path),
+    )
+    return float(out.decode().strip())
+
+
+class HlsStream:
+    """
+    One growing HLS playlist under VIDEO_HLS_DIR/<stream_id>/.
+
+    Segments may be added in any order; the playlist only ever lists the
+    contiguous prefix, so players never see a gap. A segment that failed to
+    render is skipped so it does not stall the rest of the stream.
+    """
+
+    def __init__(self, stream_id: Optional[str] = None, base_url: str = "/video/hls"):
+        self.stream_id = stream_id or uuid.uuid4().hex[:16]
+        self.dir = Path(config.VIDEO_HLS_DIR) / self.stream_id
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.playlist_url = playlist_url(self.stream_id, base_url)
+        self.target_duration = config.VIDEO_HLS_TARGET_DURATION
+        # Ready clips: (segment name, duration) per part, None = skipped
+        self._segments: Dict[int, Optional[List[Tuple[str, float]]]] = {}
+        self._published = 0
+        self.finished = False
+        self._write_playlist()
+
+    async def _split(self, index: int, mp4_path: Path, reencode: bool) -> List[Tuple[str, float]]:
+        for old in self.dir.glob(f"part_{index:05d}_*.tmp"):
+            old.unlink()
+        await split_to_ts(mp4_path, self.dir / f"part_{index:05d}_%03d.tmp", self.target_duration, reencode)
+        parts = sorted(self.dir.glob(f"part_{index:05d}_*.tmp"))
+        if not parts:
+            raise RuntimeError(f"No segments produced from {mp4_path.name}")
+        return [(path.name, await probe_duration(path)) for path in parts]
+
+    async def add_segment(self, index: int, mp4_path: Path) -> None:
+        """Split a rendered clip into the segments of clip `index` and publish whatever prefix is complete."""
+        parts = await self._split(index, mp4_path, reencode=False)
+        if any(round(duration) > self.target_duration for _, duration in parts):
+            # Keyframes too far apart for the fixed target duration: cut exactly
+            parts = await self._split(index, mp4_path, reencode=True)
+        segments = []
+        for part, (tmp_name, duration) in enumerate(parts):
+            name = segment_name(index, part)
+            os.replace(self.dir / tmp_name, self.dir / name)
+            segments.append((name, duration))
+        self._mark(index, segments)
+
+    def skip_segment(self, index: int) -> None:
+        """Give up on clip `index` (render or remux failed)."""
+        self._mark(index, None)
+
+    def _mark(self, index: int, segments: Optional[List[Tuple[str, float]]]) -> None:
+        self._segments[index] = segments
+        published = self._published
+        while published in self._segments:
+            published += 1
+        if published != self._published:
+            self._published = published
+            self._write_playlist()
+
+    def finish(self) -> None:
+        """Close the playlist (#EXT-X-ENDLIST); segments missing at this point are dropped."""
+        self.finished = True
+        self._write_playlist()
+
+    def _write_playlist(self) -> None:
+        clips = [self._segments[i] for i in range(self._published) if self._segments[i] is not None]
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+            f"#EXT-X-TARGETDURATION:{self.target_duration}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+            "#EXT-X-DISCONTINUITY-SEQUENCE:0",
+        ]
+        for n, segments in enumerate(clips):
+            if n > 0:
+                lines.append("#EXT-X-DISCONTINUITY")
+            for name, duration in segments:
+                lines.append(f"#EXTINF:{duration:.3f},")
+                lines.append(name)
+        if self.finished:
+            lines.append("#EXT-X-ENDLIST")
+
+        # Atomic replace: readers never see a half-written playlist
+        path = self.dir / PLAYLIST_NAME
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        os.replace(tmp, path)
+
+    def get_info(self) -> dict:
+        clips = [self._segments[i] for i in range(self._published)]
+        return {
+            "stream_id": self.stream_id,
+            "playlist_url": self.playlist_url,
+            "published_segments": sum(len(c) for c in clips if c is not None),
+            "skipped_segments": sum(c is None for c in clips),
+            "duration": round(sum(d for c in clips if c is not None for _, d in c), 3),
+            "finished": self.finished,
+        }
@@ -1,52 +1,214 @@
 # coding=utf-8
 # Qwen3-TTS Model Loader
 
+import os
 import time
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager, nullcontext
+from typing import Any, Optional, Dict, List, AsyncIterator
+
 import torch
-from typing import Optional, Dict
 from qwen_tts import Qwen3TTSModel
 
 import config
+from scheduler import DEFAULT_PRIORITY, DEFAULT_TENANT, InferenceScheduler
+from tenants import tenant_registry
+from cancellation import install_decode_hook
+from profiling import profiler
 
 # Warmup settings
 WARMUP_TEXT = "안녕하세요."
 
+DTYPES = {
+    "bfloat16": torch.bfloat16,
+    "float16": torch.float16,
+    "float32": torch.float32,
+}
+
+
+def voice_digest(ref_audio) -> str:
+    """Short stable digest identifying a reference voice (path, URL, base64 or list of them)."""
+    data = ref_audio if isinstance(ref_audio, str) else json.dumps(ref_audio, ensure_ascii=False)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()[:16]
+
+
+def resolve_device(device: str) -> str:
+    """"auto" -> cuda:0 if a GPU is visible, else cpu; CUDA devices fail early without CUDA."""
+    if device == "auto":
+        return "cuda:0" if torch.cuda.is_available() else "cpu"
+    if device.startswith("cuda") and not torch.cuda.is_available():
+        raise RuntimeError(f"{device} requested but CUDA is not available (set TTS_DEVICE=cpu for CPU inference)")
+    return device
+
+
+def cpu_thread_count(cpu_replicas: int) -> int:
+    """Intra-op threads per CPU replica: TTS_CPU_THREADS, else the usable cores minus one, split evenly."""
+    if config.CPU_THREADS > 0:
+        return config.CPU_THREADS
+    try:
+        cores = len(os.sched_getaffinity(0))  # Respects taskset / container cpusets
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    return max(1, (cores - 1) // max(1, cpu_replicas))
+
+
+def quantize_int8(model: Qwen3TTSModel) -> int:
+    """Int8 dynamic quantization of the nn.Linear layers (in place); returns the number of layers converted."""
+    linears = sum(1 for m in model.model.modules() if isinstance(m, torch.nn.Linear))
+    torch.ao.quantization.quantize_dynamic(model.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return linears
+
+
+class ModelReplica:
+    """One copy of the loaded models pinned to a single device."""
+
+    def __init__(self, index: int, device: str, cpu_threads: int = 1):
+        self.index = index
+        self.device = device
+        self.is_cpu = device == "cpu"
+        # CPU replicas run float32 (+ int8 Linear layers) on a fixed number of threads
+        self.dtype = DTYPES.get(config.CPU_DTYPE if self.is_cpu else config.DTYPE, torch.bfloat16)
+        self.quantization = config.CPU_QUANTIZE if self.is_cpu and config.CPU_QUANTIZE != "none" else None
+        self.threads = cpu_threads if self.is_cpu else None
+        self.models: Dict[str, Qwen3TTSModel] = {}
+        # Outstanding work (estimated cost units) and requests in flight, per model key
+        self.outstanding: Dict[str, float] = {}
+        self.active: Dict[str, int] = {}
+        self.completed = 0
+        self.busy_time = 0.0
+        # LRU cache of voice clone prompts (speaker embedding / ref codes) per voice
+        self._prompt_cache: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._prompt_lock = threading.Lock()
+        self.prompt_cache_hits = 0
+        self.prompt_cache_misses = 0
+
+    def get_voice_clone_prompt(self, model_type: str, ref_audio, ref_text, x_vector_only_mode: bool = True):
+        """
+        Voice clone prompt for a reference voice, computed once per replica and cached.
+
+        ref_audio may be a path, URL or base64 string; it is keyed by digest.
+        """
+        key = (model_type, voice_digest(ref_audio), json.dumps(ref_text, ensure_ascii=False), x_vector_only_mode)
+        with self._prompt_lock:
+            prompt = self._prompt_cache.get(key)
+            if prompt is not None:
+                self._prompt_cache.move_to_end(key)
+                self.prompt_cache_hits += 1
+                return prompt
+            self.prompt_cache_misses += 1
+
+        prompt = self.models[model_type].create_voice_clone_prompt(
+            ref_audio=ref_audio,
+            ref_text=ref_text,
+            x_vector_only_mode=x_vector_only_mode,
+        )
+        with self._prompt_lock:
+            self._prompt_cache[key] = prompt
+            while len(self._prompt_cache) > config.VOICE_PROMPT_CACHE_SIZE:
+                self._prompt_cache.popitem(last=False)
+        return prompt
+
+    def device_context(self):
+        """Make this replica's device current for the calling thread (seeding, synchronize)."""
+        if self.device.startswith("cuda"):
+            return torch.cuda.device(self.device)
+        return nullcontext()
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn with this replica's device current (use from worker threads)."""
+        if self.threads and torch.get_num_threads() != self.threads:
+            torch.set_num_threads(self.threads)
+        with self.device_context():
+            # Traced only while an admin profiling session is running
+            return profiler.call(fn, *args, **kwargs)
+
+    def synchronize(self):
+        """Wait for queued kernels on this replica's device (CPU work is already done when a call returns)."""
+        if self.device.startswith("cuda"):
+            torch.cuda.synchronize(self.device)
+        elif self.device.startswith("mps"):
+            torch.mps.synchronize()
+
+    def get_stats(self) -> dict:
+        return {
+            "index": self.index,
+            "device": self.device,
+            "dtype": str(self.dtype).replace("torch.", ""),
+            "quantization": self.quantization,
+            "threads": self.threads,
+            "models": list(self.models.keys()),
+            "outstanding_work": {k: round(v, 1) for k, v in self.outstanding.items() if v > 0},
+            "active_requests": {k: v for k, v in self.active.items() if v > 0},
+            "completed_requests": self.completed,
+            "busy_time": round(self.busy_time, 3),
+            "voice_prompt_cache": {
+                "size": len(self._prompt_cache),
+                "hits": self.prompt_cache_hits,
+                "misses": self.prompt_cache_misses,
+            },
+        }
+
 
 class TTSModelManager:
-    """Manages TTS model loading and inference."""
+    """
+    Manages TTS model loading and inference.
+
+    Models are replicated on every device in config.DEVICES; acquire() queues each
+    request in the scheduler (priority, then tenant fair share and shortest job first)
+    and runs it on the free replica with the least outstanding work for the requested model.
+    """
 
     def __init__(self):
-        self.models: Dict[str, Qwen3TTSModel] = {}
-        self.device = config.DEVICE
-        self.dtype = self._get_dtype()
+        devices = [resolve_device(d) for d in config.DEVICES]
+        cpu_threads = cpu_thread_count(devices.count("cpu"))
+        self.replicas: List[ModelReplica] = [ModelReplica(i, d, cpu_threads) for i, d in enumerate(devices)]
+        self.device = self.replicas[0].device
+        self.dtype = self.replicas[0].dtype
         self.attn_impl = "flash_attention_2" if config.USE_FLASH_ATTENTION else "sdpa"
+        if "cpu" in devices and len(set(devices)) > 1:
+            # Routing balances outstanding work, not device speed
+            print("[Models] Warning: mixing CPU and GPU replicas in one server; run CPU replicas on their own nodes")
+        self._lock = threading.Lock()
+        self.scheduler = InferenceScheduler(self.replicas, self._pick, weight=tenant_registry.weight)
 
-    def _get_dtype(self):
-        dtype_map = {
-            "bfloat16": torch.bfloat16,
-            "float16": torch.float16,
-            "float32": torch.float32,
-        }
-        return dtype_map.get(config.DTYPE, torch.bfloat16)
+    @property
+    def models(self) -> Dict[str, Qwen3TTSModel]:
+        """Models of the first replica (every replica holds the same model types)."""
+        return self.replicas[0].models
 
     def load_model(self, model_type: str) -> Qwen3TTSModel:
-        """Load a specific model type."""
-        if model_type in self.models:
-            return self.models[model_type]
-
+        """Load a specific model type on every replica."""
         if model_type not in config.MODELS:
             raise ValueError(f"Unknown model type: {model_type}. Available: {list(config.MODELS.keys())}")
 
+        for replica in self.replicas:
+            if model_type not in replica.models:
+                self._load_on_replica(replica, model_type)
+        return self.models[model_type]
+
+    def _load_on_replica(self, replica: ModelReplica, model_type: str) -> Qwen3TTSModel:
         model_path = config.MODELS[model_type]
-        print(f"Loading model: {model_type} from {model_path}...")
+        print(f"Loading model: {model_type} from {model_path} on {replica.device}...")
 
         model = Qwen3TTSModel.from_pretrained(
             model_path,
-            device_map=self.device,
-            dtype=self.dtype,
-            attn_implementation=self.attn_impl,
+            device_map=replica.device,
+            dtype=replica.dtype,
+            # Flash Attention is CUDA only
+            attn_implementation=self.attn_impl if replica.device.startswith("cuda") else "sdpa",
         )
 
+        # Before the decode hook: quantization swaps the Linear modules in place
+        if replica.quantization == "int8":
+            print(f"Quantizing {model_type} on {replica.device}: "
+                  f"{quantize_int8(model)} Linear layers -> int8 (dynamic), {replica.threads} thread(s)")
+
+        # Per-decode-step check of the request's CancelToken (deadline / disconnect)
+        install_decode_hook(model)
+
         # Apply torch.compile() for faster inference
         if config.USE_TORCH_COMPILE:
             print(f"Applying torch.compile() to {model_type}...")
@@ -56,16 +218,17 @@ class TTSModelManager:
             except Exception as e:
                 print(f"torch.compile() failed: {e}")
 
-        self.models[model_type] = model
-        print(f"Model {model_type} loaded successfully!")
+        replica.models[model_type] = model
+        print(f"Model {model_type} loaded successfully on {replica.device}!")
 
         # Warmup to trigger JIT compilation
         if config.USE_WARMUP and config.USE_TORCH_COMPILE:
-            self._warmup_model(model, model_type)
+            with replica.device_context():
+                self._warmup_model(replica, model, model_type)
 
         return model
 
-    def _warmup_model(self, model: Qwen3TTSModel, model_type: str):
+    def _warmup_model(self, replica: ModelReplica, model: Qwen3TTSModel, model_type: str):
         """Run warmup inference to trigger JIT compilation."""
         print(f"Warming up {model_type}...")
         try:
@@ -99,7 +262,7 @@ class TTSModelManager:
                     speaker="Sohee",
                     max_new_tokens=256,
                 )
-            torch.cuda.synchronize()
+            replica.synchronize()
             t1 = time.time()
             print(f"Warmup completed in {t1 - t0:.2f}s (subsequent inferences will be faster)")
         except Exception as e:
@@ -111,6 +274,56 @@ class TTSModelManager:
             return self.load_model(model_type)
         return self.models[model_type]
 
+    def _pick(self, candidates: List[ModelReplica], model_type: str) -> ModelReplica:
+        """The candidate with the least outstanding work for model_type."""
+        with self._lock:
+            return min(
+                candidates,
+                key=lambda r: (r.outstanding.get(model_type, 0.0), sum(r.active.values()), r.index),
+            )
+
+    def _reserve(self, replica: ModelReplica, model_type: str, cost: float):
+        with self._lock:
+            replica.outstanding[model_type] = replica.outstanding.get(model_type, 0.0) + cost
+            replica.active[model_type] = replica.active.get(model_type, 0) + 1
+
+    def _release(self, replica: ModelReplica, model_type: str, cost: float, elapsed: float):
+        with self._lock:
+            replica.outstanding[model_type] = max(0.0, replica.outstanding[model_type] - cost)
+            replica.active[model_type] -= 1
+            replica.completed += 1
+            replica.busy_time += elapsed
+
+    @asynccontextmanager
+    async def acquire(self, model_type: str, cost: float = 1.0, priority: str = DEFAULT_PRIORITY,
+                      deadline: Optional[float] = None, tenant: str = DEFAULT_TENANT) -> AsyncIterator[ModelReplica]:
+        """
+        Wait for a replica slot and route the request to a replica holding model_type.
+
+        cost: estimated work of the request (see scheduler.estimate_cost); orders the
+        queue within a priority class and picks the replica with the least outstanding
+        cost for this model key.
+        priority: "interactive", "standard" or "batch".
+        deadline: absolute time; raises cancellation.DeadlineExceeded if it cannot be met.
+        tenant: caller identity for weighted fair queuing (see tenants.py).
+        """
+        if model_type not in self.models:
+            self.load_model(model_type)
+
+        replica = await self.scheduler.acquire(model_type, cost, priority, deadline, tenant)
+        self._reserve(replica, model_type, cost)
+        t0 = time.time()
+        try:
+            yield replica
+        finally:
+            self._release(replica, model_type, cost, time.time() - t0)
+            self.scheduler.release(replica, cost, tenant)
+
+    def get_replica_stats(self) -> List[dict]:
+        """Per-replica load and throughput stats."""
+        with self._lock:
+            return [r.get_stats() for r in self.replicas]
+
     def load_default_models(self):
         """Load default models based on configuration."""
         if config.DEFAULT_MODEL == "all":
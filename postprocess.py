@@ -0,0 +1,223 @@
+# coding=utf-8
+# Qwen3-TTS Audio Post-processing Pool
+#
+# CPU-bound work on generated audio (WAV encoding, base64, ...) runs in a
+# thread or process pool instead of the event loop / GPU worker thread, so a
+# replica can start its next request while the previous output is encoded.
+# In process mode numpy buffers are handed over through shared memory
+# instead of being pickled.
+
+import asyncio
+import base64
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, List, Sequence, Tuple
+
+import numpy as np
+
+import config
+from audio_io import encode_wav
+from resample import Resampler
+
+# (shared memory name, shape, dtype string)
+ArrayDescriptor = Tuple[str, tuple, str]
+
+
+# ============== Tasks (module-level so they can run in worker processes) ==============
+
+def encode_wav_task(wavs: List[np.ndarray], sample_rate: int):
+    """Encode chunks as one concatenated 16-bit WAV."""
+    return encode_wav(wavs, sample_rate)
+
+
+def wav_base64_task(wavs: List[np.ndarray], sample_rate: int) -> List[str]:
+    """Encode each chunk as a separate base64 WAV string."""
+    return [base64.b64encode(encode_wav([wav], sample_rate)).decode("ascii") for wav in wavs]
+
+
+def resample_task(wavs: List[np.ndarray], orig_sr: int, target_sr: int, continuous: bool) -> List[np.ndarray]:
+    """
+    Resample chunks to target_sr.
+
+    continuous=True: chunks are consecutive parts of one signal and share the
+    resampler state (no discontinuity at chunk boundaries); the filter tail is
+    appended to the last chunk.
+    """
+    if continuous:
+        resampler = Resampler(orig_sr, target_sr)
+        out = [resampler.process(wav) for wav in wavs]
+        out[-1] = np.concatenate([out[-1], resampler.flush()])
+        return out
+    results = []
+    for wav in wavs:
+        resampler = Resampler(orig_sr, target_sr)
+        results.append(np.concatenate([resampler.process(wav), resampler.flush()]))
+    return results
+
+
+# ============== Shared-memory handoff ==============
+
+def _share_arrays(arrays: Sequence[np.ndarray]) -> Tuple[List[SharedMemory], List[ArrayDescriptor]]:
+    """Copy arrays into new shared memory blocks (owned by the caller)."""
+    blocks, descriptors = [], []
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+        blocks.append(shm)
+        descriptors.append((shm.name, array.shape, array.dtype.str))
+    return blocks, descriptors
+
+
+def _release_arrays(blocks: List[SharedMemory]) -> None:
+    for shm in blocks:
+        shm.close()
+        shm.unlink()
+
+
+def _attach(name: str) -> SharedMemory:
+    """
+    Attach to a block created by the parent.
+
+    Spawned workers share the parent's resource tracker, so re-registering the
+    name is a no-op and the parent's unlink stays the single cleanup point.
+    """
+    try:
+        return SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        return SharedMemory(name=name)
+
+
+def _run_shared(fn: Callable, descriptors: List[ArrayDescriptor], *args):
+    """Worker-side entry: map shared blocks as arrays, run fn, return a picklable result."""
+    blocks = [_attach(name) for name, _, _ in descriptors]
+    try:
+        arrays = [
+            np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+            for shm, (_, shape, dtype) in zip(blocks, descriptors)
+        ]
+        result = fn(arrays, *args)
+        if isinstance(result, memoryview):
+            result = result.tobytes()
+        del arrays
+        return result
+    finally:
+        for shm in blocks:
+            shm.close()
+
+
+# ============== Pool ==============
+
+class PostProcessor:
+    """
+    Thread or process pool for audio post-processing.
+
+    - mode="thread": tasks share the arrays directly (numpy releases the GIL for
+      most of the conversion work)
+    - mode="process": arrays are copied once into shared memory; workers map them
+      without pickling
+    """
+
+    def __init__(self, mode: str = None, workers: int = None):
+        self.mode = mode or config.POSTPROCESS_MODE
+        self.workers = workers or config.POSTPROCESS_WORKERS
+        if self.mode not in ("thread", "process"):
+            raise ValueError(f"Unknown post-processing mode: {self.mode}. Available: ['thread', 'process']")
+        self._executor = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.busy_time = 0.0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if self.mode == "process":
+                    # spawn: never fork a process that holds CUDA contexts
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers,
+                        thread_name_prefix="postprocess",
+                    )
+            return self._executor
+
+    def submit(self, fn: Callable, arrays: Sequence[np.ndarray], *args) -> Future:
+        """Run fn(arrays, *args) in the pool."""
+        executor = self._get_executor()
+        t0 = time.time()
+        if self.mode == "process":
+            blocks, descriptors = _share_arrays(arrays)
+            future = executor.submit(_run_shared, fn, descriptors, *args)
+            future.add_done_callback(lambda _: _release_arrays(blocks))
+        else:
+            future = executor.submit(fn, list(arrays), *args)
+
+        with self._lock:
+            self.submitted += 1
+        future.add_done_callback(lambda f: self._record(f, time.time() - t0))
+        return future
+
+    def _record(self, future: Future, elapsed: float):
+        with self._lock:
+            if future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+            self.busy_time += elapsed
+
+    async def run(self, fn: Callable, arrays: Sequence[np.ndarray], *args):
+        """Await fn(arrays, *args) without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(fn, arrays, *args))
+
+    # Convenience wrappers
+
+    async def encode_wav(self, wavs: Sequence[np.ndarray], sample_rate: int):
+        return await self.run(encode_wav_task, wavs, sample_rate)
+
+    def encode_wav_sync(self, wavs: Sequence[np.ndarray], sample_rate: int):
+        """Blocking variant for use inside sync iterators (already off the event loop)."""
+        return self.submit(encode_wav_task, wavs, sample_rate).result()
+
+    async def wav_to_base64(self, wavs: Sequence[np.ndarray], sample_rate: int) -> List[str]:
+        """Encode each chunk as base64 WAV; items are spread across the pool workers."""
+        results = await asyncio.gather(*(self.run(wav_base64_task, [wav], sample_rate) for wav in wavs))
+        return [r[0] for r in results]
+
+    async def resample(self, wavs: Sequence[np.ndarray], orig_sr: int, target_sr: int,
+                       continuous: bool = False) -> List[np.ndarray]:
+        """Resample chunks (see resample_task); independent items are spread across workers."""
+        if continuous:
+            return await self.run(resample_task, wavs, orig_sr, target_sr, True)
+        results = await asyncio.gather(
+            *(self.run(resample_task, [wav], orig_sr, target_sr, False) for wav in wavs)
+        )
+        return [r[0] for r in results]
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "workers": self.workers,
+                "pending": self.submitted - self.completed - self.failed,
+                "completed": self.completed,
+                "failed": self.failed,
+                "busy_time": round(self.busy_time, 3),
+            }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+# Global post-processing pool
+postprocessor = PostProcessor()
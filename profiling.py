@@ -0,0 +1,278 @@
+# coding=utf-8
+# Qwen3-TTS On-demand Profiling
+#
+# POST /admin/profile starts a session for the next N generations or T
+# seconds, whichever comes first. A generation is one replica call: a whole
+# /tts/voice_clone request, but a single text chunk of a streaming (PCM, gRPC,
+# video) request. While it runs:
+# - each generation is traced with torch.profiler in its worker thread (CPU
+#   activities, plus CUDA when a GPU is present) and exported as a Chrome
+#   trace (chrome://tracing, Perfetto) in a background thread, so export time
+#   and export errors never reach the request;
+# - a sampler thread records the Python stacks of every other thread (event
+#   loop and workers) and writes a speedscope profile when the session ends.
+# Files land in PROFILE_DIR/<session id>/. With no session running, the only
+# cost is one attribute check per generation.
+
+import json
+import re
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import torch
+
+import config
+
+SESSION_ID_RE = re.compile(r"^[0-9a-f]{12}$")
+FILE_NAME_RE = re.compile(r"^[\w.-]+\.json$")
+
+
+class StackSampler:
+    """Samples Python stacks of all other threads at a fixed interval (speedscope 'sampled' output)."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._frames: List[dict] = []
+        self._frame_ids: Dict[tuple, int] = {}
+        # thread ident -> (name, stacks, weights)
+        self._threads: Dict[int, tuple] = {}
+        self.started_at = time.perf_counter()
+        self.samples = 0
+
+    def _frame_id(self, code) -> int:
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        frame_id = self._frame_ids.get(key)
+        if frame_id is None:
+            frame_id = self._frame_ids[key] = len(self._frames)
+            self._frames.append({"name": code.co_name, "file": code.co_filename, "line": code.co_firstlineno})
+        return frame_id
+
+    def sample(self, dt: float):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        me = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_id(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()  # Root first
+            name, stacks, weights = self._threads.setdefault(ident, (names.get(ident, str(ident)), [], []))
+            stacks.append(stack)
+            weights.append(dt)
+        self.samples += 1
+
+    def to_speedscope(self, name: str) -> dict:
+        end = time.perf_counter() - self.started_at
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "qwen3-tts",
+            "shared": {"frames": self._frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": thread_name,
+                    "unit": "seconds",
+                    "startValue": 0.0,
+                    "endValue": end,
+                    "samples": stacks,
+                    "weights": weights,
+                }
+                for thread_name, stacks, weights in self._threads.values()
+            ],
+        }
+
+
+class ProfileSession:
+    """One capture: traces up to max_requests generations within `seconds`."""
+
+    def __init__(self, max_requests: int, seconds: float):
+        self.id = uuid.uuid4().hex[:12]
+        self.max_requests = max_requests
+        self.seconds = seconds
+        self.dir = Path(config.PROFILE_DIR) / self.id
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.traced = 0
+        self.untraced = 0  # Generations that overlapped another trace (torch.profiler is process-wide)
+        self.files: List[str] = []
+        self.error: Optional[str] = None
+        self._claimed = 0
+        self._lock = threading.Lock()
+        self._trace_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            self.activities.append(torch.profiler.ProfilerActivity.CUDA)
+
+    @property
+    def active(self) -> bool:
+        return self.finished_at is None
+
+    def start(self, on_finish):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(
+            target=self._sample_loop, args=(on_finish,), name=f"profile-{self.id}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _sample_loop(self, on_finish):
+        sampler = StackSampler(config.PROFILE_SAMPLE_INTERVAL)
+        deadline = time.perf_counter() + self.seconds
+        last = time.perf_counter()
+        try:
+            while not self._stop.wait(sampler.interval) and time.perf_counter() < deadline:
+                now = time.perf_counter()
+                sampler.sample(now - last)
+                last = now
+            self._stop.set()
+            # Let generations that are still being traced finish their export
+            with self._trace_lock:
+                pass
+            self._write("python.speedscope.json", sampler.to_speedscope(f"qwen3-tts {self.id}"))
+        except Exception as e:
+            self.error = str(e)
+            print(f"[Profile] Sampler failed: {e}")
+        finally:
+            self.finished_at = time.time()
+            self._write("session.json", self.get_info())
+            print(f"[Profile] Session {self.id} finished: {self.traced} trace(s), files in {self.dir}")
+            on_finish(self)
+
+    def _write(self, name: str, data: dict):
+        with open(self.dir / name, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        with self._lock:
+            if name not in self.files:
+                self.files.append(name)
+
+    def run(self, fn, *args, **kwargs):
+        """Run a generation, tracing it if this session still has room."""
+        with self._lock:
+            claim = self.active and not self._stop.is_set() and self._claimed < self.max_requests
+            if claim:
+                self._claimed += 1
+        if not claim or not self._trace_lock.acquire(blocking=False):
+            if claim:
+                with self._lock:
+                    self._claimed -= 1
+                    self.untraced += 1
+            return fn(*args, **kwargs)
+
+        try:
+            with torch.profiler.profile(activities=self.activities, with_stack=True) as prof:
+                result = fn(*args, **kwargs)
+        except BaseException:
+            self._trace_done()
+            raise
+        with self._lock:
+            self.traced += 1
+            name = f"request-{self.traced:03d}.trace.json"
+        # The trace lock stays held until the export has finished, so the next trace and the
+        # end of the session wait for it, but the request does not
+        threading.Thread(target=self._export, args=(prof, name), name=f"profile-export-{self.id}",
+                         daemon=True).start()
+        return result
+
+    def _export(self, prof, name: str):
+        try:
+            prof.export_chrome_trace(str(self.dir / name))
+            with self._lock:
+                self.files.append(name)
+        except Exception as e:
+            with self._lock:
+                self.error = f"Exporting {name} failed: {e}"
+            print(f"[Profile] {self.error}")
+        finally:
+            self._trace_done()
+
+    def _trace_done(self):
+        self._trace_lock.release()
+        with self._lock:
+            done = self._claimed >= self.max_requests
+        if done:
+            self.stop()
+
+    def get_info(self) -> dict:
+        with self._lock:
+            return {
+                "id": self.id,
+                "active": self.active,
+                "max_requests": self.max_requests,
+                "seconds": self.seconds,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "traced_requests": self.traced,
+                "untraced_requests": self.untraced,
+                "activities": [a.name for a in self.activities],
+                "files": [f"/admin/profile/{self.id}/{name}" for name in self.files],
+                "error": self.error,
+            }
+
+
+class Profiler:
+    """At most one profiling session at a time; remembers recent sessions for download."""
+
+    def __init__(self):
+        self.session: Optional[ProfileSession] = None  # Checked on every generation
+        self._recent: List[ProfileSession] = []
+        self._lock = threading.Lock()
+
+    def start(self, max_requests: int, seconds: float) -> ProfileSession:
+        """Raises RuntimeError if a session is already running."""
+        with self._lock:
+            if self.session is not None:
+                raise RuntimeError(f"Profiling session {self.session.id} is already running")
+            session = ProfileSession(max_requests, min(seconds, config.PROFILE_MAX_SECONDS))
+            self.session = session
+            self._recent = ([session] + self._recent)[:config.PROFILE_KEEP_SESSIONS]
+        session.start(self._finished)
+        print(f"[Profile] Session {session.id} started ({max_requests} request(s) / {session.seconds:.0f}s)")
+        return session
+
+    def _finished(self, session: ProfileSession):
+        with self._lock:
+            if self.session is session:
+                self.session = None
+
+    def stop(self) -> Optional[ProfileSession]:
+        session = self.session
+        if session is not None:
+            session.stop()
+        return session
+
+    def call(self, fn, *args, **kwargs):
+        session = self.session
+        if session is None:
+            return fn(*args, **kwargs)
+        return session.run(fn, *args, **kwargs)
+
+    def get_info(self) -> dict:
+        with self._lock:
+            sessions = list(self._recent)
+        return {
+            "active": self.session.id if self.session is not None else None,
+            "sessions": [s.get_info() for s in sessions],
+        }
+
+
+def profile_file(session_id: str, name: str) -> Optional[Path]:
+    """Resolve a profile file for download, or None if the name is invalid or missing."""
+    if not SESSION_ID_RE.match(session_id) or not FILE_NAME_RE.match(name):
+        return None
+    path = Path(config.PROFILE_DIR) / session_id / name
+    return path if path.is_file() else None
+
+
+# Global profiler
+profiler = Profiler()
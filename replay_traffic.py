@@ -0,0 +1,263 @@
+# coding=utf-8
+# Qwen3-TTS Traffic Replay
+#
+# Re-issues a trace recorded with TTS_TRAFFIC_RECORD against a running server,
+# open loop and on the recorded arrival schedule (optionally sped up), and
+# compares latency distributions between two replay runs:
+#
+#   python replay_traffic.py replay trace.jsonl --url http://localhost:8000 --out before.jsonl
+#   python replay_traffic.py replay trace.jsonl --url http://localhost:8000 --speed 2 --out after.jsonl
+#   python replay_traffic.py compare before.jsonl after.jsonl
+#
+# Traces recorded without text get filler text of the recorded length and
+# sentence count. Recorded voices (digests) are mapped onto --voice files in
+# order of first appearance, so the voice mix - and voice prompt cache
+# behaviour - matches production as far as the available voices allow.
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+FILLER_SENTENCE = "오늘 면접에 참석해 주셔서 감사합니다 지원하신 직무에 대해 조금 더 자세히 말씀해 주시겠어요"
+LENGTH_BUCKETS = [50, 150, 300, 600]
+
+
+def load_jsonl(path: str) -> List[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def filler_text(chars: int, sentences: int) -> str:
+    """Text of about `chars` characters split into `sentences` sentences."""
+    sentences = max(1, sentences)
+    per = max(2, chars // sentences)
+    body = (FILLER_SENTENCE + " ") * (per // len(FILLER_SENTENCE) + 1)
+    return " ".join(body[:per - 1].rstrip() + "." for _ in range(sentences))
+
+
+class VoiceMap:
+    """Recorded voice digest -> available reference voice, assigned in order of first appearance."""
+
+    def __init__(self, voices: List[str], ref_text: str):
+        self.voices = voices
+        self.ref_text = ref_text
+        self._assigned: Dict[str, str] = {}
+
+    def get(self, digest: str) -> str:
+        if digest not in self._assigned:
+            self._assigned[digest] = self.voices[len(self._assigned) % len(self.voices)]
+        return self._assigned[digest]
+
+
+def build_request(entry: dict, voices: VoiceMap) -> dict:
+    """Request body for a recorded entry (recorded text if present, else filler of the same shape)."""
+    texts = [filler_text(item["chars"], item["sentences"]) for item in entry["items"]]
+    text = entry.get("text", texts if entry.get("batch") else texts[0])
+    ref_audio = voices.get(entry["voice"])
+    body = {
+        "text": text,
+        "language": entry.get("language", "Auto"),
+        "ref_audio": ref_audio if isinstance(text, str) else [ref_audio] * len(text),
+        "ref_text": voices.ref_text if isinstance(text, str) else [voices.ref_text] * len(text),
+    }
+    for field in ("x_vector_only_mode", "split_sentences", "seed", "sample_rate", "priority",
+                  "deadline_ms", "trim_silence", "pause_ms", "generation_params"):
+        if entry.get(field) is not None:
+            body[field] = entry[field]
+    return body
+
+
+async def send(client: httpx.AsyncClient, url: str, entry: dict, body: dict, headers: dict) -> dict:
+    """Issue one request; returns status, total latency and (streaming endpoints) time to first audio."""
+    options = entry.get("options") or {}
+    params = {"model_size": entry.get("model_size", "0.6b")}
+    result = {"endpoint": entry["endpoint"], "chars": sum(i["chars"] for i in entry["items"]),
+              "status": None, "latency": None, "ttfa": None, "bytes": 0, "error": None}
+    t0 = time.perf_counter()
+    try:
+        if entry["endpoint"] == "voice_clone_sse":
+            params["streaming"] = str(options.get("streaming", True)).lower()
+            async with client.stream("POST", f"{url}/tts/voice_clone/sse", params=params,
+                                     json=body, headers=headers) as response:
+                result["status"] = response.status_code
+                async for line in response.aiter_lines():
+                    result["bytes"] += len(line)
+                    if line.startswith("event: audio") and result["ttfa"] is None:
+                        result["ttfa"] = time.perf_counter() - t0
+                    elif line.startswith("event: error"):
+                        result["error"] = "error event"
+        elif entry["endpoint"] == "voice_clone_stream":
+            async with client.stream("POST", f"{url}/tts/voice_clone/stream", params=params,
+                                     json=body, headers=headers) as response:
+                result["status"] = response.status_code
+                async for data in response.aiter_bytes():
+                    if data and result["ttfa"] is None:
+                        result["ttfa"] = time.perf_counter() - t0
+                    result["bytes"] += len(data)
+        else:
+            params["response_format"] = options.get("response_format", "json")
+            response = await client.post(f"{url}/tts/voice_clone", params=params, json=body, headers=headers)
+            result["status"] = response.status_code
+            result["bytes"] = len(response.content)
+            if response.status_code != 200:
+                result["error"] = response.text[:200]
+    except httpx.HTTPError as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["latency"] = time.perf_counter() - t0
+    return result
+
+
+async def replay(args) -> None:
+    trace = sorted(load_jsonl(args.trace), key=lambda e: e["t"])
+    if args.limit:
+        trace = trace[:args.limit]
+    if not trace:
+        print("[Replay] Empty trace")
+        return
+    voices = VoiceMap(args.voice, args.ref_text)
+    headers = {args.tenant_header: args.api_key} if args.api_key else {}
+    t_first = trace[0]["t"]
+    span = (trace[-1]["t"] - t_first) / args.speed
+    print(f"[Replay] {len(trace)} requests over {span:.1f}s (speed x{args.speed}) -> {args.url}")
+
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        start = time.perf_counter()
+
+        async def run(i: int, entry: dict) -> dict:
+            # Open loop: each request is sent on its recorded schedule, whatever the server's latency
+            scheduled = (entry["t"] - t_first) / args.speed
+            await asyncio.sleep(max(0.0, start + scheduled - time.perf_counter()))
+            lag = time.perf_counter() - start - scheduled
+            result = await send(client, args.url, entry, build_request(entry, voices), headers)
+            return dict(result, i=i, scheduled=round(scheduled, 3), lag=round(lag, 4))
+
+        results = await asyncio.gather(*(run(i, e) for i, e in enumerate(trace)))
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+    print(f"[Replay] Done in {time.perf_counter() - start:.1f}s; results in {args.out}")
+    print_summary({args.out: summarize(results)})
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def distribution(values: List[float]) -> dict:
+    return {
+        "n": len(values),
+        "mean": statistics.fmean(values) if values else None,
+        "p50": percentile(values, 0.5),
+        "p90": percentile(values, 0.9),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": max(values) if values else None,
+    }
+
+
+def bucket_name(chars: int) -> str:
+    for limit in LENGTH_BUCKETS:
+        if chars < limit:
+            return f"<{limit}"
+    return f">={LENGTH_BUCKETS[-1]}"
+
+
+def summarize(results: List[dict]) -> dict:
+    ok = [r for r in results if r["status"] == 200 and not r["error"]]
+    buckets: Dict[str, List[float]] = {}
+    for r in ok:
+        buckets.setdefault(bucket_name(r["chars"]), []).append(r["latency"])
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "latency": distribution([r["latency"] for r in ok]),
+        "ttfa": distribution([r["ttfa"] for r in ok if r.get("ttfa") is not None]),
+        "max_send_lag": max((r.get("lag", 0.0) for r in results), default=0.0),
+        "by_length": {name: distribution(values) for name, values in sorted(buckets.items())},
+    }
+
+
+def _fmt(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.3f}"
+
+
+def print_summary(summaries: Dict[str, dict]) -> None:
+    names = list(summaries)
+    print(f"{'':24}" + "".join(f"{n[-22:]:>24}" for n in names) + ("       delta" if len(names) == 2 else ""))
+
+    def row(label: str, values: List[Optional[float]], fmt=_fmt):
+        line = f"{label:24}" + "".join(f"{fmt(v):>24}" for v in values)
+        if len(values) == 2 and values[0] and values[1] is not None:
+            line += f"  {(values[1] - values[0]) / values[0] * 100:+9.1f}%"
+        print(line)
+
+    row("requests", [s["requests"] for s in summaries.values()], str)
+    row("errors", [s["errors"] for s in summaries.values()], str)
+    for metric in ("latency", "ttfa"):
+        for stat in ("mean", "p50", "p90", "p95", "p99", "max"):
+            row(f"{metric} {stat} (s)", [s[metric][stat] for s in summaries.values()])
+    buckets = sorted({b for s in summaries.values() for b in s["by_length"]},
+                     key=lambda b: LENGTH_BUCKETS.index(int(b.lstrip("<>="))) + (b.startswith(">=")))
+    for b in buckets:
+        for stat in ("p50", "p95"):
+            row(f"chars {b} {stat} (s)", [s["by_length"].get(b, {}).get(stat) for s in summaries.values()])
+    row("max send lag (s)", [s["max_send_lag"] for s in summaries.values()])
+
+
+def compare(args) -> None:
+    summaries = {path: summarize(load_jsonl(path)) for path in (args.baseline, args.candidate)}
+    if args.json:
+        json.dump(summaries, sys.stdout, indent=2)
+        print()
+    else:
+        print_summary(summaries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded TTS traffic and compare latency distributions")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("replay", help="Re-issue a recorded trace against a server")
+    p.add_argument("trace", help="JSONL trace written with TTS_TRAFFIC_RECORD")
+    p.add_argument("--url", default="http://localhost:8000", help="Server base URL")
+    p.add_argument("--out", "-o", required=True, help="Per-request results (JSONL)")
+    p.add_argument("--speed", type=float, default=1.0, help="Arrival rate multiplier (2 = twice as fast)")
+    p.add_argument("--voice", action="append", default=None,
+                   help="Reference audio available to the server (repeatable; default: sample(1).mp3)")
+    p.add_argument("--ref-text", default="안녕하세요.", help="Transcript of the reference audio")
+    p.add_argument("--limit", type=int, default=None, help="Replay only the first N requests")
+    p.add_argument("--api-key", default=None, help="Send as the tenant header")
+    p.add_argument("--tenant-header", default="X-API-Key")
+    p.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout (s)")
+    p.add_argument("--max-connections", type=int, default=512)
+
+    c = sub.add_parser("compare", help="Compare latency distributions of two replay runs")
+    c.add_argument("baseline", help="Results of the first run")
+    c.add_argument("candidate", help="Results of the second run")
+    c.add_argument("--json", action="store_true", help="Print summaries as JSON")
+
+    args = parser.parse_args()
+    if args.command == "replay":
+        if args.speed <= 0:
+            parser.error("--speed must be > 0")
+        args.voice = args.voice or ["sample(1).mp3"]
+        asyncio.run(replay(args))
+    else:
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# coding=utf-8
+# Qwen3-TTS Output Resampling
+#
+# Vectorized polyphase resampling (e.g. 24 kHz model output -> 16 kHz for
+# lip-sync / telephony consumers). Filter banks are designed once per rate
+# pair and cached; Resampler keeps its input history between calls so audio
+# split into chunks resamples exactly like the concatenated signal.
+
+from functools import lru_cache
+from math import gcd
+from typing import Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Filter half-length in zero crossings of the widest (anti-aliasing) sinc
+FILTER_ZERO_CROSSINGS = 16
+# Kaiser window shape (~80 dB stopband attenuation)
+FILTER_KAISER_BETA = 8.0
+# Passband edge as a fraction of the lower Nyquist frequency
+FILTER_ROLLOFF = 0.94
+
+
+def rate_ratio(orig_sr: int, target_sr: int) -> Tuple[int, int]:
+    """Reduced (up, down) factors for orig_sr -> target_sr."""
+    g = gcd(orig_sr, target_sr)
+    return target_sr // g, orig_sr // g
+
+
+@lru_cache(maxsize=32)
+def polyphase_filter(up: int, down: int) -> Tuple[np.ndarray, int]:
+    """
+    Kaiser-windowed sinc low-pass split into `up` phases.
+
+    Returns (bank, center): bank[p] holds the (time-reversed) taps of phase p,
+    center is the filter delay in the upsampled domain.
+    """
+    factor = max(up, down)
+    half = FILTER_ZERO_CROSSINGS * factor
+    n = np.arange(-half, half + 1, dtype=np.float64)
+    cutoff = FILTER_ROLLOFF / factor
+    h = cutoff * np.sinc(cutoff * n) * np.kaiser(2 * half + 1, FILTER_KAISER_BETA)
+    h *= up / h.sum()  # unity gain after zero-stuffing
+
+    taps = -(-len(h) // up)
+    h = np.concatenate([h, np.zeros(taps * up - len(h))])
+    bank = h.reshape(taps, up).T[:, ::-1]  # bank[p, k] = h[p + (taps-1-k) * up]
+    bank = np.ascontiguousarray(bank, dtype=np.float32)
+    bank.setflags(write=False)
+    return bank, half
+
+
+class Resampler:
+    """
+    Streaming polyphase resampler for mono float audio.
+
+    Call process() for each chunk and flush() once at the end; the output is
+    identical to resampling the whole signal at once (no boundary clicks).
+    """
+
+    def __init__(self, orig_sr: int, target_sr: int):
+        self.orig_sr = orig_sr
+        self.target_sr = target_sr
+        self.up, self.down = rate_ratio(orig_sr, target_sr)
+        self._bank, self._center = polyphase_filter(self.up, self.down)
+        self._taps = self._bank.shape[1]
+        self._history = np.zeros(self._taps - 1, dtype=np.float32)
+        self._consumed = 0      # input samples seen (including flush padding)
+        self._real_input = 0    # input samples seen (excluding flush padding)
+        self._produced = 0      # output samples emitted
+
+    @property
+    def passthrough(self) -> bool:
+        return self.up == self.down
+
+    def _run(self, x: np.ndarray, limit: int = None) -> np.ndarray:
+        buf = np.concatenate([self._history, x])
+        total = self._consumed + len(x)
+        # Output n needs input index (n*down + center) // up to be available
+        last = (total * self.up - 1 - self._center) // self.down
+        if limit is not None:
+            last = min(last, limit - 1)
+
+        if last >= self._produced:
+            n = np.arange(self._produced, last + 1, dtype=np.int64)
+            t = n * self.down + self._center
+            phase = t % self.up
+            # Window start inside buf for each output (buf[0] is input index consumed - (taps-1))
+            start = t // self.up - self._consumed
+            windows = sliding_window_view(buf, self._taps)
+            out = np.empty(len(n), dtype=np.float32)
+            for p in range(self.up):
+                sel = phase == p
+                if sel.any():
+                    out[sel] = windows[start[sel]] @ self._bank[p]
+            self._produced = last + 1
+        else:
+            out = np.zeros(0, dtype=np.float32)
+
+        self._history = buf[len(buf) - (self._taps - 1):] if self._taps > 1 else buf[:0]
+        self._consumed = total
+        return out
+
+    def process(self, chunk: np.ndarray) -> np.ndarray:
+        """Resample the next chunk of the stream."""
+        chunk = np.asarray(chunk, dtype=np.float32).reshape(-1)
+        if self.passthrough:
+            return chunk
+        self._real_input += len(chunk)
+        return self._run(chunk)
+
+    def flush(self) -> np.ndarray:
+        """Emit the remaining tail (the stream is zero-padded past its end)."""
+        if self.passthrough:
+            return np.zeros(0, dtype=np.float32)
+        expected = -(-self._real_input * self.up // self.down)
+        padding = np.zeros(self._center // self.up + self._taps, dtype=np.float32)
+        return self._run(padding, limit=expected)
+
+
+def resample(wav: np.ndarray, orig_sr: int, target_sr: int) -> np.ndarray:
+    """Resample a complete signal."""
+    resampler = Resampler(orig_sr, target_sr)
+    if resampler.passthrough:
+        return np.asarray(wav, dtype=np.float32).reshape(-1)
+    head = resampler.process(wav)
+    return np.concatenate([head, resampler.flush()])
@@ -0,0 +1,290 @@
+# coding=utf-8
+# Qwen3-TTS Inference Scheduler
+#
+# Requests wait for a free replica slot in a queue ordered by priority class
+# (interactive > standard > batch) and then by estimated cost (shortest job
+# first), so a long batch job does not sit in front of a live interview turn.
+# Waiting requests age: every SCHEDULER_AGING seconds of waiting promotes a
+# request by one class and halves its effective cost, so nothing starves.
+#
+# Requests may carry a deadline. Observed throughput (seconds per cost unit and
+# per codec token) is used to reject requests that cannot finish in time, to
+# drop queued requests whose deadline passes, and to cap max_new_tokens to
+# what fits the remaining budget.
+#
+# Within a class, tenants share the slots by weighted fair queuing: each
+# tenant accumulates virtual time (cost / weight) as its requests are
+# dispatched, and the waiter whose tenant would finish earliest goes next - a
+# noisy tenant's backlog only delays its own requests. A tenant that becomes
+# active again starts at the current virtual time, so idling earns no credit.
+
+import asyncio
+import itertools
+import time
+from typing import Callable, Dict, List, Optional
+
+import config
+from cancellation import DeadlineExceeded
+
+PRIORITY_CLASSES = ["interactive", "standard", "batch"]
+DEFAULT_PRIORITY = "standard"
+DEFAULT_TENANT = config.DEFAULT_TENANT
+
+
+def model_cost_factor(model_type: str) -> float:
+    """Relative per-character cost of a model (0.6B = 1.0; unsized aliases are 1.7B)."""
+    return 1.0 if "0.6b" in model_type else config.SCHEDULER_LARGE_MODEL_COST
+
+
+def estimate_cost(text, model_type: str) -> float:
+    """Estimated work of a request: total characters scaled by model size."""
+    chars = len(text) if isinstance(text, str) else sum(len(t) for t in text)
+    return float(chars) * model_cost_factor(model_type)
+
+
+class _Waiter:
+    __slots__ = ("seq", "model_type", "cost", "rank", "deadline", "tenant", "enqueued_at", "future")
+
+    def __init__(self, seq: int, model_type: str, cost: float, rank: int, deadline: Optional[float], tenant: str):
+        self.seq = seq
+        self.model_type = model_type
+        self.cost = cost
+        self.rank = rank
+        self.deadline = deadline
+        self.tenant = tenant
+        self.enqueued_at = time.time()
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class InferenceScheduler:
+    """
+    Admission queue in front of the replica slots (used from the event loop only).
+
+    pick(candidates, model_type) chooses among replicas with a free slot
+    (the model manager's load-aware routing); weight(tenant) is the tenant's
+    fair share (default 1 for everyone).
+    """
+
+    def __init__(self, replicas: list, pick: Callable, slots: int = None, aging: float = None,
+                 weight: Callable = None):
+        self.replicas = replicas
+        self._pick = pick
+        self._weight = weight or (lambda tenant: 1.0)
+        self.slots = slots or config.REPLICA_SLOTS
+        self.aging = aging or config.SCHEDULER_AGING
+        self._running: Dict[int, int] = {r.index: 0 for r in replicas}
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._stats = {p: {"dispatched": 0, "wait_time": 0.0, "max_wait": 0.0} for p in PRIORITY_CLASSES}
+        # Throughput EWMAs per model type: seconds per cost unit / per codec token
+        self._sec_per_cost: Dict[str, float] = {}
+        self._sec_per_token: Dict[str, float] = {}
+        self._audio_per_cost: Dict[str, float] = {}
+        self._running_cost = 0.0
+        # Weighted fair queuing: virtual time per tenant, queued + running requests per tenant
+        self._vtime: Dict[str, float] = {}
+        self._vclock = 0.0
+        self._tenant_queued: Dict[str, int] = {}
+        self._tenant_running: Dict[str, int] = {}
+        self.rejected = 0
+        self.expired = 0
+
+    def _free(self) -> list:
+        return [r for r in self.replicas if self._running[r.index] < self.slots]
+
+    def _order(self, waiter: _Waiter, now: float):
+        # Class first, then the tenant's virtual finish time (which orders a tenant's own jobs shortest first)
+        steps = (now - waiter.enqueued_at) / self.aging
+        finish = self._vtime.get(waiter.tenant, self._vclock) + waiter.cost * 0.5 ** steps / self._weight(waiter.tenant)
+        return (max(0, waiter.rank - int(steps)), finish, waiter.seq)
+
+    def _active(self, tenant: str) -> bool:
+        return self._tenant_queued.get(tenant, 0) + self._tenant_running.get(tenant, 0) > 0
+
+    def _count(self, counts: Dict[str, int], tenant: str, delta: int):
+        if not self._active(tenant) and delta > 0:
+            # (Re)activated tenant: no credit for the time it was idle
+            active = [v for t, v in self._vtime.items() if t != tenant and self._active(t)]
+            self._vtime[tenant] = max(self._vtime.get(tenant, 0.0), min(active, default=self._vclock))
+        counts[tenant] = counts.get(tenant, 0) + delta
+        if counts[tenant] <= 0:
+            del counts[tenant]
+        if not self._active(tenant) and self._vtime.get(tenant, 0.0) <= self._vclock:
+            self._vtime.pop(tenant, None)
+
+    def _start(self, candidates: list, model_type: str, cost: float, rank: int, waited: float, tenant: str):
+        replica = self._pick(candidates, model_type)
+        self._running[replica.index] += 1
+        self._running_cost += cost
+        self._count(self._tenant_running, tenant, 1)
+        start = self._vtime.get(tenant, self._vclock)
+        self._vclock = max(self._vclock, start)
+        self._vtime[tenant] = start + cost / self._weight(tenant)
+        stats = self._stats[PRIORITY_CLASSES[rank]]
+        stats["dispatched"] += 1
+        stats["wait_time"] += waited
+        stats["max_wait"] = max(stats["max_wait"], waited)
+        return replica
+
+    def estimate_wait(self, model_type: str, rank: int) -> float:
+        """Rough queueing delay: running work plus queued work of the same or higher class, spread over all slots."""
+        spc = self._sec_per_cost.get(model_type)
+        if spc is None:
+            return 0.0
+        ahead = self._running_cost + sum(w.cost for w in self._waiters if w.rank <= rank)
+        return ahead * spc / (len(self.replicas) * self.slots)
+
+    def estimate_run(self, model_type: str, cost: float) -> float:
+        spc = self._sec_per_cost.get(model_type)
+        return 0.0 if spc is None else cost * spc
+
+    async def acquire(self, model_type: str, cost: float, priority: str = DEFAULT_PRIORITY,
+                      deadline: Optional[float] = None, tenant: str = DEFAULT_TENANT):
+        """
+        Wait for a slot; returns the replica to run on (pair with release(replica, cost, tenant)).
+
+        Raises DeadlineExceeded if the request cannot finish before `deadline`
+        (absolute time), either up front or while it is queued.
+        """
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority: {priority}. Available: {PRIORITY_CLASSES}")
+        rank = PRIORITY_CLASSES.index(priority)
+
+        if deadline is not None:
+            budget = deadline - time.time()
+            needed = self.estimate_wait(model_type, rank) + self.estimate_run(model_type, cost)
+            if budget <= 0 or needed > budget:
+                self.rejected += 1
+                raise DeadlineExceeded(
+                    f"Request cannot finish before its deadline (needs ~{needed:.1f}s, {max(budget, 0):.1f}s left)"
+                )
+
+        free = self._free()
+        if free and not self._waiters:
+            return self._start(free, model_type, cost, rank, 0.0, tenant)
+
+        waiter = _Waiter(next(self._seq), model_type, cost, rank, deadline, tenant)
+        self._waiters.append(waiter)
+        self._count(self._tenant_queued, tenant, 1)
+        self._dispatch()
+        try:
+            if deadline is None:
+                return await waiter.future
+            return await asyncio.wait_for(asyncio.shield(waiter.future), timeout=max(0.0, deadline - time.time()))
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            queued = waiter in self._waiters
+            if queued:
+                self._waiters.remove(waiter)
+                self._count(self._tenant_queued, tenant, -1)
+                waiter.future.cancel()
+            elif waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                # Slot was granted just as the caller went away
+                self.release(waiter.future.result(), waiter.cost, tenant)
+            if deadline is not None and time.time() >= deadline:
+                if queued:
+                    self.expired += 1
+                raise DeadlineExceeded("Deadline passed while queued") from None
+            raise
+
+    def release(self, replica, cost: float = 0.0, tenant: str = DEFAULT_TENANT):
+        self._running[replica.index] -= 1
+        self._running_cost = max(0.0, self._running_cost - cost)
+        self._count(self._tenant_running, tenant, -1)
+        self._dispatch()
+
+    def observe(self, model_type: str, cost: float, elapsed: float, audio_seconds: float):
+        """Record a finished generation (feeds the deadline estimates)."""
+        alpha = config.SCHEDULER_EWMA_ALPHA
+        if cost > 0:
+            prev = self._sec_per_cost.get(model_type)
+            value = elapsed / cost
+            self._sec_per_cost[model_type] = value if prev is None else prev + alpha * (value - prev)
+        if cost > 0 and audio_seconds > 0:
+            prev = self._audio_per_cost.get(model_type)
+            value = audio_seconds / cost
+            self._audio_per_cost[model_type] = value if prev is None else prev + alpha * (value - prev)
+        tokens = audio_seconds * config.CODEC_FRAME_RATE
+        if tokens > 0:
+            prev = self._sec_per_token.get(model_type)
+            value = elapsed / tokens
+            self._sec_per_token[model_type] = value if prev is None else prev + alpha * (value - prev)
+
+    def estimate_audio(self, model_type: str, cost: float) -> Optional[float]:
+        """Expected output length in seconds (None until a generation has been observed)."""
+        apc = self._audio_per_cost.get(model_type)
+        return None if apc is None else cost * apc
+
+    def token_budget(self, model_type: str, deadline: Optional[float], max_new_tokens: int) -> int:
+        """
+        max_new_tokens capped to what can be decoded before the deadline.
+
+        Raises DeadlineExceeded if not even a minimal generation fits.
+        """
+        if deadline is None:
+            return max_new_tokens
+        remaining = deadline - time.time()
+        spt = self._sec_per_token.get(model_type)
+        if spt is None:
+            if remaining <= 0:
+                raise DeadlineExceeded("Deadline passed before generation started")
+            return max_new_tokens
+        fit = int(remaining * config.DEADLINE_SAFETY / spt)
+        if fit < config.DEADLINE_MIN_TOKENS:
+            raise DeadlineExceeded(f"Only ~{max(fit, 0)} codec tokens fit in the remaining {max(remaining, 0):.2f}s")
+        return min(max_new_tokens, fit)
+
+    def _dispatch(self):
+        """Hand free slots to the best waiters."""
+        while self._waiters:
+            free = self._free()
+            if not free:
+                return
+            now = time.time()
+            waiter = min(self._waiters, key=lambda w: self._order(w, now))
+            self._waiters.remove(waiter)
+            if waiter.future.done():
+                self._count(self._tenant_queued, waiter.tenant, -1)
+                continue
+            if waiter.deadline is not None and now >= waiter.deadline:
+                # Never hand a slot to a request nobody is waiting for any more
+                self.expired += 1
+                self._count(self._tenant_queued, waiter.tenant, -1)
+                waiter.future.set_exception(DeadlineExceeded("Deadline passed while queued"))
+                continue
+            # Start before dropping the queued count, so the tenant stays active throughout
+            waiter.future.set_result(
+                self._start(free, waiter.model_type, waiter.cost, waiter.rank, now - waiter.enqueued_at, waiter.tenant)
+            )
+            self._count(self._tenant_queued, waiter.tenant, -1)
+
+    def tenant_stats(self) -> Dict[str, dict]:
+        """Queued / running requests and virtual time lead of every active tenant."""
+        return {
+            t: {
+                "queued": self._tenant_queued.get(t, 0),
+                "running": self._tenant_running.get(t, 0),
+                "virtual_lead": round(self._vtime.get(t, self._vclock) - self._vclock, 1),
+            }
+            for t in set(self._tenant_queued) | set(self._tenant_running)
+        }
+
+    def get_stats(self) -> dict:
+        queued = {p: 0 for p in PRIORITY_CLASSES}
+        for waiter in self._waiters:
+            queued[PRIORITY_CLASSES[waiter.rank]] += 1
+        return {
+            "slots_per_replica": self.slots,
+            "running": sum(self._running.values()),
+            "queued": queued,
+            "deadline_rejected": self.rejected,
+            "deadline_expired": self.expired,
+            "sec_per_token": {k: round(v, 5) for k, v in self._sec_per_token.items()},
+            "classes": {
+                p: {
+                    "dispatched": s["dispatched"],
+                    "avg_wait": round(s["wait_time"] / s["dispatched"], 3) if s["dispatched"] else 0.0,
+                    "max_wait": round(s["max_wait"], 3),
+                }
+                for p, s in self._stats.items()
+            },
+        }
@@ -1,7 +1,7 @@
 # coding=utf-8
 # Qwen3-TTS API Schemas
 
-from typing import Optional, List, Union
+from typing import Literal, Optional, List, Union
 from pydantic import BaseModel, Field
 
 import config
@@ -26,9 +26,28 @@ class VoiceCloneRequest(BaseModel):
     x_vector_only_mode: bool = Field(default=True, description="Use x-vector only mode (recommended for stable voice cloning)")
     split_sentences: Optional[bool] = Field(default=None, description="Split text into sentences (None = auto-detect, True = always split, False = never split)")
     seed: Optional[int] = Field(default=None, description="Random seed for reproducible output (None = auto-generate)")
+    sample_rate: Optional[int] = Field(default=None, ge=8000, le=48000, description="Output sample rate in Hz, resampled server-side (None = model rate, 24000)")
+    priority: Literal["interactive", "standard", "batch"] = Field(default="standard", description="Scheduling class: interactive (live turns), standard, batch (pre-rendering)")
+    deadline_ms: Optional[int] = Field(default=None, ge=1, description="Time budget in ms from arrival; infeasible requests are rejected and late work aborted (also X-Deadline-Ms header)")
+    trim_silence: Optional[bool] = Field(default=None, description="Trim leading/trailing silence of each chunk (None = server default, TTS_TRIM_SILENCE)")
+    pause_ms: Optional[int] = Field(default=None, ge=0, le=2000, description="Pause between trimmed chunks in ms (None = TTS_SENTENCE_PAUSE_MS)")
     generation_params: Optional[GenerationParams] = None
 
 
+class VideoJobRequest(BaseModel):
+    """Request for an asynchronous lip-sync video job."""
+    text: str = Field(..., description="Text to speak")
+    avatar_path: str = Field(default="auto", description="Avatar path (precomputed/*.pkl) or 'auto'")
+    tts_engine: str = Field(default="qwen3tts", description="TTS engine (local, qwen3tts, cosyvoice, elevenlabs)")
+    tts_voice: str = Field(default="default", description="TTS voice for NewAvata engines")
+    quality: str = Field(default="medium", description="Quality (low, medium, high)")
+    ref_audio: Optional[str] = Field(default=None, description="Reference audio for local TTS (None = VIDEO_REF_AUDIO)")
+    ref_text: Optional[str] = Field(default=None, description="Reference transcript for local TTS (None = VIDEO_REF_TEXT)")
+    language: str = Field(default="Auto", description="Language for local TTS")
+    model_size: str = Field(default="0.6b", description="Model size for local TTS (0.6b, 1.7b)")
+    hls: bool = Field(default=False, description="Also publish an HLS playlist that grows as segments finish (tts_engine=local only)")
+
+
 class HealthResponse(BaseModel):
     """Health check response."""
     status: str
@@ -9,29 +9,60 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-import io
-import json
+import asyncio
 import base64
+import json
 import time
-import re
 import os
-from typing import List
+from typing import List, Optional
 from contextlib import asynccontextmanager
 
+import anyio
 import torch
-import soundfile as sf
 import numpy as np
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
+from fastapi.responses import Response, StreamingResponse, JSONResponse, FileResponse
 
 import config
 from models import model_manager
 from schemas import (
     VoiceCloneRequest,
+    VideoJobRequest,
     HealthResponse,
     GenerationParams,
 )
+from text_chunker import split_sentences, chunk_text
+from postprocess import postprocessor
+from singleflight import SingleFlight, request_key
+from scheduler import estimate_cost
+from profiling import profile_file, profiler
+from tenants import Charge, QuotaExceeded, estimate_audio_seconds, retry_after_header, tenant_registry
+from traffic import traffic_recorder
+from artifacts import RangeNotSatisfiable, artifact_store, artifact_url, etag_matches, iter_file, parse_range
+from cancellation import (
+    CancelToken,
+    DeadlineExceeded,
+    GenerationCancelled,
+    cancel_scope,
+    cancel_stats,
+    current_token,
+    deadline_from_ms,
+)
+from audio_io import (
+    MULTIPART_BOUNDARY,
+    iter_memoryview,
+    build_manifest,
+    iter_multipart,
+    iter_tar,
+    float_to_int16,
+)
+from resample import Resampler
+from silence import pause_after, trim_silence
+
+
+# (grpc.aio server, servicer) while the gRPC API is running
+grpc_service = None
 
 
 @asynccontextmanager
@@ -39,18 +70,38 @@ async def lifespan(app: FastAPI):
     """Load models on startup."""
     print("=" * 50)
     print("Qwen3-TTS Server Starting...")
-    print(f"Device: {config.DEVICE}")
+    print(f"Devices: {', '.join(r.device for r in model_manager.replicas)}")
     print(f"Dtype: {config.DTYPE}")
+    cpu_replicas = [r for r in model_manager.replicas if r.is_cpu]
+    if cpu_replicas:
+        print(f"CPU replicas: {config.CPU_DTYPE}, quantization={config.CPU_QUANTIZE}, "
+              f"{cpu_replicas[0].threads} thread(s) each")
     print(f"Flash Attention: {config.USE_FLASH_ATTENTION}")
     print("=" * 50)
 
     model_manager.load_default_models()
 
+    # gRPC API in the same event loop (shares models, scheduler and caches)
+    global grpc_service
+    if config.GRPC_ENABLED:
+        try:
+            from grpc_server import start_grpc_server
+            grpc_service = await start_grpc_server(iter_pcm_chunks)
+        except Exception as e:
+            # Missing grpcio / grpcio-tools, or tts.proto failing to load: keep serving HTTP
+            print(f"[gRPC] Disabled: {type(e).__name__}: {e}")
+
     print("=" * 50)
     print("Server ready!")
     print("=" * 50)
     yield
     print("Server shutting down...")
+    if grpc_service is not None:
+        await grpc_service[0].stop(grace=5)
+    postprocessor.shutdown()
+    traffic_recorder.close()
+    if video_gen is not None:
+        await video_gen.aclose()
 
 
 app = FastAPI(
@@ -71,26 +122,6 @@ app.add_middleware(
 
 # ============== Helpers ==============
 
-def split_into_sentences(text: str) -> List[str]:
-    """Split text into sentences for Korean/English."""
-    # Korean sentence endings: . ? ! and their combinations
-    # Also handle cases like "... " or "?? "
-    pattern = r'[.!?]+[\s]+'
-    sentences = re.split(pattern, text)
-    # Filter out empty strings and strip whitespace
-    sentences = [s.strip() for s in sentences if s.strip()]
-
-    # If no split occurred (no sentence endings), return original text
-    if len(sentences) == 0:
-        sentences = [text.strip()]
-
-    print(f"[DEBUG] Split text into {len(sentences)} sentence(s)")
-    for i, sent in enumerate(sentences):
-        print(f"[DEBUG] Sentence {i}: '{sent[:50]}...'")
-
-    return sentences
-
-
 def get_generation_kwargs(params: GenerationParams = None) -> dict:
     """Convert generation params to kwargs."""
     if params is None:
@@ -105,31 +136,161 @@ def get_generation_kwargs(params: GenerationParams = None) -> dict:
     }
 
 
-def audio_to_base64(wav: np.ndarray, sample_rate: int) -> str:
-    """Convert audio array to base64 encoded WAV."""
-    buffer = io.BytesIO()
-    sf.write(buffer, wav, sample_rate, format="WAV")
-    buffer.seek(0)
-    return base64.b64encode(buffer.read()).decode("utf-8")
+BATCH_RESPONSE_FORMATS = ["json", "multipart", "tar", "url"]
+
+# In-flight generations shared by identical concurrent requests
+inflight = SingleFlight()
+
 
+def request_deadline(request: VoiceCloneRequest, header_ms: Optional[int]) -> Optional[float]:
+    """Absolute deadline from the body's deadline_ms and/or the X-Deadline-Ms header (the tighter one wins)."""
+    budgets = [ms for ms in (request.deadline_ms, header_ms) if ms is not None and ms > 0]
+    return deadline_from_ms(min(budgets)) if budgets else None
 
-def create_wav_response(wavs: List[np.ndarray], sample_rate: int, single: bool = False, generation_time: float = 0.0):
-    """Create response with audio data."""
-    if single and len(wavs) == 1:
-        buffer = io.BytesIO()
-        sf.write(buffer, wavs[0], sample_rate, format="WAV")
-        buffer.seek(0)
+
+async def run_cancellable(replica, token: CancelToken, expected_audio: Optional[float], fn, *args):
+    """
+    Run fn(*args) on a replica in a worker thread under a CancelToken.
+
+    If the awaiting task is cancelled (every client of the generation went away),
+    the token is cancelled so the worker stops at its next sentence / decode step,
+    and the caller returns at once, releasing the replica slot.
+    """
+    with cancel_scope(token):
+        try:
+            return await anyio.to_thread.run_sync(replica.call, fn, *args, abandon_on_cancel=True)
+        except asyncio.CancelledError:
+            token.cancel("client disconnected")
+            cancel_stats.record(token.reason, expected_audio, token)
+            raise
+        except GenerationCancelled:
+            cancel_stats.record("deadline" if token.reason is None else token.reason, expected_audio, token)
+            raise
+
+
+async def cancel_on_disconnect(http_request: Request, coro):
+    """Await coro, cancelling it (and raising GenerationCancelled) if the client disconnects first."""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=config.DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                task.cancel()
+                raise GenerationCancelled("client disconnected")
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+
+def voice_clone_key(endpoint: str, model_key: str, request: VoiceCloneRequest, deadline: Optional[float],
+                    tenant: str, **extra) -> str:
+    """
+    Dedupe key: everything that determines the generated audio (text, voice, params, seed, output rate).
+
+    The shared generation runs under the first caller's deadline (token budget, abort time) and
+    tenant (fair share), so both are part of the key: a request only attaches to a generation
+    with the same constraints. In practice requests with a deadline are not deduplicated.
+    """
+    return request_key(endpoint, model_key, request.model_dump(), deadline, tenant, extra)
+
+
+def should_trim(request: VoiceCloneRequest) -> bool:
+    """Per-request trim_silence, defaulting to TTS_TRIM_SILENCE."""
+    return config.TRIM_SILENCE if request.trim_silence is None else request.trim_silence
+
+
+async def create_wav_response(
+    wavs: List[np.ndarray],
+    sample_rate: int,
+    single: bool = False,
+    generation_time: float = 0.0,
+    response_format: str = "json",
+    silence: Optional[tuple] = None,
+):
+    """
+    Create response with audio data.
+
+    - single=True: all chunks are written into one preallocated WAV buffer and
+      streamed as memoryview slices (no BytesIO / np.concatenate copies).
+    - single=False: one WAV per item, as
+        - "json": base64 WAV list in a JSON body
+        - "multipart": multipart/mixed stream (JSON manifest part + one audio/wav part per item)
+        - "tar": uncompressed tar stream (manifest.json + audio_<i>.wav)
+    - response_format="url" (single or list): JSON with audio_url(s) only, no audio in the body
+
+    With the artifact store enabled, WAV and JSON responses also carry the audio's URL
+    (X-Audio-Url header / audio_urls field). silence=(seconds removed, seconds of pause added)
+    from trim_silence is reported as X-Silence-Removed / X-Pause-Added headers and JSON fields.
+    """
+    headers = {
+        "X-Generation-Time": f"{generation_time:.3f}",
+        "Access-Control-Expose-Headers": "X-Generation-Time, X-Audio-Url, X-Silence-Removed, X-Pause-Added",
+    }
+    silence_fields = {}
+    if silence is not None:
+        headers["X-Silence-Removed"] = f"{silence[0]:.3f}"
+        headers["X-Pause-Added"] = f"{silence[1]:.3f}"
+        silence_fields = {"silence_removed": round(silence[0], 3), "pause_added": round(silence[1], 3)}
+    if response_format == "url":
+        if artifact_store is None:
+            raise HTTPException(status_code=400, detail="response_format=url needs the artifact store (TTS_ARTIFACTS=true)")
+        buffers = [await postprocessor.encode_wav(wavs, sample_rate)] if single else await encode_items(wavs, sample_rate)
+        urls = [artifact_url(await artifact_store.put(b)) for b in buffers]
+        body = {
+            "success": True,
+            "sample_rate": sample_rate,
+            "duration": round(sum(len(w) for w in wavs) / sample_rate, 3),
+            "generation_time": generation_time,
+            **silence_fields,
+        }
+        body.update({"audio_url": urls[0]} if single else {"audio_count": len(urls), "audio_urls": urls})
+        return JSONResponse(body, headers=headers)
+    if single:
+        wav_view = memoryview(await postprocessor.encode_wav(wavs, sample_rate))
+        if artifact_store is not None:
+            headers["X-Audio-Url"] = artifact_url(await artifact_store.put(wav_view))
         return StreamingResponse(
-            buffer,
+            iter_memoryview(wav_view),
             media_type="audio/wav",
             headers={
                 "Content-Disposition": "attachment; filename=output.wav",
-                "X-Generation-Time": f"{generation_time:.3f}",
-                "Access-Control-Expose-Headers": "X-Generation-Time",
+                "Content-Length": str(len(wav_view)),
+                **headers,
             }
         )
+    elif response_format == "multipart":
+        manifest = build_manifest(wavs, sample_rate, generation_time)
+        return StreamingResponse(
+            iter_multipart(wavs, sample_rate, manifest, encode=postprocessor.encode_wav_sync),
+            media_type=f"multipart/mixed; boundary={MULTIPART_BOUNDARY}",
+            headers=headers,
+        )
+    elif response_format == "tar":
+        manifest = build_manifest(wavs, sample_rate, generation_time)
+        return StreamingResponse(
+            iter_tar(wavs, sample_rate, manifest, encode=postprocessor.encode_wav_sync),
+            media_type="application/x-tar",
+            headers={"Content-Disposition": "attachment; filename=output.tar", **headers},
+        )
+    elif artifact_store is not None:
+        # Encode once; the same WAV bytes are stored and sent as base64
+        buffers = await encode_items(wavs, sample_rate)
+        urls = [artifact_url(await artifact_store.put(b)) for b in buffers]
+        audio_data = await anyio.to_thread.run_sync(lambda: [base64.b64encode(b).decode("ascii") for b in buffers])
+        return JSONResponse({
+            "success": True,
+            "message": f"Generated {len(wavs)} audio(s)",
+            "sample_rate": sample_rate,
+            "audio_count": len(wavs),
+            "audio_data": audio_data,
+            "audio_urls": urls,
+            "generation_time": generation_time,
+            **silence_fields,
+        })
     else:
-        audio_data = [audio_to_base64(wav, sample_rate) for wav in wavs]
+        audio_data = await postprocessor.wav_to_base64(wavs, sample_rate)
         return JSONResponse({
             "success": True,
             "message": f"Generated {len(wavs)} audio(s)",
@@ -137,9 +298,55 @@ def create_wav_response(wavs: List[np.ndarray], sample_rate: int, single: bool =
             "audio_count": len(wavs),
             "audio_data": audio_data,
             "generation_time": generation_time,
+            **silence_fields,
         })
 
 
+async def encode_items(wavs: List[np.ndarray], sample_rate: int) -> list:
+    """One WAV buffer per item, encoded in parallel in the post-processing pool."""
+    return list(await asyncio.gather(*(postprocessor.encode_wav([wav], sample_rate) for wav in wavs)))
+
+
+@app.api_route("/audio/{artifact_id}.wav", methods=["GET", "HEAD"])
+async def get_audio_artifact(artifact_id: str, request: Request):
+    """
+    Stored audio by content address (audio_url in TTS responses; TTS_ARTIFACTS=true).
+
+    Supports single byte ranges (206 / 416), If-Range and If-None-Match (304); the
+    content behind a URL never changes, so it may be cached until it expires here.
+    """
+    found = artifact_store.get(artifact_id) if artifact_store is not None else None
+    if found is None:
+        raise HTTPException(status_code=404, detail="Audio not found or expired")
+    path, size = found
+    etag = f'"{artifact_id}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": f"public, max-age={int(config.ARTIFACT_TTL)}, immutable",
+        "Access-Control-Expose-Headers": "ETag, Content-Range, Accept-Ranges",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    try:
+        byte_range = parse_range(request.headers.get("range"), size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    if byte_range is not None and request.headers.get("if-range", etag) != etag:
+        byte_range = None  # Resuming a different version: send it whole
+
+    start, end = byte_range or (0, size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    status_code = 200
+    if byte_range is not None:
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type="audio/wav")
+    return StreamingResponse(iter_file(path, start, end - start + 1), status_code=status_code,
+                             media_type="audio/wav", headers=headers)
+
+
 # ============== Health & Info ==============
 
 @app.get("/", response_model=HealthResponse)
@@ -159,9 +366,88 @@ async def get_info():
         "available_models": list(config.MODELS.keys()),
         "available_speakers": config.AVAILABLE_SPEAKERS,
         "supported_languages": config.SUPPORTED_LANGUAGES,
+        "devices": [r.device for r in model_manager.replicas],
+    }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Runtime stats: per-replica outstanding work, active/completed requests, busy time, tenant usage."""
+    return {
+        "replicas": model_manager.get_replica_stats(),
+        "postprocess": postprocessor.get_stats(),
+        "dedupe": inflight.get_stats(),
+        "scheduler": model_manager.scheduler.get_stats(),
+        "cancellation": cancel_stats.get_stats(),
+        "tenants": tenant_registry.get_stats(model_manager.scheduler.tenant_stats()),
+        "traffic_recorder": traffic_recorder.get_stats(),
+        "artifacts": artifact_store.get_stats() if artifact_store is not None else None,
+        "grpc": grpc_service[1].get_stats() if grpc_service is not None else None,
+        "video_jobs": video_jobs.get_stats() if video_jobs is not None else None,
+        "video_metadata_cache": video_gen.metadata_cache.get_stats() if video_gen is not None else None,
+        "video_audio_ring": video_gen.audio_ring.get_stats() if video_gen is not None and video_gen.audio_ring else None,
     }
 
 
+def require_admin(x_admin_token: Optional[str]):
+    """Admin endpoints need TTS_ADMIN_TOKEN to be configured and sent as X-Admin-Token."""
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (set TTS_ADMIN_TOKEN)")
+    if x_admin_token != config.ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@app.post("/admin/profile")
+async def start_profile(
+    requests: int = 10,
+    seconds: float = 60.0,
+    x_admin_token: Optional[str] = Header(default=None),
+):
+    """
+    Profile the next `requests` generations or `seconds` seconds, whichever ends first.
+
+    A generation is one replica call: a whole /tts/voice_clone request, but one text
+    chunk of a streaming request (PCM stream, gRPC, local video).
+
+    Each traced generation produces a torch.profiler Chrome trace; the session also
+    writes a Python sampling profile (speedscope) of all server threads.
+    """
+    require_admin(x_admin_token)
+    if requests < 1 or seconds <= 0:
+        raise HTTPException(status_code=400, detail="requests must be >= 1 and seconds > 0")
+    try:
+        session = profiler.start(requests, seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return session.get_info()
+
+
+@app.get("/admin/profile")
+async def get_profile(x_admin_token: Optional[str] = Header(default=None)):
+    """Running and recent profiling sessions with their download URLs."""
+    require_admin(x_admin_token)
+    return profiler.get_info()
+
+
+@app.post("/admin/profile/stop")
+async def stop_profile(x_admin_token: Optional[str] = Header(default=None)):
+    """End the running session early (files are written once in-flight traces finish)."""
+    require_admin(x_admin_token)
+    session = profiler.stop()
+    if session is None:
+        raise HTTPException(status_code=404, detail="No profiling session is running")
+    return session.get_info()
+
+
+@app.get("/admin/profile/{session_id}/{name}")
+async def download_profile(session_id: str, name: str, x_admin_token: Optional[str] = Header(default=None)):
+    require_admin(x_admin_token)
+    path = profile_file(session_id, name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile file not found")
+    return FileResponse(path, media_type="application/json", filename=name)
+
+
 @app.post("/load/{model_type}")
 async def load_model(model_type: str):
     try:
@@ -173,249 +459,422 @@ async def load_model(model_type: str):
 
 # ============== TTS Endpoints ==============
 
-@app.post("/tts/voice_clone")
-async def generate_voice_clone(request: VoiceCloneRequest, model_size: str = "0.6b"):
+def _voice_clone_sync(replica, model_key: str, request: VoiceCloneRequest, gen_kwargs: dict):
     """
-    Generate speech by cloning a reference voice.
-
-    - model_size: "0.6b" (faster) or "1.7b" (higher quality)
+    Run voice clone generation on a model replica (called in a worker thread).
 
-    Splits text into sentences and generates each sentence separately to prevent truncation,
-    then concatenates all audio chunks into a single file.
+    Returns (wavs, sample_rate, generation_time, single); single=True means the
+    wavs are consecutive chunks of one output.
     """
-    try:
-        model_key = f"base_{model_size}" if model_size in ["0.6b", "1.7b"] else "base"
-        model = model_manager.get_model(model_key)
-        gen_kwargs = get_generation_kwargs(request.generation_params)
+    model = replica.models[model_key]
 
-        torch.cuda.synchronize()
-        t0 = time.time()
+    replica.synchronize()
+    t0 = time.time()
 
-        # Handle single string input
-        if isinstance(request.text, str):
-            input_text = request.text
-            print(f"[DEBUG] Input text: '{input_text[:100]}...'")
+    # Handle single string input
+    if isinstance(request.text, str):
+        input_text = request.text
+        print(f"[DEBUG] Input text: '{input_text[:100]}...'")
 
-            # Auto-detect split_sentences if not specified
-            # Default: single block for short text, split for long text
-            sentences = split_into_sentences(input_text)
-            text_length = len(input_text)
-            sentence_count = len(sentences)
+        # Auto-detect split_sentences if not specified
+        # Default: single block for short text, split for long text
+        text_length = len(input_text)
+        sentence_count = len(split_sentences(input_text))
 
-            if request.split_sentences is None:
-                # Auto-detect: split only if text is very long (>500 chars) or has many sentences (>5)
-                should_split = text_length > 500 or sentence_count > 5
-                print(f"[DEBUG] Auto-detect: text_length={text_length}, sentences={sentence_count} -> split={should_split}")
-            else:
-                should_split = request.split_sentences
-                print(f"[DEBUG] User specified: split_sentences={should_split}")
-
-            # Option 1: Generate as single block (no sentence splitting)
-            if not should_split:
-                print(f"[DEBUG] Generating as single block (no sentence split)")
-                print(f"[DEBUG] ref_audio: {request.ref_audio}")
-                print(f"[DEBUG] ref_text: {request.ref_text}")
-
-                # Force x_vector_only_mode=True for stable voice cloning
-                # ICL mode (x_vector_only_mode=False) can be unstable
-                use_x_vector_only = True
-                print(f"[DEBUG] x_vector_only_mode: {use_x_vector_only} (forced for stability)")
-
-                # Pre-compute voice clone prompt for consistent voice cloning
-                # This extracts speaker embedding (x-vector) and reference speech codes
-                print(f"[DEBUG] Pre-computing voice clone prompt for single block...")
-                try:
-                    voice_clone_prompt = model.create_voice_clone_prompt(
-                        ref_audio=request.ref_audio,
-                        ref_text=request.ref_text,
-                        x_vector_only_mode=use_x_vector_only,
-                    )
-
-                    if voice_clone_prompt and len(voice_clone_prompt) > 0:
-                        prompt_item = voice_clone_prompt[0]
-                        if hasattr(prompt_item, 'ref_spk_embedding') and prompt_item.ref_spk_embedding is not None:
-                            emb_shape = prompt_item.ref_spk_embedding.shape
-                            print(f"[DEBUG] Voice clone prompt created:")
-                            print(f"[DEBUG]   - Speaker embedding shape: {emb_shape}")
-                            print(f"[DEBUG]   - x_vector_only_mode: {prompt_item.x_vector_only_mode}")
-                            print(f"[DEBUG]   - icl_mode: {prompt_item.icl_mode}")
-                            print(f"[DEBUG]   - ref_code: {'present' if prompt_item.ref_code is not None else 'None'}")
-
-                            # Generate with pre-computed voice clone prompt
-                            wavs, sr = model.generate_voice_clone(
-                                text=input_text,
-                                language=request.language,
-                                voice_clone_prompt=voice_clone_prompt,
-                                non_streaming_mode=True,
-                                **gen_kwargs,
-                            )
-                        else:
-                            raise ValueError("Voice clone prompt has no speaker embedding")
-                    else:
-                        raise ValueError("Voice clone prompt is empty")
-
-                except Exception as e:
-                    print(f"[DEBUG] WARNING: Failed to create voice clone prompt: {e}")
-                    print(f"[DEBUG] Falling back to direct ref_audio mode")
-                    import traceback
-                    traceback.print_exc()
-
-                    # Fallback: direct ref_audio mode (less reliable)
-                    wavs, sr = model.generate_voice_clone(
-                        text=input_text,
-                        language=request.language,
-                        ref_audio=request.ref_audio,
-                        ref_text=request.ref_text,
-                        x_vector_only_mode=use_x_vector_only,
-                        non_streaming_mode=True,
-                        **gen_kwargs,
-                    )
-
-                torch.cuda.synchronize()
-                gen_time = time.time() - t0
-                print(f"[VoiceClone] Generated in {gen_time:.3f}s (single block)")
-                return create_wav_response(wavs, sr, single=True, generation_time=gen_time)
+        if request.split_sentences is None:
+            # Auto-detect: split only if text is very long (>500 chars) or has many sentences (>5)
+            should_split = text_length > 500 or sentence_count > 5
+            print(f"[DEBUG] Auto-detect: text_length={text_length}, sentences={sentence_count} -> split={should_split}")
+        else:
+            should_split = request.split_sentences
+            print(f"[DEBUG] User specified: split_sentences={should_split}")
 
-            # Option 2: Split into sentences (for long text)
-            print(f"[DEBUG] Splitting into {sentence_count} sentences for long text")
+        # Option 1: Generate as single block (no sentence splitting)
+        if not should_split:
+            print(f"[DEBUG] Generating as single block (no sentence split)")
+            print(f"[DEBUG] ref_audio: {request.ref_audio}")
+            print(f"[DEBUG] ref_text: {request.ref_text}")
 
             # Force x_vector_only_mode=True for stable voice cloning
+            # ICL mode (x_vector_only_mode=False) can be unstable
             use_x_vector_only = True
             print(f"[DEBUG] x_vector_only_mode: {use_x_vector_only} (forced for stability)")
 
-            # ROOT CAUSE FIX: Pre-compute voice clone prompt once
+            # Pre-compute voice clone prompt for consistent voice cloning
             # This extracts speaker embedding (x-vector) and reference speech codes
-            # in a single pass, ensuring consistent voice characteristics across all sentences.
-            #
-            # Why this fixes the first sentence issue:
-            # - Speaker embedding is computed once and cached
-            # - All sentences use the same pre-computed voice features
-            # - Eliminates per-sentence embedding extraction inconsistency
-            print(f"[DEBUG] Pre-computing voice clone prompt (speaker embedding)...")
-            voice_clone_prompt = None
-            use_precomputed_prompt = False
-
+            print(f"[DEBUG] Getting voice clone prompt for single block (cached per voice)...")
             try:
-                voice_clone_prompt = model.create_voice_clone_prompt(
-                    ref_audio=request.ref_audio,
-                    ref_text=request.ref_text,
-                    x_vector_only_mode=use_x_vector_only,
+                voice_clone_prompt = replica.get_voice_clone_prompt(
+                    model_key, request.ref_audio, request.ref_text, use_x_vector_only
                 )
 
-                # Validate the prompt was created correctly
                 if voice_clone_prompt and len(voice_clone_prompt) > 0:
                     prompt_item = voice_clone_prompt[0]
-                    # Check that speaker embedding exists and has reasonable shape
                     if hasattr(prompt_item, 'ref_spk_embedding') and prompt_item.ref_spk_embedding is not None:
                         emb_shape = prompt_item.ref_spk_embedding.shape
-                        print(f"[DEBUG] Voice clone prompt created successfully:")
+                        print(f"[DEBUG] Voice clone prompt created:")
                         print(f"[DEBUG]   - Speaker embedding shape: {emb_shape}")
                         print(f"[DEBUG]   - x_vector_only_mode: {prompt_item.x_vector_only_mode}")
                         print(f"[DEBUG]   - icl_mode: {prompt_item.icl_mode}")
                         print(f"[DEBUG]   - ref_code: {'present' if prompt_item.ref_code is not None else 'None'}")
-                        use_precomputed_prompt = True
+
+                        # Generate with pre-computed voice clone prompt
+                        wavs, sr = model.generate_voice_clone(
+                            text=input_text,
+                            language=request.language,
+                            voice_clone_prompt=voice_clone_prompt,
+                            non_streaming_mode=True,
+                            **gen_kwargs,
+                        )
                     else:
-                        print(f"[DEBUG] WARNING: Voice clone prompt has no speaker embedding!")
-                        voice_clone_prompt = None
+                        raise ValueError("Voice clone prompt has no speaker embedding")
                 else:
-                    print(f"[DEBUG] WARNING: Voice clone prompt is empty!")
-                    voice_clone_prompt = None
+                    raise ValueError("Voice clone prompt is empty")
 
+            except GenerationCancelled:
+                raise
             except Exception as e:
-                print(f"[DEBUG] ERROR: Failed to create voice clone prompt: {e}")
+                print(f"[DEBUG] WARNING: Failed to create voice clone prompt: {e}")
+                print(f"[DEBUG] Falling back to direct ref_audio mode")
                 import traceback
                 traceback.print_exc()
+
+                # Fallback: direct ref_audio mode (less reliable)
+                wavs, sr = model.generate_voice_clone(
+                    text=input_text,
+                    language=request.language,
+                    ref_audio=request.ref_audio,
+                    ref_text=request.ref_text,
+                    x_vector_only_mode=use_x_vector_only,
+                    non_streaming_mode=True,
+                    **gen_kwargs,
+                )
+
+            replica.synchronize()
+            gen_time = time.time() - t0
+            print(f"[VoiceClone] Generated in {gen_time:.3f}s (single block)")
+            return wavs, sr, gen_time, True
+
+        # Option 2: Split into budgeted chunks (for long text)
+        # Sentences are packed into chunks of similar size; the first chunk is kept short
+        sentences = chunk_text(input_text)
+        print(f"[DEBUG] Splitting {sentence_count} sentences into {len(sentences)} chunks for long text")
+
+        # Force x_vector_only_mode=True for stable voice cloning
+        use_x_vector_only = True
+        print(f"[DEBUG] x_vector_only_mode: {use_x_vector_only} (forced for stability)")
+
+        # ROOT CAUSE FIX: Pre-compute voice clone prompt once
+        # This extracts speaker embedding (x-vector) and reference speech codes
+        # in a single pass, ensuring consistent voice characteristics across all sentences.
+        #
+        # Why this fixes the first sentence issue:
+        # - Speaker embedding is computed once and cached
+        # - All sentences use the same pre-computed voice features
+        # - Eliminates per-sentence embedding extraction inconsistency
+        print(f"[DEBUG] Getting voice clone prompt (speaker embedding, cached per voice)...")
+        voice_clone_prompt = None
+        use_precomputed_prompt = False
+
+        try:
+            voice_clone_prompt = replica.get_voice_clone_prompt(
+                model_key, request.ref_audio, request.ref_text, use_x_vector_only
+            )
+
+            # Validate the prompt was created correctly
+            if voice_clone_prompt and len(voice_clone_prompt) > 0:
+                prompt_item = voice_clone_prompt[0]
+                # Check that speaker embedding exists and has reasonable shape
+                if hasattr(prompt_item, 'ref_spk_embedding') and prompt_item.ref_spk_embedding is not None:
+                    emb_shape = prompt_item.ref_spk_embedding.shape
+                    print(f"[DEBUG] Voice clone prompt created successfully:")
+                    print(f"[DEBUG]   - Speaker embedding shape: {emb_shape}")
+                    print(f"[DEBUG]   - x_vector_only_mode: {prompt_item.x_vector_only_mode}")
+                    print(f"[DEBUG]   - icl_mode: {prompt_item.icl_mode}")
+                    print(f"[DEBUG]   - ref_code: {'present' if prompt_item.ref_code is not None else 'None'}")
+                    use_precomputed_prompt = True
+                else:
+                    print(f"[DEBUG] WARNING: Voice clone prompt has no speaker embedding!")
+                    voice_clone_prompt = None
+            else:
+                print(f"[DEBUG] WARNING: Voice clone prompt is empty!")
                 voice_clone_prompt = None
-                use_precomputed_prompt = False
 
-            if not use_precomputed_prompt:
-                print(f"[DEBUG] WARNING: Falling back to per-sentence mode (may cause voice inconsistency)")
+        except Exception as e:
+            print(f"[DEBUG] ERROR: Failed to create voice clone prompt: {e}")
+            import traceback
+            traceback.print_exc()
+            voice_clone_prompt = None
+            use_precomputed_prompt = False
 
-            # Set random seed for reproducibility within this request
-            # This ensures consistent voice characteristics across all sentences
-            if request.seed is not None:
-                request_seed = request.seed
-                print(f"[DEBUG] Using user-provided seed: {request_seed}")
+        if not use_precomputed_prompt:
+            print(f"[DEBUG] WARNING: Falling back to per-sentence mode (may cause voice inconsistency)")
+
+        # Set random seed for reproducibility within this request
+        # This ensures consistent voice characteristics across all sentences
+        if request.seed is not None:
+            request_seed = request.seed
+            print(f"[DEBUG] Using user-provided seed: {request_seed}")
+        else:
+            request_seed = int(time.time() * 1000) % (2**31)
+            print(f"[DEBUG] Using auto-generated seed: {request_seed}")
+
+        # Generate each sentence separately
+        all_wavs = []
+        token = current_token()
+        for i, sentence in enumerate(sentences):
+            if token is not None:
+                token.check()
+            print(f"[DEBUG] Generating sentence {i+1}/{len(sentences)}: '{sentence[:50]}...'")
+
+            # Set seed before each generation for reproducibility
+            torch.manual_seed(request_seed + i)
+            if torch.cuda.is_available():
+                torch.cuda.manual_seed(request_seed + i)
+
+            if use_precomputed_prompt:
+                # Use pre-computed voice clone prompt (fundamental fix)
+                print(f"[DEBUG]   Using PRECOMPUTED prompt (consistent voice)")
+                wavs, sr = model.generate_voice_clone(
+                    text=sentence,
+                    language=request.language,
+                    voice_clone_prompt=voice_clone_prompt,  # Pre-computed prompt
+                    non_streaming_mode=True,
+                    **gen_kwargs,
+                )
             else:
-                request_seed = int(time.time() * 1000) % (2**31)
-                print(f"[DEBUG] Using auto-generated seed: {request_seed}")
-
-            # Generate each sentence separately
-            all_wavs = []
-            for i, sentence in enumerate(sentences):
-                print(f"[DEBUG] Generating sentence {i+1}/{len(sentences)}: '{sentence[:50]}...'")
-
-                # Set seed before each generation for reproducibility
-                torch.manual_seed(request_seed + i)
-                if torch.cuda.is_available():
-                    torch.cuda.manual_seed(request_seed + i)
-
-                if use_precomputed_prompt:
-                    # Use pre-computed voice clone prompt (fundamental fix)
-                    print(f"[DEBUG]   Using PRECOMPUTED prompt (consistent voice)")
-                    wavs, sr = model.generate_voice_clone(
-                        text=sentence,
-                        language=request.language,
-                        voice_clone_prompt=voice_clone_prompt,  # Pre-computed prompt
-                        non_streaming_mode=True,
-                        **gen_kwargs,
-                    )
-                else:
-                    # Fallback: per-sentence extraction (may cause first sentence issue)
-                    print(f"[DEBUG]   Using PER-SENTENCE extraction (may cause voice mismatch)")
-                    wavs, sr = model.generate_voice_clone(
-                        text=sentence,
-                        language=request.language,
-                        ref_audio=request.ref_audio,
-                        ref_text=request.ref_text,
-                        x_vector_only_mode=use_x_vector_only,
-                        non_streaming_mode=True,
-                        **gen_kwargs,
-                    )
+                # Fallback: per-sentence extraction (may cause first sentence issue)
+                print(f"[DEBUG]   Using PER-SENTENCE extraction (may cause voice mismatch)")
+                wavs, sr = model.generate_voice_clone(
+                    text=sentence,
+                    language=request.language,
+                    ref_audio=request.ref_audio,
+                    ref_text=request.ref_text,
+                    x_vector_only_mode=use_x_vector_only,
+                    non_streaming_mode=True,
+                    **gen_kwargs,
+                )
 
-                # Each sentence returns a list of wavs, take the first one
-                if len(wavs) > 0:
-                    all_wavs.append(wavs[0])
-                    print(f"[DEBUG]   Sentence {i+1} audio: shape={wavs[0].shape}, duration={len(wavs[0])/sr:.2f}s")
+            # Each sentence returns a list of wavs, take the first one
+            if len(wavs) > 0:
+                all_wavs.append(wavs[0])
+                print(f"[DEBUG]   Sentence {i+1} audio: shape={wavs[0].shape}, duration={len(wavs[0])/sr:.2f}s")
 
-            torch.cuda.synchronize()
-            gen_time = time.time() - t0
+        replica.synchronize()
+        gen_time = time.time() - t0
 
-            print(f"[DEBUG] Generated {len(all_wavs)} sentence audio(s)")
+        print(f"[DEBUG] Generated {len(all_wavs)} sentence audio(s)")
 
-            # Concatenate all sentence audios
-            if len(all_wavs) > 1:
-                print(f"[DEBUG] Concatenating {len(all_wavs)} sentence audios")
-                combined = np.concatenate(all_wavs)
-                wavs = [combined]
-                print(f"[DEBUG] Combined audio duration: {len(combined)/sr:.2f}s")
-            elif len(all_wavs) == 1:
-                wavs = all_wavs
-            else:
-                raise ValueError("No audio generated")
+        # Sentence audios are written back to back into a single WAV buffer
+        if len(all_wavs) == 0:
+            raise ValueError("No audio generated")
+        total_samples = sum(len(w) for w in all_wavs)
+        print(f"[DEBUG] Combined audio duration: {total_samples/sr:.2f}s")
 
-            print(f"[VoiceClone] Generated in {gen_time:.3f}s ({len(sentences)} sentence(s))")
-            return create_wav_response(wavs, sr, single=True, generation_time=gen_time)
+        print(f"[VoiceClone] Generated in {gen_time:.3f}s ({len(sentences)} sentence(s))")
+        return all_wavs, sr, gen_time, True
 
-        # Handle list input (original behavior)
-        else:
-            print(f"[DEBUG] Input text list: {len(request.text)} items")
+    # Handle list input (original behavior)
+    else:
+        print(f"[DEBUG] Input text list: {len(request.text)} items")
+
+        wavs, sr = model.generate_voice_clone(
+            text=request.text,
+            language=request.language,
+            ref_audio=request.ref_audio,
+            ref_text=request.ref_text,
+            x_vector_only_mode=request.x_vector_only_mode,
+            non_streaming_mode=True,
+            **gen_kwargs,
+        )
 
-            wavs, sr = model.generate_voice_clone(
-                text=request.text,
-                language=request.language,
-                ref_audio=request.ref_audio,
-                ref_text=request.ref_text,
-                x_vector_only_mode=request.x_vector_only_mode,
-                non_streaming_mode=True,
-                **gen_kwargs,
+        replica.synchronize()
+        gen_time = time.time() - t0
+        print(f"[VoiceClone] Generated in {gen_time:.3f}s ({len(wavs)} item(s))")
+        return wavs, sr, gen_time, False
+
+
+async def synthesize_chunk(model_key: str, text: str, language: str, ref_audio: str, ref_text: str,
+                           gen_kwargs: dict, priority: str = "standard", tenant: str = config.DEFAULT_TENANT,
+                           deadline: Optional[float] = None, charge: Optional[Charge] = None,
+                           seed: Optional[int] = None):
+    """
+    Synthesize one text chunk with the cached voice prompt on the least-loaded replica.
+
+    Returns (wav, sample_rate). Used by pipelines that consume audio chunk by chunk. The
+    chunk's audio is added to charge, unless it was shared from an identical in-flight chunk.
+    seed: torch seed set right before generation (None: unseeded).
+    """
+    def generate_sync(replica, kwargs):
+        model = replica.models[model_key]
+        if seed is not None:
+            torch.manual_seed(seed)
+            if torch.cuda.is_available():
+                torch.cuda.manual_seed(seed)
+        voice_clone_prompt = replica.get_voice_clone_prompt(model_key, ref_audio, ref_text, True)
+        wavs, sr = model.generate_voice_clone(
+            text=text,
+            language=language,
+            voice_clone_prompt=voice_clone_prompt,
+            non_streaming_mode=True,
+            **kwargs,
+        )
+        replica.synchronize()
+        return wavs[0], sr
+
+    async def generate():
+        cost = estimate_cost(text, model_key)
+        async with model_manager.acquire(model_key, cost, priority, deadline, tenant) as replica:
+            kwargs = dict(gen_kwargs, max_new_tokens=model_manager.scheduler.token_budget(
+                model_key, deadline, gen_kwargs["max_new_tokens"]
+            ))
+            t_gen = time.time()
+            wav, sr = await run_cancellable(
+                replica, CancelToken(deadline), model_manager.scheduler.estimate_audio(model_key, cost),
+                generate_sync, replica, kwargs,
             )
+        model_manager.scheduler.observe(model_key, cost, time.time() - t_gen, len(wav) / sr)
+        return wav, sr
+
+    # Deadline and tenant as in voice_clone_key: the shared generation runs under them
+    key = request_key("chunk", model_key, text, language, ref_audio, ref_text, gen_kwargs, seed, deadline, tenant)
+    (wav, sr), leader = await inflight.execute(key, generate)
+    if charge is not None and leader:
+        charge.add(len(wav) / sr)
+    return wav, sr
+
+
+async def iter_pcm_chunks(chunks: List[str], model_key: str, language: str, ref_audio: str, ref_text: str,
+                          gen_kwargs: dict, sample_rate: int, priority: str = "standard",
+                          tenant: str = config.DEFAULT_TENANT, deadline: Optional[float] = None,
+                          trim: bool = False, pause_ms: Optional[int] = None, charge: Optional[Charge] = None,
+                          seed: Optional[int] = None):
+    """
+    Synthesize text chunks in order, yielding (index, text, int16 PCM at sample_rate,
+    seconds of silence trimmed) per chunk.
+
+    The next chunk is generated while the caller consumes the current one, and one
+    streaming resampler covers the whole output (no discontinuity at chunk boundaries).
+    With trim, each chunk's edge silence is cut and every chunk but the last is
+    followed by the pause_ms sentence pause. Generated audio is added to charge as it is
+    produced. With a seed, chunk i is generated with seed + i (as sentences are in
+    _voice_clone_sync). Shared by the binary HTTP stream and the gRPC service.
+    """
+    def start(i: int) -> asyncio.Future:
+        return asyncio.ensure_future(synthesize_chunk(
+            model_key, chunks[i], language, ref_audio, ref_text, gen_kwargs, priority, tenant, deadline, charge,
+            None if seed is None else seed + i,
+        ))
+
+    resampler = None
+    pending = start(0)
+    try:
+        for i in range(len(chunks)):
+            wav, sr = await pending
+            # Generate the next chunk while this one goes out
+            pending = start(i + 1) if i + 1 < len(chunks) else None
+            removed = 0.0
+            if trim:
+                (wav,), removed, _ = await anyio.to_thread.run_sync(trim_silence, [wav], sr, None, False)
+                if pending is not None:
+                    wav = pause_after(wav, sr, pause_ms)
+            if sr != sample_rate:
+                resampler = resampler or Resampler(sr, sample_rate)
+                wav = await anyio.to_thread.run_sync(resampler.process, wav)
+                if pending is None:
+                    wav = np.concatenate([wav, resampler.flush()])
+            pcm = np.empty(len(wav), dtype=np.int16)
+            float_to_int16(wav, pcm)
+            yield i, chunks[i], pcm, removed
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
 
-            torch.cuda.synchronize()
-            gen_time = time.time() - t0
-            print(f"[VoiceClone] Generated in {gen_time:.3f}s ({len(wavs)} item(s))")
-            return create_wav_response(wavs, sr, single=False, generation_time=gen_time)
 
+@app.post("/tts/voice_clone")
+async def generate_voice_clone(
+    request: VoiceCloneRequest,
+    http_request: Request,
+    model_size: str = "0.6b",
+    response_format: str = "json",
+    x_deadline_ms: Optional[int] = Header(default=None),
+):
+    """
+    Generate speech by cloning a reference voice.
+
+    - model_size: "0.6b" (faster) or "1.7b" (higher quality)
+    - response_format: for list input only - "json" (base64 list), "multipart" or "tar"
+      (binary parts streamed as each item is encoded, with a JSON manifest first);
+      "url" (any input, artifact store only) returns audio_url(s) instead of audio
+    - deadline_ms / X-Deadline-Ms: requests that cannot finish in time get 504 up front;
+      max_new_tokens is capped to the remaining budget and late work is aborted
+    - X-API-Key (TTS_TENANT_HEADER): tenant for quotas and fair sharing; 429 + Retry-After
+      when the tenant's audio-seconds quota is used up
+
+    Splits long text into sentence chunks (see text_chunker.chunk_text) and generates each
+    chunk separately to prevent truncation, then concatenates all audio chunks into a single file.
+    """
+    if response_format not in BATCH_RESPONSE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown response_format: {response_format}. Available: {BATCH_RESPONSE_FORMATS}")
+
+    try:
+        model_key = f"base_{model_size}" if model_size in ["0.6b", "1.7b"] else "base"
+        gen_kwargs = get_generation_kwargs(request.generation_params)
+        deadline = request_deadline(request, x_deadline_ms)
+        tenant = tenant_registry.identify(http_request.headers)
+        traffic_recorder.record("voice_clone", request, model_size, tenant_registry.label(tenant),
+                                response_format=response_format)
+        cost = estimate_cost(request.text, model_key)
+
+        async def generate():
+            # Wait for a replica slot (priority, then tenant fair share and shortest job first) and
+            # run generation off the event loop, so replicas on different devices generate concurrently
+            async with model_manager.acquire(model_key, cost, request.priority, deadline, tenant) as replica:
+                kwargs = dict(gen_kwargs, max_new_tokens=model_manager.scheduler.token_budget(
+                    model_key, deadline, gen_kwargs["max_new_tokens"]
+                ))
+                # The token is checked before every sentence and decode step, in the worker thread
+                wavs, sr, gen_time, single = await run_cancellable(
+                    replica, CancelToken(deadline), model_manager.scheduler.estimate_audio(model_key, cost),
+                    _voice_clone_sync, replica, model_key, request, kwargs,
+                )
+            model_manager.scheduler.observe(model_key, cost, gen_time, sum(len(w) for w in wavs) / sr)
+
+            # Trimming and resampling run after the replica is released
+            silence = None
+            if should_trim(request):
+                wavs, removed, added = await anyio.to_thread.run_sync(
+                    trim_silence, wavs, sr, request.pause_ms, single
+                )
+                silence = (removed, added)
+            if request.sample_rate and request.sample_rate != sr:
+                wavs = await postprocessor.resample(wavs, sr, request.sample_rate, continuous=single)
+                sr = request.sample_rate
+            return wavs, sr, gen_time, single, silence
+
+        # Charged up front by estimate, settled to the audio actually produced (refunded on failure)
+        estimate = estimate_audio_seconds(request.text, model_manager.scheduler.estimate_audio(model_key, cost))
+        with tenant_registry.charge(tenant, estimate) as charge:
+            # Identical concurrent requests share one generation; each response is encoded separately
+            # A client that disconnects drops out; generation stops once no client is left
+            (wavs, sr, gen_time, single, silence), leader = await cancel_on_disconnect(
+                http_request,
+                inflight.execute(voice_clone_key("voice_clone", model_key, request, deadline, tenant), generate),
+            )
+            # Only the request that ran the generation pays for it; duplicates settle at zero
+            charge.actual = sum(len(w) for w in wavs) / sr if leader else 0.0
+
+        return await create_wav_response(
+            wavs, sr, single=single, generation_time=gen_time, response_format=response_format, silence=silence
+        )
+
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e))
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except GenerationCancelled as e:
+        # Nobody is listening any more; 499 only shows up in logs
+        return JSONResponse({"success": False, "error": str(e)}, status_code=499)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -423,29 +882,40 @@ async def generate_voice_clone(request: VoiceCloneRequest, model_size: str = "0.
 # ============== SSE Streaming ==============
 
 @app.post("/tts/voice_clone/sse")
-async def voice_clone_sse(request: VoiceCloneRequest, model_size: str = "0.6b", streaming: bool = True):
+async def voice_clone_sse(
+    request: VoiceCloneRequest,
+    http_request: Request,
+    model_size: str = "0.6b",
+    streaming: bool = True,
+    x_deadline_ms: Optional[int] = Header(default=None),
+):
     """
     Generate TTS via Server-Sent Events.
 
-    Sends progress events (meta, audio, done) for real-time UI updates.
+    Sends progress events (meta, audio, done) for real-time UI updates; an error event
+    is sent instead of audio if the deadline (deadline_ms / X-Deadline-Ms) cannot be met.
+    Requests over the tenant's quota get 429 before the stream starts.
     - streaming: use streaming text processing mode (default: True)
     """
     try:
         model_key = f"base_{model_size}" if model_size in ["0.6b", "1.7b"] else "base"
-        model = model_manager.get_model(model_key)
+        model_manager.get_model(model_key)  # Validate / load before the stream starts
         gen_kwargs = get_generation_kwargs(request.generation_params)
+        deadline = request_deadline(request, x_deadline_ms)
+        tenant = tenant_registry.identify(http_request.headers)
+        traffic_recorder.record("voice_clone_sse", request, model_size, tenant_registry.label(tenant),
+                                streaming=streaming)
 
         text = request.text if isinstance(request.text, str) else request.text[0]
+        cost = estimate_cost(text, model_key)
+        estimate = estimate_audio_seconds(text, model_manager.scheduler.estimate_audio(model_key, cost))
+        # Admit now so an over-quota tenant gets a plain 429 instead of an error event
+        charge = tenant_registry.admit(tenant, estimate)
         print(f"[SSE VoiceClone] Generating: '{text[:50]}...'")
 
-        async def event_generator():
-            t0 = time.time()
-
-            meta = {"status": "generating", "text": text}
-            yield f"event: meta\ndata: {json.dumps(meta, ensure_ascii=False)}\n\n"
-
-            torch.cuda.synchronize()
-
+        def generate_sync(replica, kwargs):
+            model = replica.models[model_key]
+            replica.synchronize()
             wavs, sr = model.generate_voice_clone(
                 text=text,
                 language=request.language if isinstance(request.language, str) else request.language[0],
@@ -453,19 +923,67 @@ async def voice_clone_sse(request: VoiceCloneRequest, model_size: str = "0.6b",
                 ref_text=request.ref_text if isinstance(request.ref_text, str) else request.ref_text[0],
                 x_vector_only_mode=request.x_vector_only_mode,
                 non_streaming_mode=not streaming,
-                **gen_kwargs,
+                **kwargs,
             )
+            replica.synchronize()
+            return wavs, sr
 
-            torch.cuda.synchronize()
+        async def event_generator():
+            t0 = time.time()
+
+            meta = {"status": "generating", "text": text}
+            yield f"event: meta\ndata: {json.dumps(meta, ensure_ascii=False)}\n\n"
+
+            async def generate():
+                async with model_manager.acquire(model_key, cost, request.priority, deadline, tenant) as replica:
+                    kwargs = dict(gen_kwargs, max_new_tokens=model_manager.scheduler.token_budget(
+                        model_key, deadline, gen_kwargs["max_new_tokens"]
+                    ))
+                    t_gen = time.time()
+                    wavs, sr = await run_cancellable(
+                        replica, CancelToken(deadline), model_manager.scheduler.estimate_audio(model_key, cost),
+                        generate_sync, replica, kwargs,
+                    )
+                model_manager.scheduler.observe(model_key, cost, time.time() - t_gen, len(wavs[0]) / sr)
+
+                removed = 0.0
+                if should_trim(request):
+                    wavs, removed, _ = await anyio.to_thread.run_sync(trim_silence, [wavs[0]], sr, None, False)
+                if request.sample_rate and request.sample_rate != sr:
+                    wavs = await postprocessor.resample([wavs[0]], sr, request.sample_rate)
+                    sr = request.sample_rate
+                # Subscribers of the same generation also share the encoded chunk
+                if artifact_store is None:
+                    audio_b64, audio_url = (await postprocessor.wav_to_base64([wavs[0]], sr))[0], None
+                else:
+                    wav_bytes = await postprocessor.encode_wav([wavs[0]], sr)
+                    audio_url = artifact_url(await artifact_store.put(wav_bytes))
+                    audio_b64 = base64.b64encode(wav_bytes).decode("ascii")
+                return audio_b64, audio_url, sr, len(wavs[0]) / sr, removed
+
+            try:
+                (audio_b64, audio_url, sr, seconds, removed), leader = await inflight.execute(
+                    voice_clone_key("voice_clone_sse", model_key, request, deadline, tenant, streaming=streaming),
+                    generate,
+                )
+                charge.actual = seconds if leader else 0.0
+            except DeadlineExceeded as e:
+                print(f"[SSE VoiceClone] {e}")
+                error_data = {"error": str(e), "status_code": 504}
+                yield f"event: error\ndata: {json.dumps(error_data)}\n\n"
+                return
+            finally:
+                tenant_registry.settle(charge)
             gen_time = time.time() - t0
             print(f"[SSE VoiceClone] Generated in {gen_time:.3f}s")
 
-            audio_b64 = audio_to_base64(wavs[0], sr)
             chunk_data = {
                 "chunk_index": 0,
                 "audio": audio_b64,
+                "audio_url": audio_url,
                 "sample_rate": sr,
                 "generation_time": round(gen_time, 3),
+                "silence_removed": round(removed, 3),
             }
             yield f"event: audio\ndata: {json.dumps(chunk_data, ensure_ascii=False)}\n\n"
 
@@ -482,26 +1000,255 @@ async def voice_clone_sse(request: VoiceCloneRequest, model_size: str = "0.6b",
             }
         )
 
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ============== Binary PCM Streaming ==============
+
+@app.post("/tts/voice_clone/stream")
+async def voice_clone_stream(
+    request: VoiceCloneRequest,
+    http_request: Request,
+    model_size: str = "0.6b",
+    x_deadline_ms: Optional[int] = Header(default=None),
+):
+    """
+    Stream raw PCM (16-bit little-endian, mono) as each text chunk is synthesized.
+
+    No WAV container and no base64: the sample rate is in the X-Sample-Rate header and the
+    body is one continuous sample stream, so clients can feed it straight into a playback
+    ring buffer (the web UI uses an AudioWorklet). Text is split with chunk_text (short first
+    chunk for fast first audio; split_sentences=false sends it as one chunk) and the next
+    chunk is generated while the current one is sent; chunk i uses seed + i.
+
+    The response starts once the first chunk is ready, so failures up to then (including
+    deadline_ms / X-Deadline-Ms that cannot be met: 504) are plain HTTP errors. A later
+    failure aborts the connection without finishing the chunked body, so clients see a
+    network error rather than a short but complete stream.
+    """
+    if not isinstance(request.text, str):
+        raise HTTPException(status_code=400, detail="Streaming takes a single text; use /tts/voice_clone for lists")
+    chunks = chunk_text(request.text) if request.split_sentences is not False else \
+        [request.text.strip()] if request.text.strip() else []
+    if not chunks:
+        raise HTTPException(status_code=400, detail="Text is empty")
+
+    try:
+        model_key = f"base_{model_size}" if model_size in ["0.6b", "1.7b"] else "base"
+        model_manager.get_model(model_key)  # Validate / load before the stream starts
+        gen_kwargs = get_generation_kwargs(request.generation_params)
+        deadline = request_deadline(request, x_deadline_ms)
+        tenant = tenant_registry.identify(http_request.headers)
+        traffic_recorder.record("voice_clone_stream", request, model_size, tenant_registry.label(tenant))
+
+        language = request.language if isinstance(request.language, str) else request.language[0]
+        ref_audio = request.ref_audio if isinstance(request.ref_audio, str) else request.ref_audio[0]
+        ref_text = request.ref_text if isinstance(request.ref_text, str) else request.ref_text[0]
+        sample_rate = request.sample_rate or config.MODEL_SAMPLE_RATE
+
+        cost = estimate_cost(request.text, model_key)
+        estimate = estimate_audio_seconds(request.text, model_manager.scheduler.estimate_audio(model_key, cost))
+        charge = tenant_registry.admit(tenant, estimate)
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    print(f"[PCM Stream] {len(chunks)} chunk(s) at {sample_rate} Hz: '{request.text[:50]}...'")
+
+    t0 = time.time()
+    pcm_chunks = iter_pcm_chunks(
+        chunks, model_key, language, ref_audio, ref_text, gen_kwargs, sample_rate, request.priority, tenant,
+        deadline, trim=should_trim(request), pause_ms=request.pause_ms, charge=charge, seed=request.seed,
+    )
+    try:
+        # First chunk before the headers: errors up to here get a status code
+        _, _, first, _ = await cancel_on_disconnect(http_request, pcm_chunks.__anext__())
+    except BaseException as e:
+        await pcm_chunks.aclose()
+        tenant_registry.settle(charge)
+        if isinstance(e, DeadlineExceeded):
+            raise HTTPException(status_code=504, detail=str(e))
+        if isinstance(e, GenerationCancelled):
+            return JSONResponse({"success": False, "error": str(e)}, status_code=499)
+        if isinstance(e, Exception):
+            raise HTTPException(status_code=500, detail=str(e))
+        raise
+
+    async def pcm_stream():
+        samples = len(first)
+        try:
+            yield memoryview(first).cast("B")
+            async for _, _, pcm, _ in pcm_chunks:
+                samples += len(pcm)
+                yield memoryview(pcm).cast("B")
+            print(f"[PCM Stream] {samples / sample_rate:.2f}s of audio in {time.time() - t0:.3f}s")
+        except Exception as e:
+            # Headers are already sent: re-raise so the server drops the connection without the
+            # final chunk, instead of ending the body as if the audio were complete
+            print(f"[PCM Stream] Aborted after {samples / sample_rate:.2f}s of audio: {e}")
+            raise
+        finally:
+            await pcm_chunks.aclose()
+            tenant_registry.settle(charge)
+
+    return StreamingResponse(
+        pcm_stream(),
+        media_type=f"audio/L16; rate={sample_rate}; channels=1",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Sample-Rate": str(sample_rate),
+            "X-Sample-Format": "s16le",
+            "X-Channels": "1",
+            "X-Text-Chunks": str(len(chunks)),
+            "Access-Control-Expose-Headers": "X-Sample-Rate, X-Sample-Format, X-Channels, X-Text-Chunks",
+        },
+    )
+
+
 # ============== Video Generation (Optional - NewAvata Integration) ==============
 
+video_gen = None
+video_jobs = None
+
 if config.ENABLE_VIDEO:
     try:
         from video_generator import VideoGenerator, check_video_support
+        from video_pipeline import LipSyncPipeline
+        from video_jobs import VideoJob, VideoJobStore
+        from hls import (
+            HlsStream, MEDIA_TYPES, PLAYLIST_NAME, check_hls_support, playlist_url, remove_stream, stream_file,
+            sweep_streams,
+        )
 
         if check_video_support():
             video_gen = VideoGenerator()
+            # An evicted or expired HLS job takes its stream directory with it
+            video_jobs = VideoJobStore(on_evict=lambda job: remove_stream(job.id) if job.params.get("hls") else None)
+            hls_enabled = check_hls_support()
+            if not hls_enabled:
+                print(f"[Server] HLS output disabled ({config.FFMPEG_BINARY} not found)")
+            swept = sweep_streams()
+            if swept:
+                print(f"[HLS] Removed {swept} stale stream(s) from {config.VIDEO_HLS_DIR}")
+
+            async def publish_segment(stream: HlsStream, index: int, result: dict):
+                """Download a rendered clip from NewAvata and append it to the HLS playlist."""
+                video_url = result.get("video_url")
+                if not result.get("success", "error" not in result) or not video_url:
+                    stream.skip_segment(index)
+                    return
+                clip = stream.dir / f"clip_{index:05d}.mp4"
+                try:
+                    await video_gen.download(video_url, clip)
+                    await stream.add_segment(index, clip)
+                except Exception as e:
+                    print(f"[HLS] Segment {index} of {stream.stream_id} failed: {e}")
+                    stream.skip_segment(index)
+                finally:
+                    clip.unlink(missing_ok=True)
+
+            def admit_video(request: VideoJobRequest, http_request: Request) -> Optional[Charge]:
+                """Quota charge for local synthesis (raises QuotaExceeded); NewAvata's own TTS engines are not metered."""
+                if request.tts_engine != "local":
+                    return None
+                model_key = f"base_{request.model_size}" if request.model_size in ["0.6b", "1.7b"] else "base"
+                tenant = tenant_registry.identify(http_request.headers)
+                cost = estimate_cost(request.text, model_key)
+                estimate = estimate_audio_seconds(request.text, model_manager.scheduler.estimate_audio(model_key, cost))
+                return tenant_registry.admit(tenant, estimate)
+
+            def check_hls(request: VideoJobRequest):
+                """HLS needs ffmpeg and the local engine (other engines render the whole clip in one call)."""
+                if not request.hls:
+                    return
+                if not hls_enabled:
+                    raise HTTPException(status_code=400, detail=f"HLS output requires {config.FFMPEG_BINARY}")
+                if request.tts_engine != "local":
+                    raise HTTPException(status_code=400, detail="HLS output requires tts_engine=local")
+
+            async def run_video_generation(request: VideoJobRequest, job: Optional[VideoJob] = None,
+                                           charge: Optional[Charge] = None):
+                """
+                Generate a lip-sync video (local pipeline or NewAvata TTS engine), updating job progress.
+
+                charge (local synthesis): settled here to the audio the pipeline produced.
+                """
+                stream = None
+                try:
+                    if request.hls:
+                        # Streams without a job (/video/generate) are only removed by age
+                        sweep_streams()
+                        stream = HlsStream(job.id if job is not None else None)
+                    result = await _generate_video(request, job, stream, charge)
+                finally:
+                    if stream is not None:
+                        stream.finish()
+                    if charge is not None:
+                        tenant_registry.settle(charge)
+                if stream is not None:
+                    result["hls"] = stream.get_info()
+                return result
+
+            async def _generate_video(request: VideoJobRequest, job: Optional[VideoJob], stream: Optional[HlsStream],
+                                      charge: Optional[Charge]):
+                if request.tts_engine == "local":
+                    model_key = f"base_{request.model_size}" if request.model_size in ["0.6b", "1.7b"] else "base"
+                    voice_audio = request.ref_audio or config.VIDEO_REF_AUDIO
+                    voice_text = request.ref_text if request.ref_text is not None else config.VIDEO_REF_TEXT
+                    gen_kwargs = get_generation_kwargs()
+
+                    tenant = charge.tenant if charge is not None else config.DEFAULT_TENANT
+
+                    async def synthesize(chunk: str):
+                        return await synthesize_chunk(
+                            model_key, chunk, request.language, voice_audio, voice_text, gen_kwargs,
+                            tenant=tenant, charge=charge,
+                        )
+
+                    async def on_segment(segment):
+                        if stream is not None:
+                            await publish_segment(stream, segment["index"], segment["result"])
+                        if job is not None:
+                            job.progress["completed_segments"] += 1
+
+                    pipeline = LipSyncPipeline(video_gen, synthesize)
+                    if job is not None:
+                        job.progress["total_segments"] = len(chunk_text(request.text))
+                    return await pipeline.run(
+                        request.text, avatar_path=request.avatar_path, quality=request.quality,
+                        on_segment=on_segment,
+                    )
+
+                if job is not None:
+                    job.progress["total_segments"] = 1
+                result = await video_gen.generate(
+                    text=request.text,
+                    avatar_path=request.avatar_path,
+                    tts_engine=request.tts_engine,
+                    tts_voice=request.tts_voice,
+                    quality=request.quality
+                )
+                if job is not None:
+                    job.progress["completed_segments"] = 1
+                return result
 
             @app.post("/video/generate")
             async def generate_video(
+                http_request: Request,
                 text: str,
                 avatar_path: str = "auto",
                 tts_engine: str = "qwen3tts",
                 tts_voice: str = "default",
-                quality: str = "medium"
+                quality: str = "medium",
+                ref_audio: Optional[str] = None,
+                ref_text: Optional[str] = None,
+                language: str = "Auto",
+                model_size: str = "0.6b",
+                hls: bool = False,
             ):
                 """
                 NewAvata 립싱크 비디오 생성.
@@ -509,33 +1256,107 @@ if config.ENABLE_VIDEO:
                 NewAvata 서버를 통해 텍스트에서 립싱크 비디오를 생성합니다.
                 아바타는 사전계산된 영상 기반 .pkl 파일을 사용합니다.
 
+                tts_engine="local": 이 서버에서 문장 단위로 음성을 합성하고(캐시된 voice prompt 사용)
+                각 문장의 오디오를 NewAvata 외부 오디오 경로(tts_engine="external")로 바로 전달합니다.
+                문장 N의 립싱크와 문장 N+1의 합성이 겹쳐서 진행되며, 결과는 문장별 세그먼트로 반환됩니다.
+
                 Args:
                     text: 생성할 텍스트
                     avatar_path: 아바타 경로 (precomputed/*.pkl) 또는 "auto"
-                    tts_engine: TTS 엔진 (qwen3tts, cosyvoice, elevenlabs)
+                    tts_engine: TTS 엔진 (local, qwen3tts, cosyvoice, elevenlabs)
                     tts_voice: TTS 음성
                     quality: 품질 설정 (low, medium, high)
+                    ref_audio: local 모드 참조 음성 (기본값 VIDEO_REF_AUDIO)
+                    ref_text: local 모드 참조 음성 텍스트 (기본값 VIDEO_REF_TEXT)
+                    language: local 모드 언어
+                    model_size: local 모드 모델 크기 ("0.6b" 또는 "1.7b")
+                    hls: HLS 플레이리스트도 생성 (결과의 hls.playlist_url, tts_engine="local"만 지원)
 
                 Returns:
                     생성 결과 (video_url, audio_url, duration 등)
                 """
+                request = VideoJobRequest(
+                    text=text,
+                    avatar_path=avatar_path,
+                    tts_engine=tts_engine,
+                    tts_voice=tts_voice,
+                    quality=quality,
+                    ref_audio=ref_audio,
+                    ref_text=ref_text,
+                    language=language,
+                    model_size=model_size,
+                    hls=hls,
+                )
+                check_hls(request)
                 try:
-                    result = video_gen.generate(
-                        text=text,
-                        avatar_path=avatar_path,
-                        tts_engine=tts_engine,
-                        tts_voice=tts_voice,
-                        quality=quality
-                    )
-                    return result
+                    charge = admit_video(request, http_request)
+                except QuotaExceeded as e:
+                    raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e))
+                try:
+                    return await run_video_generation(request, charge=charge)
                 except Exception as e:
                     raise HTTPException(status_code=500, detail=str(e))
 
+            @app.post("/video/jobs")
+            async def create_video_job(request: VideoJobRequest, http_request: Request):
+                """
+                비동기 립싱크 비디오 작업 생성.
+
+                작업 ID를 즉시 반환하고 비디오는 백그라운드에서 생성됩니다.
+                동일한 요청(텍스트, 아바타, 음성, 품질)이 진행 중이면 같은 작업으로 합쳐집니다.
+                진행 상황과 결과 URL은 GET /video/jobs/{job_id}로 조회합니다.
+
+                hls=true이면 응답의 playlist_url(HLS)이 세그먼트가 완성될 때마다 늘어나므로
+                전체 렌더링이 끝나기 전에 첫 문장부터 재생할 수 있습니다.
+                HLS는 문장 단위로 렌더링하는 tts_engine="local"에서만 지원되며, 다른 엔진은 400을 반환합니다.
+                """
+                check_hls(request)
+                try:
+                    charge = admit_video(request, http_request)
+                except QuotaExceeded as e:
+                    raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e))
+                try:
+                    job = video_jobs.submit(
+                        request.model_dump(),
+                        lambda job: run_video_generation(request, job=job, charge=charge),
+                    )
+                except RuntimeError as e:
+                    if charge is not None:
+                        tenant_registry.settle(charge)  # Refund
+                    raise HTTPException(status_code=503, detail=str(e))
+                if charge is not None and job.requests > 1:
+                    # Coalesced into a job already in flight: only that job's submitter pays
+                    charge.actual = 0.0
+                    tenant_registry.settle(charge)
+                if request.hls:
+                    job.playlist_url = playlist_url(job.id)
+                return job.to_dict()
+
+            @app.get("/video/jobs/{job_id}")
+            async def get_video_job(job_id: str):
+                """비디오 작업 상태, 진행률(세그먼트 단위), 결과 URL 조회."""
+                job = video_jobs.get(job_id)
+                if job is None:
+                    raise HTTPException(status_code=404, detail=f"Unknown or expired job: {job_id}")
+                return job.to_dict()
+
+            @app.get("/video/hls/{stream_id}/{name}")
+            async def get_hls_file(stream_id: str, name: str):
+                """HLS 플레이리스트(index.m3u8) 및 세그먼트(.ts) 제공."""
+                path = stream_file(stream_id, name)
+                if path is None:
+                    raise HTTPException(status_code=404, detail="Not found")
+                # The playlist grows while segments render; segments never change
+                cache_control = "no-cache" if name == PLAYLIST_NAME else "public, max-age=86400"
+                return FileResponse(
+                    path, media_type=MEDIA_TYPES[path.suffix], headers={"Cache-Control": cache_control}
+                )
+
             @app.get("/video/avatars")
             async def list_avatars():
                 """사용 가능한 아바타 목록 (사전계산된 영상 기반)."""
                 try:
-                    avatars = video_gen.list_avatars()
+                    avatars = await video_gen.list_avatars()
                     return {"avatars": avatars}
                 except Exception as e:
                     raise HTTPException(status_code=500, detail=str(e))
@@ -544,7 +1365,7 @@ if config.ENABLE_VIDEO:
             async def list_tts_engines():
                 """사용 가능한 TTS 엔진 목록."""
                 try:
-                    engines = video_gen.list_tts_engines()
+                    engines = await video_gen.list_tts_engines()
                     return {"engines": engines}
                 except Exception as e:
                     raise HTTPException(status_code=500, detail=str(e))
@@ -553,11 +1374,27 @@ if config.ENABLE_VIDEO:
             async def video_system_status():
                 """NewAvata 서버 시스템 상태."""
                 try:
-                    status = video_gen.get_system_status()
+                    status = await video_gen.get_system_status()
                     return status
                 except Exception as e:
                     raise HTTPException(status_code=500, detail=str(e))
 
+            @app.post("/video/cache/invalidate")
+            async def invalidate_video_cache(
+                key: Optional[str] = None,
+                x_admin_token: Optional[str] = Header(default=None),
+            ):
+                """
+                NewAvata 메타데이터 캐시 무효화 (X-Admin-Token 필요).
+
+                새 아바타(.pkl)를 사전계산한 후 호출하면 다음 /video/avatars 요청이 NewAvata에서 새로 조회합니다.
+
+                Args:
+                    key: "avatars", "tts_engines", "system_status" 또는 생략 (전체)
+                """
+                require_admin(x_admin_token)
+                return {"invalidated": video_gen.invalidate_metadata(key)}
+
             print("[Server] Video generation endpoints enabled (NewAvata API mode)")
         else:
             print("[Server] Video generation not available (check NewAvata server)")
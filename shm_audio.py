@@ -0,0 +1,296 @@
+# coding=utf-8
+# Qwen3-TTS Shared-memory Audio Handoff
+#
+# When NewAvata runs on the same host, lip-sync audio does not need to travel
+# as base64 WAV inside the JSON body. The producer converts each chunk to
+# 16-bit PCM straight into a memory-mapped ring file under /dev/shm and sends
+# NewAvata only a handle (path, byte offset, sample count, sample rate, seq).
+# The consumer maps the same file and reads the samples in place.
+#
+# File layout (little-endian):
+#   header (64 bytes): magic "QTTSRING", version u32, header size u32,
+#                      data capacity u64, last written seq u64
+#   segments, 64-byte aligned: seq u64, samples u32, sample_rate u32, PCM s16le
+#
+# A segment stays valid until the producer releases it (after NewAvata has
+# answered the request that carried its handle). The consumer checks the
+# segment header against the handle before and after copying, so a handle
+# used after release is detected instead of returning someone else's audio.
+#
+#   python shm_audio.py   # round trip through the stand-in consumer
+
+import os
+import socket
+import struct
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+import numpy as np
+
+import config
+from audio_io import PCM_SAMPLE_WIDTH, float_to_int16
+
+MAGIC = b"QTTSRING"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQQ")
+HEADER_SIZE = 64
+SEGMENT_HEADER = struct.Struct("<QII")
+SEGMENT_HEADER_SIZE = 16
+ALIGN = 64
+PCM_FORMAT = "pcm_s16le"
+
+
+def is_local_url(url: str) -> bool:
+    """True if url points at this host (shared /dev/shm is only useful there)."""
+    host = urlparse(url).hostname or ""
+    return host in ("localhost", "127.0.0.1", "::1", socket.gethostname())
+
+
+def default_path() -> str:
+    return config.NEWAVATA_SHM_PATH or f"/dev/shm/qwen3tts-audio-{os.getpid()}"
+
+
+class _Segment:
+    __slots__ = ("start", "end", "seq", "released")
+
+    def __init__(self, start: int, end: int, seq: int):
+        self.start = start
+        self.end = end
+        self.seq = seq
+        self.released = False
+
+
+class ShmAudioRing:
+    """
+    Producer side: a FIFO ring allocator over a memory-mapped file (used from the event loop only).
+
+    Segments are released in any order; space is reclaimed from the oldest
+    segment onwards. write() returns None when the ring is full so the caller
+    can fall back to another transport.
+    """
+
+    def __init__(self, path: str = None, size: int = None):
+        import mmap
+
+        self.path = path or default_path()
+        self.capacity = size or config.NEWAVATA_SHM_SIZE_MB * 1024 * 1024
+        fd = os.open(self.path, os.O_CREAT | os.O_RDWR | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, HEADER_SIZE + self.capacity)
+            self._mmap = mmap.mmap(fd, HEADER_SIZE + self.capacity)
+        finally:
+            os.close(fd)
+        self._buf = memoryview(self._mmap)
+        self._live: "deque[_Segment]" = deque()
+        self._by_seq: Dict[int, _Segment] = {}
+        self._head = 0  # Next write position, relative to the data region
+        self._seq = 0
+        self.segments_written = 0
+        self.bytes_written = 0
+        self.full = 0  # write() calls that found no room
+        self._write_header()
+        print(f"[ShmAudio] Ring {self.path} ({self.capacity // (1024 * 1024)} MB)")
+
+    def _write_header(self):
+        HEADER.pack_into(self._buf, 0, MAGIC, VERSION, HEADER_SIZE, self.capacity, self._seq)
+
+    def _allocate(self, size: int) -> Optional[int]:
+        if size > self.capacity:
+            return None
+        if not self._live:
+            self._head = 0
+            return 0
+        tail = self._live[0].start
+        if self._head > tail:
+            # Live data is [tail, head): append, or wrap to the free space before tail
+            if self._head + size <= self.capacity:
+                return self._head
+            return 0 if size <= tail else None
+        # Wrapped: live data is [tail, capacity) + [0, head)
+        return self._head if self._head + size <= tail else None
+
+    def write(self, wav: np.ndarray, sample_rate: int) -> Optional[Dict[str, Any]]:
+        """Copy a chunk (float in [-1, 1] or int16) into the ring; returns its handle, or None if full."""
+        samples = len(wav)
+        size = -(-(SEGMENT_HEADER_SIZE + samples * PCM_SAMPLE_WIDTH) // ALIGN) * ALIGN
+        start = self._allocate(size)
+        if start is None:
+            self.full += 1
+            return None
+
+        self._seq += 1
+        offset = HEADER_SIZE + start
+        pcm = np.ndarray(samples, dtype="<i2", buffer=self._buf, offset=offset + SEGMENT_HEADER_SIZE)
+        if wav.dtype == np.int16:
+            pcm[:] = wav
+        else:
+            float_to_int16(wav, pcm)
+        SEGMENT_HEADER.pack_into(self._buf, offset, self._seq, samples, sample_rate)
+        self._write_header()
+
+        segment = _Segment(start, start + size, self._seq)
+        self._live.append(segment)
+        self._by_seq[segment.seq] = segment
+        self._head = segment.end
+        self.segments_written += 1
+        self.bytes_written += samples * PCM_SAMPLE_WIDTH
+        return {
+            "path": self.path,
+            "offset": offset + SEGMENT_HEADER_SIZE,
+            "samples": samples,
+            "sample_rate": sample_rate,
+            "seq": segment.seq,
+            "format": PCM_FORMAT,
+        }
+
+    def release(self, handle: Dict[str, Any]):
+        """The consumer is done with this segment; its space can be reused."""
+        segment = self._by_seq.pop(handle["seq"], None)
+        if segment is None:
+            return
+        segment.released = True
+        while self._live and self._live[0].released:
+            self._live.popleft()
+        if not self._live:
+            self._head = 0
+
+    @property
+    def used(self) -> int:
+        if not self._live:
+            return 0
+        tail = self._live[0].start
+        return self._head - tail if self._head > tail else self.capacity - tail + self._head
+
+    def close(self):
+        self._buf.release()
+        self._mmap.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def get_stats(self) -> dict:
+        return {
+            "path": self.path,
+            "capacity_bytes": self.capacity,
+            "used_bytes": self.used,
+            "live_segments": len(self._by_seq),
+            "segments_written": self.segments_written,
+            "bytes_written": self.bytes_written,
+            "full": self.full,
+        }
+
+
+class ShmAudioReader:
+    """Consumer side: maps a ring file read-only and copies segments out by handle."""
+
+    def __init__(self, path: str):
+        import mmap
+
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_size, capacity, _ = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a version {VERSION} audio ring")
+        self.path = path
+        self.header_size = header_size
+        self.capacity = capacity
+
+    def _check(self, handle: Dict[str, Any]):
+        seq, samples, sample_rate = SEGMENT_HEADER.unpack_from(self._mmap, handle["offset"] - SEGMENT_HEADER_SIZE)
+        if (seq, samples, sample_rate) != (handle["seq"], handle["samples"], handle["sample_rate"]):
+            raise ValueError(f"Segment {handle['seq']} is no longer in {self.path} (released or overwritten)")
+
+    def read(self, handle: Dict[str, Any]) -> np.ndarray:
+        """int16 samples of a segment (copied out of the ring)."""
+        offset, samples = handle["offset"], handle["samples"]
+        if handle.get("format", PCM_FORMAT) != PCM_FORMAT or offset < self.header_size + SEGMENT_HEADER_SIZE \
+                or offset + samples * PCM_SAMPLE_WIDTH > self.header_size + self.capacity:
+            raise ValueError(f"Invalid handle for {self.path}: {handle}")
+        self._check(handle)
+        pcm = np.frombuffer(self._mmap, dtype="<i2", count=samples, offset=offset).copy()
+        self._check(handle)
+        return pcm
+
+    def close(self):
+        self._mmap.close()
+
+
+class StandInLipSync:
+    """
+    Local stand-in for NewAvata's external-audio path (same interface as
+    VideoGenerator.generate_from_audio): reads the audio from whichever
+    transport it was given and reports what arrived instead of rendering video.
+    """
+
+    def __init__(self, audio_ring: Optional[ShmAudioRing] = None):
+        self.audio_ring = audio_ring
+        self._readers: Dict[str, ShmAudioReader] = {}
+        self.received = []  # int16 arrays in arrival order
+
+    async def generate_from_audio(self, text: str, audio_wav: bytes = None, audio_handle: Dict[str, Any] = None,
+                                  avatar_path: str = "auto", quality: str = "medium", timeout: float = None):
+        t0 = time.perf_counter()
+        if audio_handle is not None:
+            reader = self._readers.get(audio_handle["path"])
+            if reader is None:
+                reader = self._readers[audio_handle["path"]] = ShmAudioReader(audio_handle["path"])
+            pcm, sample_rate, transport = reader.read(audio_handle), audio_handle["sample_rate"], "shm"
+        else:
+            sample_rate = struct.unpack_from("<I", audio_wav, 24)[0]
+            pcm, transport = np.frombuffer(audio_wav, dtype="<i2", offset=44), "wav"
+        self.received.append(pcm)
+        return {
+            "success": True,
+            "video_url": None,
+            "transport": transport,
+            "samples": len(pcm),
+            "sample_rate": sample_rate,
+            "read_time": time.perf_counter() - t0,
+        }
+
+    def close(self):
+        for reader in self._readers.values():
+            reader.close()
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    from video_pipeline import LipSyncPipeline
+
+    async def main():
+        sr = config.MODEL_SAMPLE_RATE
+        text = " ".join(f"테스트 문장 {i}번입니다." for i in range(12))
+        rng = np.random.default_rng(0)
+        sent = []
+
+        async def synthesize(chunk: str):
+            wav = (0.3 * np.sin(np.arange(sr * 4) * 2 * np.pi * 220 / sr)
+                   + 0.01 * rng.standard_normal(sr * 4)).astype(np.float32)
+            sent.append(wav)
+            return wav, sr
+
+        for transport in ("wav", "shm"):
+            ring = ShmAudioRing(size=8 * 1024 * 1024) if transport == "shm" else None
+            consumer = StandInLipSync(ring)
+            sent.clear()
+            try:
+                result = await LipSyncPipeline(consumer, synthesize, audio_sample_rate=sr).run(text)
+            finally:
+                consumer.close()
+                if ring is not None:
+                    print(f"[ShmAudio] {ring.get_stats()}")
+                    ring.close()
+            expected = np.concatenate(sent)
+            received = np.concatenate(consumer.received)
+            match = len(expected) == len(received) and \
+                np.abs(received.astype(np.float32) / 32768.0 - expected).max() <= 1 / 32768.0
+            transports = {s["result"]["transport"] for s in result["segments"]}
+            print(f"[ShmAudio] {transport}: {result['segment_count']} segment(s) via {transports}, "
+                  f"{len(received)} samples, round trip {'OK' if match else 'MISMATCH'}")
+
+    asyncio.run(main())
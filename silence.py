@@ -0,0 +1,91 @@
+# coding=utf-8
+# Qwen3-TTS Silence Trimming and Pause Normalization
+#
+# Generated chunks often start and end with long silences, which add up when
+# chunks are concatenated and inflate payloads and NewAvata's frame count.
+# Optionally (TTS_TRIM_SILENCE / trim_silence per request), each chunk's edge
+# silence is cut using per-frame energy computed over the whole chunk at once,
+# and consecutive chunks are separated by a fixed pause of digital silence
+# (SENTENCE_PAUSE_MS) instead of whatever the model happened to produce.
+
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+import config
+
+FADE_MS = 5  # Fade at cut points (no clicks)
+# Chunks whose loudest frame is below this are left alone (nothing to anchor a relative threshold to)
+SILENCE_FLOOR_DB = -60.0
+
+
+def frame_levels_db(wav: np.ndarray, frame: int) -> np.ndarray:
+    """Mean power (dBFS) of each full frame; the partial tail frame is not measured."""
+    n = len(wav) // frame
+    frames = wav[:n * frame].reshape(n, frame)
+    power = np.einsum("ij,ij->i", frames, frames, dtype=np.float64) / frame
+    return 10.0 * np.log10(power + 1e-12)
+
+
+def speech_bounds(wav: np.ndarray, sample_rate: int, threshold_db: float = None,
+                  frame_ms: float = None, keep_ms: float = None) -> Tuple[int, int]:
+    """
+    (start, end) sample range to keep: from the first to the last frame within
+    threshold_db of the loudest frame, padded by keep_ms on both sides.
+    """
+    threshold_db = config.TRIM_THRESHOLD_DB if threshold_db is None else threshold_db
+    frame = max(1, int(sample_rate * (frame_ms or config.TRIM_FRAME_MS) / 1000))
+    keep = int(sample_rate * (config.TRIM_KEEP_MS if keep_ms is None else keep_ms) / 1000)
+    levels = frame_levels_db(wav, frame)
+    if not len(levels) or levels.max() < SILENCE_FLOOR_DB:
+        return 0, len(wav)
+    voiced = np.flatnonzero(levels >= levels.max() - abs(threshold_db))
+    start = max(0, voiced[0] * frame - keep)
+    # Speech running into the unmeasured tail keeps the tail
+    end = len(wav) if voiced[-1] == len(levels) - 1 else min(len(wav), (voiced[-1] + 1) * frame + keep)
+    return start, end
+
+
+def _fade(wav: np.ndarray, sample_rate: int, fade_in: bool, fade_out: bool):
+    n = min(len(wav) // 2, int(sample_rate * FADE_MS / 1000))
+    if n <= 0:
+        return
+    ramp = np.linspace(0.0, 1.0, n, endpoint=False, dtype=wav.dtype)
+    if fade_in:
+        wav[:n] *= ramp
+    if fade_out:
+        wav[-n:] *= ramp[::-1]
+
+
+def trim_silence(wavs: List[np.ndarray], sample_rate: int, pause_ms: Optional[float] = None,
+                 continuous: bool = True) -> Tuple[List[np.ndarray], float, float]:
+    """
+    Trim edge silence of every chunk, with a short fade at each cut (the input is not modified).
+
+    continuous=True: chunks are consecutive parts of one output and are returned with a
+    pause_ms block of silence between each pair (separate arrays, so writers that
+    concatenate chunks need no extra copy); continuous=False: independent items.
+    Returns (chunks, seconds removed, seconds of pause added).
+    """
+    pause_ms = config.SENTENCE_PAUSE_MS if pause_ms is None else pause_ms
+    pause = np.zeros(int(sample_rate * pause_ms / 1000), dtype=np.float32)
+    out, removed = [], 0
+    for i, wav in enumerate(wavs):
+        start, end = speech_bounds(wav, sample_rate)
+        trimmed = wav
+        if start > 0 or end < len(wav):
+            # Copied: the input may be shared with other requests (single-flight)
+            trimmed = wav[start:end].copy()
+            _fade(trimmed, sample_rate, start > 0, end < len(wav))
+        removed += len(wav) - len(trimmed)
+        if continuous and i > 0 and len(pause):
+            out.append(pause)
+        out.append(trimmed)
+    added = len(pause) * (len(wavs) - 1) if continuous else 0
+    return out, removed / sample_rate, added / sample_rate
+
+
+def pause_after(wav: np.ndarray, sample_rate: int, pause_ms: Optional[float] = None) -> np.ndarray:
+    """A chunk followed by the inter-sentence pause (for outputs sent chunk by chunk)."""
+    pause_ms = config.SENTENCE_PAUSE_MS if pause_ms is None else pause_ms
+    return np.concatenate([wav, np.zeros(int(sample_rate * pause_ms / 1000), dtype=wav.dtype)])
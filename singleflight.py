@@ -0,0 +1,86 @@
+# coding=utf-8
+# Qwen3-TTS Single-flight Request Deduplication
+#
+# Identical requests that arrive while the first one is still generating
+# (e.g. the same question broadcast to a whole cohort) attach to the running
+# generation instead of starting their own, and every caller receives the
+# same result.
+
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+import config
+
+
+def request_key(*parts: Any) -> str:
+    """Stable key of the generation inputs (JSON-serializable parts, order-sensitive)."""
+    data = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    In-flight call table: concurrent do() calls with the same key share one execution.
+
+    The shared work runs in its own task, so a caller that goes away (client
+    disconnect) does not cancel it for the others; it is cancelled only when
+    every caller has gone.
+    """
+
+    def __init__(self, enabled: bool = None):
+        self.enabled = config.DEDUPE_ENABLED if enabled is None else enabled
+        self._calls: Dict[str, _Call] = {}
+        self.executions = 0
+        self.duplicates = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Await fn(), or the already running fn() of an identical request."""
+        return (await self.execute(key, fn))[0]
+
+    async def execute(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """do(), returning (result, leader); leader=False means the caller attached to an identical call."""
+        if not self.enabled:
+            self.executions += 1
+            return await fn(), True
+
+        call = self._calls.get(key)
+        leader = call is None
+        if leader:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.executions += 1
+        else:
+            self.duplicates += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task), leader
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def get_stats(self) -> dict:
+        total = self.executions + self.duplicates
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._calls),
+            "executions": self.executions,
+            "duplicates": self.duplicates,
+            "duplicate_rate": round(self.duplicates / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,208 @@
+# coding=utf-8
+# Qwen3-TTS Tenant Quotas
+#
+# Each caller is identified by a header (TTS_TENANT_HEADER, X-API-Key by
+# default) whose value is listed in TTS_TENANTS; any other value (or none)
+# is the default tenant, so rotating the header cannot mint fresh buckets or
+# scheduler shares. Each tenant gets a token bucket denominated in
+# audio-seconds: a request is
+# charged its estimated output length on admission and settled to the audio
+# it actually produced. A tenant whose bucket is empty gets 429 with a
+# Retry-After until the bucket refills. Tenant weights also drive the
+# scheduler's weighted fair queuing (see scheduler.py).
+
+import hashlib
+import math
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+import config
+
+
+class QuotaExceeded(Exception):
+    """The tenant's audio-seconds bucket cannot cover the request yet."""
+
+    def __init__(self, tenant_label: str, retry_after: float):
+        super().__init__(f"Quota exceeded for tenant {tenant_label}; retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+def parse_tenants(spec: str) -> Dict[str, Tuple[float, float, float]]:
+    """
+    Per-tenant policy from "id=weight[:rate[:burst]],..." (unset fields use the defaults).
+
+    rate: audio-seconds refilled per second (0 = unlimited); burst: bucket capacity.
+    """
+    tenants = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        tenant, _, values = item.strip().partition("=")
+        fields = [float(v) for v in values.split(":") if v.strip()]
+        defaults = [1.0, config.TENANT_RATE, config.TENANT_BURST]
+        weight, rate, burst = fields[:3] + defaults[len(fields[:3]):]
+        tenants[tenant.strip()] = (max(weight, 0.01), rate, burst)
+    return tenants
+
+
+def estimate_audio_seconds(text, known: Optional[float] = None) -> float:
+    """Expected output length: the scheduler's observed estimate if any, else characters / speaking rate."""
+    if known is not None:
+        return known
+    chars = len(text) if isinstance(text, str) else sum(len(t) for t in text)
+    return chars / config.TENANT_CHARS_PER_SECOND
+
+
+class TokenBucket:
+    """Audio-seconds bucket; the balance may go negative when actual usage exceeds the estimate."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount: float) -> float:
+        """Charge amount; returns 0 if admitted, else seconds until it would be."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        # A request larger than the whole bucket is admitted once the bucket is full
+        needed = min(amount, self.burst)
+        if self.tokens < needed:
+            return (needed - self.tokens) / self.rate
+        self.tokens -= amount
+        return 0.0
+
+    def adjust(self, delta: float):
+        """Correct a charge by delta (positive = charge more, negative = refund)."""
+        if self.rate <= 0:
+            return
+        self._refill()
+        self.tokens = min(self.burst, self.tokens - delta)
+
+
+class _Tenant:
+    __slots__ = ("bucket", "requests", "throttled", "audio_seconds")
+
+    def __init__(self, rate: float, burst: float):
+        self.bucket = TokenBucket(rate, burst)
+        self.requests = 0
+        self.throttled = 0
+        self.audio_seconds = 0.0
+
+
+class Charge:
+    """Estimated charge of one admitted request; set actual to settle it on exit (unset = refund)."""
+
+    __slots__ = ("tenant", "estimate", "actual")
+
+    def __init__(self, tenant: str, estimate: float):
+        self.tenant = tenant
+        self.estimate = estimate
+        self.actual: Optional[float] = None
+
+    def add(self, seconds: float):
+        """Add produced audio to the actual charge (requests settled chunk by chunk)."""
+        self.actual = (self.actual or 0.0) + seconds
+
+
+class TenantRegistry:
+    """Tenant policies, buckets and usage (used from the event loop only)."""
+
+    def __init__(self, spec: str = None, header: str = None):
+        self.header = header or config.TENANT_HEADER
+        self.policies = parse_tenants(config.TENANTS if spec is None else spec)
+        # Header values that are credentials are never shown in /metrics
+        self._secret = any(s in self.header.lower() for s in ("key", "authorization", "token"))
+        # Only configured tenants and DEFAULT_TENANT ever get a bucket
+        self._tenants: Dict[str, _Tenant] = {}
+
+    def identify(self, headers) -> str:
+        """Tenant ID of a request (DEFAULT_TENANT unless listed in TTS_TENANTS); gRPC metadata keys are lowercase."""
+        value = (headers.get(self.header) or headers.get(self.header.lower()) or "").strip()
+        return value if value in self.policies else config.DEFAULT_TENANT
+
+    def label(self, tenant: str) -> str:
+        if not self._secret or tenant == config.DEFAULT_TENANT:
+            return tenant
+        return "key-" + hashlib.sha256(tenant.encode("utf-8")).hexdigest()[:8]
+
+    def weight(self, tenant: str) -> float:
+        policy = self.policies.get(tenant)
+        return policy[0] if policy else 1.0
+
+    def _get(self, tenant: str) -> _Tenant:
+        state = self._tenants.get(tenant)
+        if state is None:
+            _, rate, burst = self.policies.get(tenant, (1.0, config.TENANT_RATE, config.TENANT_BURST))
+            state = self._tenants[tenant] = _Tenant(rate, burst)
+        return state
+
+    def admit(self, tenant: str, estimate: float) -> Charge:
+        """Charge ~estimate audio-seconds up front (raises QuotaExceeded); pair with settle()."""
+        state = self._get(tenant)
+        retry_after = state.bucket.take(estimate)
+        if retry_after > 0:
+            state.throttled += 1
+            raise QuotaExceeded(self.label(tenant), retry_after)
+        state.requests += 1
+        return Charge(tenant, estimate)
+
+    def settle(self, charge: Charge):
+        """Correct the charge to charge.actual (unset = the request failed; refunded)."""
+        state = self._tenants.get(charge.tenant)
+        if state is None:
+            return
+        actual = charge.actual or 0.0
+        state.bucket.adjust(actual - charge.estimate)
+        state.audio_seconds += actual
+
+    @contextmanager
+    def charge(self, tenant: str, estimate: float):
+        """admit() on entry, settle() on exit."""
+        charge = self.admit(tenant, estimate)
+        try:
+            yield charge
+        finally:
+            self.settle(charge)
+
+    def get_stats(self, queue: Dict[str, dict] = None) -> dict:
+        """Usage per tenant; queue: the scheduler's per-tenant queued/running counts."""
+        queue = queue or {}
+        tenants = {}
+        for tenant in set(self._tenants) | set(queue):
+            state = self._tenants.get(tenant)
+            entry = {"weight": self.weight(tenant)}
+            if state is not None:
+                bucket = state.bucket
+                if bucket.rate > 0:
+                    bucket._refill()
+                entry.update({
+                    "requests": state.requests,
+                    "throttled": state.throttled,
+                    "audio_seconds": round(state.audio_seconds, 1),
+                    "codec_tokens": int(state.audio_seconds * config.CODEC_FRAME_RATE),
+                    "quota": {
+                        "rate": bucket.rate,
+                        "burst": bucket.burst,
+                        "available": round(bucket.tokens, 1),
+                    } if bucket.rate > 0 else None,
+                })
+            entry.update(queue.get(tenant, {}))
+            tenants[self.label(tenant)] = entry
+        return {"header": self.header, "tenants": tenants}
+
+
+def retry_after_header(e: QuotaExceeded) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+
+
+# Global tenant registry
+tenant_registry = TenantRegistry()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Text Chunker Test Script
+Checks chunk sizes and separators of text_chunker.chunk_text (python -m pytest test_text_chunker.py)
+"""
+
+from text_chunker import chunk_text
+
+
+def test_long_first_sentence_without_punctuation():
+    # A short word before an unbroken run that does not fit first_size must not
+    # become a tiny first chunk
+    text = "a " + "x" * 120 + " rest of the text continues here with words"
+    chunks = chunk_text(text, target_size=150, max_size=250, min_size=20, first_size=50, unit="chars")
+    assert len(chunks[0]) >= 20, [len(c) for c in chunks]
+    assert all(len(c) <= 250 for c in chunks)
+    assert " ".join(chunks) == text
+
+    text = " ".join(["w"] + ["y" * 30] * 20)
+    chunks = chunk_text(text, target_size=60, max_size=100, min_size=10, first_size=20, unit="chars")
+    assert len(chunks[0]) >= 10, [len(c) for c in chunks]
+    assert " ".join(chunks) == text
+
+
+def test_hard_cut_keeps_text():
+    text = "가" * 1000
+    chunks = chunk_text(text, target_size=150, max_size=250, min_size=20, first_size=50, unit="chars")
+    assert [len(c) for c in chunks] == [50, 100, 150, 150, 150, 150, 150, 100]
+    assert "".join(chunks) == text
+
+
+def test_separators_are_preserved():
+    chunks = chunk_text("안녕하세요.반갑습니다. 오늘 날씨가 좋네요!\n내일도 좋겠죠?",
+                        target_size=15, first_size=10, min_size=0, unit="chars")
+    assert chunks == ["안녕하세요.", "반갑습니다.", "오늘 날씨가 좋네요!", "내일도 좋겠죠?"]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"[OK] {name}")
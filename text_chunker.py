@@ -0,0 +1,199 @@
+# coding=utf-8
+# Qwen3-TTS Text Chunker
+#
+# Splits input text into sentences (Korean/English/Chinese/Japanese) and packs
+# them into synthesis chunks with a character or estimated-token budget, so
+# batches are balanced and streaming chunks have an even size.
+
+import re
+from typing import List, Optional, Tuple
+
+import config
+
+# Sentence boundaries:
+# - ASCII terminators (optionally followed by a closing quote/bracket) + whitespace
+# - ASCII terminators directly followed by Hangul ("안녕하세요.반갑습니다")
+# - Full-width CJK terminators (no whitespace required)
+# - Line breaks
+_SENTENCE_BOUNDARY_RE = re.compile(
+    r'(?<=[.!?…])\s+'
+    r'|(?<=[.!?…]["\'”’)\]])\s+'
+    r'|(?<=[.!?…])(?=[가-힣])'
+    r'|(?<=[。！？])\s*'
+    r'|\s*\n\s*'
+)
+
+# Clause boundaries used to break up sentences that exceed the chunk budget
+_CLAUSE_BOUNDARY_RE = re.compile(r'(?<=[,;:，、；：])\s*')
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# Hangul, CJK ideographs, Hiragana/Katakana: roughly one token per character
+_CJK_CHAR_RE = re.compile(r'[ᄀ-ᇿ぀-ヿ㐀-䶿一-鿿가-힣]')
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of text tokens (CJK ~1/char, other scripts ~1/4 chars)."""
+    cjk = len(_CJK_CHAR_RE.findall(text))
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
+
+
+def text_cost(text: str, unit: Optional[str] = None) -> int:
+    """Size of a text in the configured budget unit ("chars" or "tokens")."""
+    unit = unit or config.CHUNK_BUDGET_UNIT
+    if unit == "tokens":
+        return estimate_tokens(text)
+    return len(text)
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into sentences, keeping the terminating punctuation."""
+    sentences = [s.strip() for s in _SENTENCE_BOUNDARY_RE.split(text)]
+    sentences = [s for s in sentences if s]
+
+    # If no split occurred (no sentence endings), return original text
+    if len(sentences) == 0 and text.strip():
+        sentences = [text.strip()]
+    return sentences
+
+
+def _split_units(pattern: "re.Pattern", text: str) -> List[Tuple[str, str]]:
+    """
+    Split text at pattern into (piece, separator) units; the separator is what goes
+    before the piece when units are joined again: " " where the source had
+    whitespace, "" where it had none (CJK punctuation, "안녕하세요.반갑습니다").
+    """
+    units = []
+    sep = ""
+    pos = 0
+    bounds = [(m.start(), m.end()) for m in pattern.finditer(text)] + [(len(text), len(text))]
+    for end, next_start in bounds:
+        piece = text[pos:end]
+        stripped = piece.strip()
+        if stripped:
+            if piece[0].isspace():
+                sep = " "
+            units.append((stripped, sep if units else ""))
+            sep = " " if piece[-1].isspace() else ""
+        elif piece:
+            sep = " "
+        if next_start > end:
+            # Boundaries only consume whitespace
+            sep = " "
+        pos = next_start
+    return units
+
+
+def _split_oversized(sentence: Tuple[str, str], max_size: int, unit: str,
+                     cut_size: Optional[int] = None) -> List[Tuple[str, str]]:
+    """
+    Break a sentence larger than max_size at clause, then word, then hard boundaries
+    (unbroken runs are cut into pieces of cut_size, default max_size).
+    """
+    text, sep = sentence
+    cut_size = min(cut_size or max_size, max_size)
+    if text_cost(text, unit) <= max_size:
+        return [sentence]
+
+    pieces = []
+    for clause, clause_sep in _split_units(_CLAUSE_BOUNDARY_RE, text):
+        if text_cost(clause, unit) <= max_size:
+            pieces.append((clause, clause_sep))
+            continue
+        # Fall back to word boundaries, and to a hard cut for unbroken CJK runs
+        for j, (word, word_sep) in enumerate(_split_units(_WHITESPACE_RE, clause)):
+            if j == 0:
+                word_sep = clause_sep
+            while text_cost(word, unit) > cut_size:
+                cut = cut_size if unit == "chars" else max(1, len(word) * cut_size // text_cost(word, unit))
+                pieces.append((word[:cut], word_sep))
+                word, word_sep = word[cut:], ""  # Rejoined without a space
+            if word:
+                pieces.append((word, word_sep))
+
+    # The first piece is joined to what came before the sentence
+    pieces[0] = (pieces[0][0], sep)
+    return pieces
+
+
+def _join(a: Tuple[str, str], b: Tuple[str, str]) -> Tuple[str, str]:
+    return a[0] + b[1] + b[0], a[1]
+
+
+def _pack(units: List[Tuple[str, str]], limit: int, unit: str) -> List[Tuple[str, str]]:
+    """Greedily join units (with their original separators) until adding another would pass limit."""
+    chunks = []
+    for u in units:
+        if chunks and text_cost(_join(chunks[-1], u)[0], unit) <= limit:
+            chunks[-1] = _join(chunks[-1], u)
+        else:
+            chunks.append(u)
+    return chunks
+
+
+def chunk_text(
+    text: str,
+    target_size: Optional[int] = None,
+    max_size: Optional[int] = None,
+    min_size: Optional[int] = None,
+    first_size: Optional[int] = None,
+    unit: Optional[str] = None,
+) -> List[str]:
+    """
+    Pack sentences into synthesis chunks of roughly equal size.
+
+    - target_size: preferred chunk size (sentences, or the pieces of a longer sentence,
+      are joined up to this size)
+    - max_size: hard upper bound (longer sentences are split at clauses/words)
+    - min_size: chunks smaller than this are merged into a neighbour when possible
+    - first_size: budget for the first chunk, kept short to minimize time-to-first-audio
+      (a first chunk below min_size may exceed it to join the next chunk)
+    - unit: "chars" or "tokens" (estimated)
+
+    Units are rejoined with the whitespace they had in the text (none between CJK
+    sentences or inside a hard-cut word), since added spaces are read as pauses.
+    Defaults come from config.CHUNK_*.
+    """
+    unit = unit or config.CHUNK_BUDGET_UNIT
+    target_size = target_size or config.CHUNK_TARGET_SIZE
+    max_size = max(max_size or config.CHUNK_MAX_SIZE, target_size)
+    min_size = config.CHUNK_MIN_SIZE if min_size is None else min_size
+    first_size = first_size or config.CHUNK_FIRST_SIZE
+
+    units = []
+    for sentence in _split_units(_SENTENCE_BOUNDARY_RE, text):
+        units.extend(_split_oversized(sentence, max_size, unit, target_size))
+    if not units:
+        return []
+
+    # First chunk: the leading sentence (or its leading clauses) within first_size; a
+    # leading sentence below min_size takes the following ones that still fit
+    first_units = _pack(_split_oversized(units[0], first_size, unit), first_size, unit)
+    first = first_units[0]
+    rest = first_units[1:] + units[1:]
+    while rest and text_cost(first[0], unit) < min_size \
+            and text_cost(_join(first, rest[0])[0], unit) <= first_size:
+        first = _join(first, rest.pop(0))
+
+    chunks = [first] + _pack(rest, target_size, unit)
+    # A first chunk still below min_size (the next unit did not fit first_size, e.g. a
+    # short leftover before a long unbroken run) joins the next chunk
+    if len(chunks) > 1 and text_cost(first[0], unit) < min_size:
+        candidate = _join(first, chunks[1])
+        if text_cost(candidate[0], unit) <= max_size:
+            chunks[:2] = [candidate]
+
+    # Merge undersized chunks into a neighbour (never into the first chunk, which is
+    # short on purpose) as long as the result stays within max_size: a small chunk
+    # joins the previous one, a small previous chunk takes the next one
+    merged = [chunks[0]]
+    for chunk in chunks[1:]:
+        if len(merged) > 1 and (text_cost(chunk[0], unit) < min_size or text_cost(merged[-1][0], unit) < min_size):
+            candidate = _join(merged[-1], chunk)
+            if text_cost(candidate[0], unit) <= max_size:
+                merged[-1] = candidate
+                continue
+        merged.append(chunk)
+
+    return [c for c, _ in merged]
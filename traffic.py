@@ -0,0 +1,85 @@
+# coding=utf-8
+# Qwen3-TTS Traffic Recorder
+#
+# Opt-in (TTS_TRAFFIC_RECORD=path): every TTS request is appended to a JSONL
+# trace as its shape - arrival time, endpoint, model size, per-item text length
+# and sentence count, voice digest and generation parameters. Text itself is
+# only kept with TTS_TRAFFIC_RECORD_TEXT=true. replay_traffic.py re-issues a
+# trace against a server and compares latency distributions between runs.
+
+import json
+import time
+from typing import Optional
+
+import config
+from models import voice_digest
+from text_chunker import split_sentences
+
+
+class TrafficRecorder:
+    """Appends request shapes to a JSONL file (used from the event loop only)."""
+
+    def __init__(self, path: str = None, record_text: bool = None):
+        self.path = config.TRAFFIC_RECORD_PATH if path is None else path
+        self.record_text = config.TRAFFIC_RECORD_TEXT if record_text is None else record_text
+        self.recorded = 0
+        self._file = None
+        if self.path:
+            try:
+                self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+                print(f"[Traffic] Recording request shapes to {self.path}")
+            except OSError as e:
+                print(f"[Traffic] Recording disabled: {e}")
+
+    @property
+    def enabled(self) -> bool:
+        return self._file is not None
+
+    def record(self, endpoint: str, request, model_size: str, tenant: Optional[str] = None, **options):
+        """Log one request (request: VoiceCloneRequest; options: endpoint flags such as response_format)."""
+        if self._file is None:
+            return
+        texts = [request.text] if isinstance(request.text, str) else list(request.text)
+        entry = {
+            "t": round(time.time(), 3),
+            "endpoint": endpoint,
+            "model_size": model_size,
+            "batch": not isinstance(request.text, str),
+            "items": [{"chars": len(t), "sentences": len(split_sentences(t))} for t in texts],
+            "language": request.language,
+            "voice": voice_digest(request.ref_audio),
+            "ref_text_chars": len(request.ref_text) if isinstance(request.ref_text, str)
+            else [len(t) for t in request.ref_text],
+            "x_vector_only_mode": request.x_vector_only_mode,
+            "split_sentences": request.split_sentences,
+            "seed": request.seed,
+            "sample_rate": request.sample_rate,
+            "priority": request.priority,
+            "deadline_ms": request.deadline_ms,
+            "trim_silence": request.trim_silence,
+            "pause_ms": request.pause_ms,
+            "generation_params": request.generation_params.model_dump() if request.generation_params else None,
+            "tenant": tenant,
+            "options": options,
+        }
+        if self.record_text:
+            entry["text"] = request.text
+            entry["ref_text"] = request.ref_text
+        try:
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.recorded += 1
+        except OSError as e:
+            print(f"[Traffic] Recording stopped: {e}")
+            self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def get_stats(self) -> dict:
+        return {"enabled": self.enabled, "path": self.path or None, "recorded": self.recorded}
+
+
+# Global recorder (inactive unless TTS_TRAFFIC_RECORD is set)
+traffic_recorder = TrafficRecorder()
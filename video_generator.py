@@ -3,16 +3,128 @@
 # Uses NewAvata's video-based precomputed avatar system
 # https://github.com/mindvridge/NewAvata
 
-import os
+import asyncio
+import base64
 import time
 import uuid
-import requests
+import httpx
 from pathlib import Path
 from typing import Optional, Dict, List, Any
 
 import config
 
 
+class MetadataCache:
+    """
+    Refresh-ahead TTL cache for NewAvata metadata (avatars, TTS engines, status).
+
+    - age < refresh_ahead * ttl: cached value
+    - refresh_ahead * ttl <= age < ttl + max_stale: cached value, refreshed in the background
+    - no value / older than ttl + max_stale: fetched inline
+
+    Concurrent misses share one fetch. Failed fetches are not cached; the
+    previous value stays in place until a refresh succeeds.
+    """
+
+    def __init__(self, refresh_ahead: float = None, max_stale: float = None):
+        self.refresh_ahead = config.NEWAVATA_REFRESH_AHEAD if refresh_ahead is None else refresh_ahead
+        self.max_stale = config.NEWAVATA_MAX_STALE if max_stale is None else max_stale
+        self._entries: Dict[str, Dict[str, Any]] = {}  # key -> {"value", "fetched_at"}
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._generations: Dict[str, int] = {}  # key -> invalidation count
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refresh_errors = 0
+
+    async def _refresh(self, key: str, fetch) -> Any:
+        generation = self._generations.get(key, 0)
+        try:
+            value = await fetch()
+        except Exception:
+            self.refresh_errors += 1
+            raise
+        # A fetch that started before invalidate() must not write its value back
+        if self._generations.get(key, 0) == generation:
+            self._entries[key] = {"value": value, "fetched_at": time.time()}
+        return value
+
+    def _start_refresh(self, key: str, fetch) -> asyncio.Task:
+        task = self._refreshing.get(key)
+        if task is None or task.done():
+            task = asyncio.create_task(self._refresh(key, fetch))
+            task.add_done_callback(lambda t: self._on_refresh_done(key, t))
+            self._refreshing[key] = task
+        return task
+
+    def _on_refresh_done(self, key: str, task: asyncio.Task):
+        if self._refreshing.get(key) is task:
+            del self._refreshing[key]
+        if not task.cancelled() and task.exception() is not None:
+            print(f"[VideoGenerator] Metadata refresh failed ({key}): {task.exception()}")
+
+    async def get(self, key: str, fetch, ttl: float) -> Any:
+        """Cached value of key; fetch() is an async callable that raises on failure."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.time() - entry["fetched_at"]
+            if age < ttl * self.refresh_ahead:
+                self.hits += 1
+                return entry["value"]
+            if age < ttl + self.max_stale:
+                if age < ttl:
+                    self.hits += 1
+                else:
+                    self.stale_hits += 1
+                self._start_refresh(key, fetch)
+                return entry["value"]
+
+        self.misses += 1
+        # shield: a cancelled caller must not cancel the fetch shared with others
+        return await asyncio.shield(self._start_refresh(key, fetch))
+
+    def invalidate(self, key: Optional[str] = None) -> List[str]:
+        """Drop one entry (or all); the next call fetches inline. Returns the dropped keys."""
+        keys = list(self._entries) if key is None else [k for k in self._entries if k == key]
+        for k in keys:
+            del self._entries[k]
+        # In-flight refreshes are detached (callers already waiting still get their result)
+        for k in set(keys) | (set(self._refreshing) if key is None else {key}):
+            self._generations[k] = self._generations.get(k, 0) + 1
+            self._refreshing.pop(k, None)
+        return keys
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "entries": {k: round(now - e["fetched_at"], 1) for k, e in self._entries.items()},  # key -> age (s)
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refresh_errors": self.refresh_errors,
+        }
+
+
+def probe_newavata(api_url: str) -> bool:
+    """Blocking /api/availability check; only logs problems (generation fails later if NewAvata is down)."""
+    try:
+        # Check if NewAvata API is available
+        response = httpx.get(f"{api_url}/api/availability", timeout=5)
+        if response.status_code == 200:
+            data = response.json()
+            print(f"[VideoGenerator] NewAvata API is available")
+            print(f"  Status: {data}")
+        else:
+            print(f"[VideoGenerator] Warning: NewAvata API returned {response.status_code}")
+    except httpx.ConnectError:
+        print(f"[VideoGenerator] Warning: NewAvata API not reachable at {api_url}")
+        print(f"[VideoGenerator] Make sure NewAvata server is running:")
+        print(f"  cd NewAvata/realtime-interview-avatar && bash run_server.sh")
+    except Exception as e:
+        print(f"[VideoGenerator] Warning: API check failed: {e}")
+    return True  # Still allow initialization
+
+
 class VideoGenerator:
     """
     NewAvata 립싱크 비디오 생성 래퍼 클래스.
@@ -22,6 +134,10 @@ class VideoGenerator:
     - 텍스트 → TTS → 오디오 → 립싱크 → 비디오
 
     API 모드에서는 NewAvata 서버의 /api/generate 또는 /api/record 엔드포인트를 호출합니다.
+    모든 호출은 공유 keep-alive 커넥션 풀(httpx.AsyncClient)을 사용하며,
+    NewAvata로의 동시 렌더링/다운로드 수는 NEWAVATA_MAX_CONCURRENCY로 제한됩니다
+    (메타데이터 조회는 이 제한을 거치지 않아 긴 렌더링 뒤에 줄 서지 않습니다).
+    아바타/TTS 엔진 목록과 시스템 상태는 MetadataCache에 캐시되며 백그라운드에서 갱신됩니다.
     """
 
     def __init__(self):
@@ -31,6 +147,13 @@ class VideoGenerator:
         self.output_dir = Path(config.VIDEO_OUTPUT_DIR)
         self.output_dir.mkdir(parents=True, exist_ok=True)
 
+        # Created lazily inside the running event loop
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.metadata_cache = MetadataCache()
+        # /dev/shm audio ring for co-located NewAvata (see shm_audio.py)
+        self.audio_ring = None
+
         if self.use_api:
             self._init_api_mode()
         else:
@@ -40,32 +163,86 @@ class VideoGenerator:
             )
 
     def _init_api_mode(self):
-        """Initialize API mode - verify NewAvata service."""
+        """Initialize API mode - verify NewAvata service (one-off blocking probe at startup)."""
         print(f"[VideoGenerator] Using NewAvata API mode: {self.api_url}")
+        self.newavata_available = probe_newavata(self.api_url)
 
-        try:
-            # Check if NewAvata API is available
-            response = requests.get(f"{self.api_url}/api/availability", timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                print(f"[VideoGenerator] NewAvata API is available")
-                print(f"  Status: {data}")
-                self.newavata_available = True
+        if config.NEWAVATA_SHM_AUDIO:
+            from shm_audio import ShmAudioRing, is_local_url
+            if not is_local_url(self.api_url):
+                print(f"[VideoGenerator] NEWAVATA_SHM_AUDIO ignored: {self.api_url} is not on this host")
             else:
-                print(f"[VideoGenerator] Warning: NewAvata API returned {response.status_code}")
-                self.newavata_available = True  # Still allow initialization
-        except requests.exceptions.ConnectionError:
-            print(f"[VideoGenerator] Warning: NewAvata API not reachable at {self.api_url}")
-            print(f"[VideoGenerator] Make sure NewAvata server is running:")
-            print(f"  cd NewAvata/realtime-interview-avatar && bash run_server.sh")
-            self.newavata_available = True  # Allow initialization, will fail on generate
-        except Exception as e:
-            print(f"[VideoGenerator] Warning: API check failed: {e}")
-            self.newavata_available = True
+                try:
+                    self.audio_ring = ShmAudioRing()
+                except OSError as e:
+                    print(f"[VideoGenerator] Shared-memory audio disabled: {e}")
+
+    # ============== HTTP client ==============
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.api_url,
+                limits=httpx.Limits(
+                    max_connections=config.NEWAVATA_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.NEWAVATA_MAX_CONNECTIONS,
+                ),
+                timeout=httpx.Timeout(config.NEWAVATA_METADATA_TIMEOUT, connect=config.NEWAVATA_CONNECT_TIMEOUT),
+            )
+            self._semaphore = asyncio.Semaphore(config.NEWAVATA_MAX_CONCURRENCY)
+        return self._client
+
+    async def _request(self, method: str, path: str, timeout: float, limited: bool = True,
+                       **kwargs) -> httpx.Response:
+        """
+        Send a request to NewAvata through the shared pool.
 
-    def list_avatars(self) -> List[Dict[str, Any]]:
+        GET requests are idempotent and retried with exponential backoff on
+        connection errors, timeouts and 5xx responses; other methods are sent once.
+        limited: wait for a NEWAVATA_MAX_CONCURRENCY slot (renders); metadata GETs
+        skip it so they never queue behind minutes-long /api/record calls.
+        """
+        client = self._get_client()
+        request_timeout = httpx.Timeout(timeout, connect=config.NEWAVATA_CONNECT_TIMEOUT)
+        attempts = 1 + (config.NEWAVATA_GET_RETRIES if method == "GET" else 0)
+
+        for attempt in range(attempts):
+            try:
+                if limited:
+                    async with self._semaphore:
+                        response = await client.request(method, path, timeout=request_timeout, **kwargs)
+                else:
+                    response = await client.request(method, path, timeout=request_timeout, **kwargs)
+                if response.status_code < 500 or attempt == attempts - 1:
+                    return response
+                print(f"[VideoGenerator] {method} {path} returned {response.status_code}, retrying...")
+            except (httpx.ConnectError, httpx.TimeoutException) as e:
+                if attempt == attempts - 1:
+                    raise
+                print(f"[VideoGenerator] {method} {path} failed ({type(e).__name__}), retrying...")
+            await asyncio.sleep(config.NEWAVATA_RETRY_BACKOFF * (2 ** attempt))
+
+    async def aclose(self):
+        """Close pooled connections (call on server shutdown)."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self.audio_ring is not None:
+            self.audio_ring.close()
+            self.audio_ring = None
+
+    # ============== NewAvata API ==============
+
+    async def _fetch_json(self, path: str) -> Any:
+        """GET a metadata endpoint; raises on non-200 so failures are never cached."""
+        response = await self._request("GET", path, timeout=config.NEWAVATA_METADATA_TIMEOUT, limited=False)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}")
+        return response.json()
+
+    async def list_avatars(self) -> List[Dict[str, Any]]:
         """
-        사용 가능한 아바타 목록 조회.
+        사용 가능한 아바타 목록 조회 (캐시, NEWAVATA_CATALOG_TTL).
 
         Returns:
             아바타 정보 리스트 (name, path, preview 등)
@@ -74,19 +251,16 @@ class VideoGenerator:
             return []
 
         try:
-            response = requests.get(f"{self.api_url}/api/avatars", timeout=10)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"[VideoGenerator] Failed to get avatars: {response.status_code}")
-                return []
+            return await self.metadata_cache.get(
+                "avatars", lambda: self._fetch_json("/api/avatars"), config.NEWAVATA_CATALOG_TTL
+            )
         except Exception as e:
             print(f"[VideoGenerator] Error getting avatars: {e}")
             return []
 
-    def list_tts_engines(self) -> List[Dict[str, Any]]:
+    async def list_tts_engines(self) -> List[Dict[str, Any]]:
         """
-        사용 가능한 TTS 엔진 목록 조회.
+        사용 가능한 TTS 엔진 목록 조회 (캐시, NEWAVATA_CATALOG_TTL).
 
         Returns:
             TTS 엔진 정보 리스트
@@ -95,28 +269,27 @@ class VideoGenerator:
             return []
 
         try:
-            response = requests.get(f"{self.api_url}/api/tts_engines", timeout=10)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                return []
+            return await self.metadata_cache.get(
+                "tts_engines", lambda: self._fetch_json("/api/tts_engines"), config.NEWAVATA_CATALOG_TTL
+            )
         except Exception as e:
             print(f"[VideoGenerator] Error getting TTS engines: {e}")
             return []
 
-    def generate(
+    async def generate(
         self,
         text: str,
         avatar_path: str = "auto",
         tts_engine: str = "qwen3tts",
         tts_voice: str = "default",
         quality: str = "medium",
-        timeout: int = 300
+        timeout: float = None
     ) -> Dict[str, Any]:
         """
         립싱크 비디오 생성 (녹화 모드).
 
-        NewAvata의 /api/record 엔드포인트를 사용하여 동기적으로 비디오를 생성합니다.
+        NewAvata의 /api/record 엔드포인트를 사용하여 비디오를 생성합니다.
+        응답을 기다리는 동안 이벤트 루프를 블로킹하지 않습니다.
 
         Args:
             text: 생성할 텍스트
@@ -124,7 +297,7 @@ class VideoGenerator:
             tts_engine: TTS 엔진 (qwen3tts, cosyvoice, elevenlabs)
             tts_voice: TTS 음성
             quality: 품질 설정 (low, medium, high)
-            timeout: 타임아웃 (초)
+            timeout: 타임아웃 (초, 기본값 NEWAVATA_RECORD_TIMEOUT)
 
         Returns:
             생성 결과 딕셔너리 (success, video_url, audio_url, duration 등)
@@ -132,6 +305,7 @@ class VideoGenerator:
         if not self.newavata_available:
             raise RuntimeError("NewAvata is not available")
 
+        timeout = timeout or config.NEWAVATA_RECORD_TIMEOUT
         t0 = time.time()
         session_id = str(uuid.uuid4())[:8]
 
@@ -153,11 +327,7 @@ class VideoGenerator:
                 "output_format": "mp4"
             }
 
-            response = requests.post(
-                f"{self.api_url}/api/record",
-                json=payload,
-                timeout=timeout
-            )
+            response = await self._request("POST", "/api/record", timeout=timeout, json=payload)
 
             if response.status_code != 200:
                 error_msg = response.text[:500] if response.text else "Unknown error"
@@ -174,12 +344,12 @@ class VideoGenerator:
 
             return result
 
-        except requests.exceptions.ConnectionError:
+        except httpx.ConnectError:
             return {
                 "success": False,
                 "error": f"Cannot connect to NewAvata API at {self.api_url}"
             }
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             return {
                 "success": False,
                 "error": f"NewAvata API request timed out (>{timeout}s)"
@@ -190,7 +360,103 @@ class VideoGenerator:
                 "error": str(e)
             }
 
-    def generate_async(
+    async def generate_from_audio(
+        self,
+        text: str,
+        audio_wav: Optional[bytes] = None,
+        avatar_path: str = "auto",
+        quality: str = "medium",
+        timeout: float = None,
+        audio_handle: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        외부 오디오로 립싱크 비디오 생성.
+
+        이 서버에서 합성한 WAV를 NewAvata의 외부 오디오 경로
+        (tts_engine="external", audio_data=base64)로 전달하므로
+        NewAvata가 TTS 서버를 다시 호출하지 않습니다.
+        audio_handle이 주어지면 WAV 대신 공유 메모리(/dev/shm) PCM 핸들만
+        전달합니다 (audio_format="pcm_s16le", audio_shm=handle).
+
+        Args:
+            text: 오디오에 해당하는 텍스트
+            audio_wav: WAV 바이트
+            audio_handle: ShmAudioRing.write()가 반환한 핸들 (audio_wav 대신)
+            avatar_path: 아바타 경로 또는 "auto"
+            quality: 품질 설정
+            timeout: 타임아웃 (초, 기본값 NEWAVATA_RECORD_TIMEOUT)
+
+        Returns:
+            생성 결과 딕셔너리 (success, video_url 등)
+        """
+        if not self.newavata_available:
+            raise RuntimeError("NewAvata is not available")
+
+        timeout = timeout or config.NEWAVATA_RECORD_TIMEOUT
+        session_id = str(uuid.uuid4())[:8]
+
+        try:
+            payload = {
+                "text": text,
+                "avatar_path": avatar_path,
+                "tts_engine": "external",
+                "quality": quality,
+                "sid": session_id,
+                "output_format": "mp4"
+            }
+            if audio_handle is not None:
+                payload["audio_format"] = audio_handle["format"]
+                payload["audio_shm"] = audio_handle
+            else:
+                payload["audio_format"] = "wav"
+                payload["audio_data"] = base64.b64encode(audio_wav).decode("ascii")
+
+            response = await self._request("POST", "/api/record", timeout=timeout, json=payload)
+
+            if response.status_code != 200:
+                error_msg = response.text[:500] if response.text else "Unknown error"
+                return {
+                    "success": False,
+                    "error": f"NewAvata API error ({response.status_code}): {error_msg}"
+                }
+            return response.json()
+
+        except httpx.ConnectError:
+            return {
+                "success": False,
+                "error": f"Cannot connect to NewAvata API at {self.api_url}"
+            }
+        except httpx.TimeoutException:
+            return {
+                "success": False,
+                "error": f"NewAvata API request timed out (>{timeout}s)"
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
+
+    async def download(self, video_url: str, dest: Path, timeout: float = None) -> Path:
+        """
+        NewAvata가 생성한 비디오 파일 다운로드.
+
+        Args:
+            video_url: NewAvata 결과의 video_url (상대 경로 또는 절대 URL)
+            dest: 저장 경로
+            timeout: 타임아웃 (초, 기본값 NEWAVATA_RECORD_TIMEOUT)
+        """
+        client = self._get_client()
+        timeout = httpx.Timeout(timeout or config.NEWAVATA_RECORD_TIMEOUT, connect=config.NEWAVATA_CONNECT_TIMEOUT)
+        async with self._semaphore:
+            async with client.stream("GET", video_url, timeout=timeout) as response:
+                response.raise_for_status()
+                with open(dest, "wb") as f:
+                    async for chunk in response.aiter_bytes():
+                        f.write(chunk)
+        return dest
+
+    async def generate_async(
         self,
         text: str,
         avatar_path: str = "auto",
@@ -229,10 +495,8 @@ class VideoGenerator:
                 "sid": session_id
             }
 
-            response = requests.post(
-                f"{self.api_url}/api/generate",
-                json=payload,
-                timeout=30
+            response = await self._request(
+                "POST", "/api/generate", timeout=config.NEWAVATA_GENERATE_TIMEOUT, json=payload
             )
 
             if response.status_code != 200:
@@ -252,16 +516,23 @@ class VideoGenerator:
                 "error": str(e)
             }
 
-    def get_system_status(self) -> Dict[str, Any]:
-        """NewAvata 서버 시스템 상태 조회."""
+    async def get_system_status(self) -> Dict[str, Any]:
+        """NewAvata 서버 시스템 상태 조회 (캐시, NEWAVATA_STATUS_TTL)."""
         try:
-            response = requests.get(f"{self.api_url}/api/system_status", timeout=10)
-            if response.status_code == 200:
-                return response.json()
-            return {"error": f"Status code: {response.status_code}"}
+            return await self.metadata_cache.get(
+                "system_status", lambda: self._fetch_json("/api/system_status"), config.NEWAVATA_STATUS_TTL
+            )
         except Exception as e:
             return {"error": str(e)}
 
+    def invalidate_metadata(self, key: Optional[str] = None) -> List[str]:
+        """
+        메타데이터 캐시 무효화 (예: 새 .pkl 아바타를 사전계산한 후).
+
+        Args:
+            key: "avatars", "tts_engines", "system_status" 또는 None (전체)
+        """
+        return self.metadata_cache.invalidate(key)
 
 def check_video_support() -> bool:
     """Check if video generation is available."""
@@ -272,9 +543,9 @@ def check_video_support() -> bool:
         print("[VideoGenerator] Video requires USE_NEWAVATA_API=true")
         return False
 
+    # Probe only: a full VideoGenerator would map a shared-memory ring it never closes
     try:
-        gen = VideoGenerator()
-        return gen.newavata_available
+        return probe_newavata(config.NEWAVATA_API_URL)
     except Exception as e:
         print(f"[VideoGenerator] Not available: {e}")
         return False
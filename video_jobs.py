@@ -0,0 +1,167 @@
+# coding=utf-8
+# Asynchronous Video Job Store
+#
+# POST /video/jobs returns a job ID immediately and the video is generated in
+# a background task; GET /video/jobs/{id} reports status, progress and the
+# result URL. Identical in-flight requests (same text, avatar, voice, quality)
+# are coalesced into one job. Jobs live in a bounded in-memory store and
+# finished jobs expire after a TTL; on_evict releases what a job left on disk.
+
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import config
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+
+def job_key(params: Dict[str, Any]) -> str:
+    """Dedupe key of a video request (all generation-relevant parameters)."""
+    data = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class VideoJob:
+    """State of one background video generation."""
+
+    def __init__(self, key: str, params: Dict[str, Any]):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.params = params
+        self.status = JOB_QUEUED
+        self.progress = {"completed_segments": 0, "total_segments": None}
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.playlist_url: Optional[str] = None  # HLS jobs: available before the job finishes
+        self.requests = 1  # Including coalesced duplicates
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def in_flight(self) -> bool:
+        return self.status in (JOB_QUEUED, JOB_RUNNING)
+
+    @property
+    def result_url(self) -> Optional[str]:
+        if not self.result:
+            return None
+        if self.result.get("video_url"):
+            return self.result["video_url"]
+        urls = [u for u in self.result.get("video_urls", []) if u]
+        return urls[0] if len(urls) == 1 else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        now = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": self.progress,
+            "result_url": self.result_url,
+            "playlist_url": self.playlist_url,
+            "result": self.result,
+            "error": self.error,
+            "coalesced_requests": self.requests - 1,
+            "created_at": self.created_at,
+            "elapsed": round(now - self.created_at, 3),
+        }
+
+
+# async (job) -> result dict; may update job.progress while running
+JobRunner = Callable[[VideoJob], Awaitable[Dict[str, Any]]]
+
+
+class VideoJobStore:
+    """Bounded in-memory job table with TTL expiry and in-flight coalescing."""
+
+    def __init__(self, max_jobs: int = None, ttl: float = None,
+                 on_evict: Optional[Callable[[VideoJob], None]] = None):
+        self.max_jobs = max_jobs or config.VIDEO_JOB_MAX
+        self.ttl = ttl or config.VIDEO_JOB_TTL
+        self.on_evict = on_evict
+        self._jobs: "OrderedDict[str, VideoJob]" = OrderedDict()
+        self._in_flight: Dict[str, VideoJob] = {}
+        self.submitted = 0
+        self.coalesced = 0
+
+    def _evict(self, limit: int = None):
+        """Drop expired finished jobs, then the oldest finished jobs beyond limit (default max_jobs)."""
+        limit = self.max_jobs if limit is None else limit
+        now = time.time()
+        for job_id in [j.id for j in self._jobs.values() if not j.in_flight and now - j.finished_at > self.ttl]:
+            self._remove(job_id)
+        if len(self._jobs) > limit:
+            for job_id in [j.id for j in self._jobs.values() if not j.in_flight]:
+                if len(self._jobs) <= limit:
+                    break
+                self._remove(job_id)
+
+    def _remove(self, job_id: str):
+        job = self._jobs.pop(job_id)
+        if self.on_evict is not None:
+            try:
+                self.on_evict(job)
+            except Exception as e:
+                print(f"[VideoJobs] Cleanup of job {job_id} failed: {e}")
+
+    def get(self, job_id: str) -> Optional[VideoJob]:
+        self._evict()
+        return self._jobs.get(job_id)
+
+    def submit(self, params: Dict[str, Any], runner: JobRunner) -> VideoJob:
+        """Start a job, or attach to the identical job already in flight."""
+        # Finished jobs make room for the new one; only queued or running jobs count against the cap
+        self._evict(self.max_jobs - 1)
+        key = job_key(params)
+        existing = self._in_flight.get(key)
+        if existing is not None:
+            existing.requests += 1
+            self.coalesced += 1
+            return existing
+
+        if len(self._in_flight) >= self.max_jobs:
+            raise RuntimeError(f"Too many video jobs in flight (max {self.max_jobs})")
+
+        job = VideoJob(key, params)
+        self._jobs[job.id] = job
+        self._in_flight[key] = job
+        self.submitted += 1
+        job.task = asyncio.create_task(self._run(job, runner))
+        return job
+
+    async def _run(self, job: VideoJob, runner: JobRunner):
+        job.status = JOB_RUNNING
+        job.started_at = time.time()
+        try:
+            job.result = await runner(job)
+            if job.result.get("success", "error" not in job.result):
+                job.status = JOB_COMPLETED
+            else:
+                job.status = JOB_FAILED
+                job.error = job.result.get("error")
+        except Exception as e:
+            job.status = JOB_FAILED
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            self._in_flight.pop(job.key, None)
+            print(f"[VideoJobs] Job {job.id} {job.status} in {job.finished_at - job.created_at:.2f}s")
+
+    def get_stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "jobs": counts,
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,151 @@
+# coding=utf-8
+# Local TTS -> NewAvata Lip-sync Pipeline
+#
+# Synthesizes the text here, one sentence chunk at a time, and hands each
+# chunk's audio to NewAvata's external-audio path as soon as it is ready.
+# Lip-sync of chunk N runs on NewAvata while chunk N+1 is being synthesized,
+# instead of NewAvata calling back into this server for the whole text.
+# With a shared-memory ring (co-located NewAvata, see shm_audio.py) each
+# chunk is handed over as a PCM handle instead of a WAV file. With
+# TTS_TRIM_SILENCE, each chunk's edge silence is trimmed and replaced by the
+# sentence pause, so NewAvata renders fewer idle frames.
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import anyio
+import numpy as np
+
+import config
+from postprocess import postprocessor
+from silence import pause_after, trim_silence
+from text_chunker import chunk_text
+from video_generator import VideoGenerator
+
+# async (text) -> (wav, sample_rate)
+SynthesizeFn = Callable[[str], Awaitable[Tuple[np.ndarray, int]]]
+# async (segment_result) -> None, called as each segment finishes lip-sync
+SegmentCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class LipSyncPipeline:
+    """Pipelined local synthesis + per-chunk NewAvata lip-sync."""
+
+    def __init__(
+        self,
+        video_gen: VideoGenerator,
+        synthesize: SynthesizeFn,
+        audio_sample_rate: Optional[int] = None,
+        trim: Optional[bool] = None,
+    ):
+        self.video_gen = video_gen
+        self.synthesize = synthesize
+        self.audio_sample_rate = audio_sample_rate or config.VIDEO_AUDIO_SAMPLE_RATE
+        self.trim = config.TRIM_SILENCE if trim is None else trim
+        # ShmAudioRing owned by the video generator, if NewAvata shares this host's /dev/shm
+        self.audio_ring = getattr(video_gen, "audio_ring", None)
+
+    async def _encode(self, wav: np.ndarray, sr: int, last: bool = True) -> Tuple[Dict[str, Any], float, float]:
+        """
+        Trim (if enabled), resample to the lip-sync rate and hand over as a shared-memory
+        PCM handle, or WAV bytes without a ring (or when it is full); returns
+        (audio kwargs, duration, seconds of silence trimmed).
+        """
+        removed = 0.0
+        if self.trim:
+            (wav,), removed, _ = await anyio.to_thread.run_sync(trim_silence, [wav], sr, None, False)
+            if not last:
+                wav = pause_after(wav, sr)
+        duration = len(wav) / sr
+        if self.audio_sample_rate and self.audio_sample_rate != sr:
+            wav = (await postprocessor.resample([wav], sr, self.audio_sample_rate))[0]
+            sr = self.audio_sample_rate
+        if self.audio_ring is not None:
+            handle = self.audio_ring.write(wav, sr)
+            if handle is not None:
+                return {"audio_handle": handle}, duration, removed
+        return {"audio_wav": bytes(await postprocessor.encode_wav([wav], sr))}, duration, removed
+
+    async def _lipsync(self, index: int, text: str, audio: Dict[str, Any], duration: float, removed: float,
+                       avatar_path: str, quality: str, synth_time: float,
+                       on_segment: Optional[SegmentCallback]) -> Dict[str, Any]:
+        t0 = time.time()
+        try:
+            result = await self.video_gen.generate_from_audio(
+                text=text, avatar_path=avatar_path, quality=quality, **audio
+            )
+        finally:
+            # NewAvata has read the samples once /api/record has answered
+            if "audio_handle" in audio:
+                self.audio_ring.release(audio["audio_handle"])
+        segment = {
+            "index": index,
+            "text": text,
+            "audio_duration": round(duration, 3),
+            "silence_removed": round(removed, 3),
+            "synthesis_time": round(synth_time, 3),
+            "lipsync_time": round(time.time() - t0, 3),
+            "success": bool(result.get("success", "error" not in result)),
+            "result": result,
+        }
+        if on_segment is not None:
+            await on_segment(segment)
+        return segment
+
+    async def run(
+        self,
+        text: str,
+        avatar_path: str = "auto",
+        quality: str = "medium",
+        on_segment: Optional[SegmentCallback] = None,
+    ) -> Dict[str, Any]:
+        """
+        Generate a lip-sync video segment per text chunk.
+
+        Returns a summary with the per-segment NewAvata results in text order.
+        """
+        t0 = time.time()
+        chunks = chunk_text(text)
+        print(f"[LipSyncPipeline] {len(chunks)} chunk(s), avatar={avatar_path}, quality={quality}")
+
+        tasks: List[asyncio.Task] = []
+        handles: List[Dict[str, Any]] = []
+        try:
+            for i, chunk in enumerate(chunks):
+                t_synth = time.time()
+                wav, sr = await self.synthesize(chunk)
+                audio, duration, removed = await self._encode(wav, sr, last=i == len(chunks) - 1)
+                if "audio_handle" in audio:
+                    handles.append(audio["audio_handle"])
+                synth_time = time.time() - t_synth
+                print(f"[LipSyncPipeline] Chunk {i+1}/{len(chunks)} synthesized in {synth_time:.2f}s "
+                      f"({duration:.2f}s audio), sending to NewAvata")
+
+                # Lip-sync runs in the background while the next chunk is synthesized
+                tasks.append(asyncio.create_task(
+                    self._lipsync(i, chunk, audio, duration, removed, avatar_path, quality, synth_time, on_segment)
+                ))
+
+            segments = list(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            # Tasks cancelled before they started never release their segments
+            for handle in handles:
+                self.audio_ring.release(handle)
+            raise
+
+        total_time = time.time() - t0
+        success = all(s["success"] for s in segments) and len(segments) > 0
+        print(f"[LipSyncPipeline] Done in {total_time:.2f}s (success={success})")
+
+        return {
+            "success": success,
+            "segment_count": len(segments),
+            "video_urls": [s["result"].get("video_url") for s in segments],
+            "audio_duration": round(sum(s["audio_duration"] for s in segments), 3),
+            "silence_removed": round(sum(s["silence_removed"] for s in segments), 3),
+            "total_time": round(total_time, 3),
+            "segments": segments,
+        }